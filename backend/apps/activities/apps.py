@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class ActivitiesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.activities'
-    verbose_name = '活动记录'
\ No newline at end of file
+    verbose_name = '活动记录'
+
+    def ready(self):
+        import apps.activities.signals
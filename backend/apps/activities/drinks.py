@@ -0,0 +1,96 @@
+import hashlib
+import logging
+from types import MappingProxyType
+
+import redis
+from django.conf import settings
+
+from wellness_hub.lru import TTLCache
+from wellness_hub.redis_client import get_redis
+from .models import DrinkOption
+
+logger = logging.getLogger(__name__)
+
+DRINK_FIELDS = ('id', 'name', 'amount', 'icon', 'caffeine_mg', 'is_default')
+DEFAULTS = 'default'
+
+
+def _freeze(rows):
+    return tuple(MappingProxyType(row) for row in rows)
+
+
+class DrinkCatalog:
+    """
+    Drink options served from memory.
+
+    The default catalog (seeded by migration) and each user's custom drinks are
+    cached per process as immutable tuples, together with the version they were
+    loaded at. Versions live in Redis under ``<prefix><user id>`` and
+    ``<prefix>default`` and are bumped whenever an option changes, so a request
+    costs one Redis round trip and other workers reload on their next request.
+    Entries also expire after ``ttl`` seconds. Without Redis, options are read
+    from the database.
+    """
+
+    def __init__(self, maxsize, ttl, prefix='drinks:version:'):
+        self.prefix = prefix
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    @property
+    def redis(self):
+        return get_redis()
+
+    def _versions(self, user_id):
+        try:
+            versions = self.redis.mget(self.prefix + DEFAULTS, f'{self.prefix}{user_id}')
+        except redis.RedisError:
+            logger.exception('Could not read drink catalog versions')
+            return None
+        return tuple(version or '0' for version in versions)
+
+    def _load(self, scope, version, queryset):
+        entry = self._cache.get(scope)
+        if version is None or entry is None or entry[0] != version:
+            entry = (version, _freeze(queryset.order_by('name').values(*DRINK_FIELDS)))
+            if version is not None:
+                self._cache.set(scope, entry)
+        return entry[1]
+
+    def options(self, user_id):
+        """Return ``(etag, options)``: defaults first, then the user's drinks, each by name."""
+        versions = self._versions(user_id)
+        defaults_version, user_version = versions or (None, None)
+        defaults = self._load(DEFAULTS, defaults_version, DrinkOption.objects.filter(user__isnull=True, is_default=True))
+        custom = self._load(user_id, user_version, DrinkOption.objects.filter(user_id=user_id))
+        options = defaults + custom
+        if versions is None:
+            tag = hashlib.md5(repr([tuple(option.values()) for option in options]).encode()).hexdigest()
+        else:
+            tag = f'{user_id}-{defaults_version}-{user_version}'
+        return f'W/"drinks-{tag}"', options
+
+    def lookup(self, user_id):
+        """Return ``{id: option}`` for every drink visible to the user."""
+        return {option['id']: option for option in self.options(user_id)[1]}
+
+    def get(self, user_id, drink_id):
+        try:
+            drink_id = int(drink_id)
+        except (TypeError, ValueError):
+            return None
+        return self.lookup(user_id).get(drink_id)
+
+    def invalidate(self, user_id=None):
+        """Bump the version of a user's drinks, or of the defaults when ``user_id`` is None."""
+        scope = DEFAULTS if user_id is None else user_id
+        self._cache.delete(scope)
+        try:
+            self.redis.incr(f'{self.prefix}{scope}')
+        except redis.RedisError:
+            logger.exception('Could not bump drink catalog version')
+
+
+drink_catalog = DrinkCatalog(
+    maxsize=settings.DRINK_CACHE_SIZE,
+    ttl=settings.DRINK_CACHE_TTL,
+)
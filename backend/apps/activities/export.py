@@ -0,0 +1,73 @@
+import json
+from datetime import datetime
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Activity, BowelMovement, SlackRecord, SmokingRecord, WaterIntake
+from .serializers import (
+    ActivitySerializer, BowelMovementSerializer, SlackRecordSerializer, SmokingRecordSerializer,
+    WaterIntakeSerializer
+)
+
+# Rows fetched per database round trip, and lines handed to the server per chunk.
+EXPORT_CHUNK_SIZE = 2000
+
+# Exportable record type -> (model, serializer rendering it, time field).
+EXPORT_TYPES = {
+    'activities': (Activity, ActivitySerializer, 'created_at'),
+    'water': (WaterIntake, WaterIntakeSerializer, 'recorded_at'),
+    'bowel': (BowelMovement, BowelMovementSerializer, 'recorded_at'),
+    'smoking': (SmokingRecord, SmokingRecordSerializer, 'recorded_at'),
+    'slack': (SlackRecord, SlackRecordSerializer, 'recorded_at'),
+}
+
+
+def record_fields(serializer_class):
+    """Model fields a record serializer renders; ``user_name`` is filled in from the request."""
+    return [field for field in serializer_class.Meta.fields if field != 'user_name']
+
+
+def format_row(row, user_name):
+    """Render a ``.values()`` row like the model serializers would, without touching ``row.user``."""
+    data = {
+        key: timezone.localtime(value).isoformat() if isinstance(value, datetime) else value
+        for key, value in row.items()
+    }
+    data['user_name'] = user_name
+    return data
+
+
+def format_rows(rows, user_name):
+    return [format_row(row, user_name) for row in rows]
+
+
+def ndjson_lines(rows, user_name):
+    for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield json.dumps(format_row(row, user_name), ensure_ascii=False) + '\n'
+
+
+async def _aiter_chunks(lines):
+    # Under ASGI Django buffers a sync iterator in full before sending it, so hand the
+    # server an async iterator that pulls one chunk of lines per thread hop instead.
+    read_chunk = sync_to_async(lambda: ''.join(islice(lines, EXPORT_CHUNK_SIZE)))
+    while chunk := await read_chunk():
+        yield chunk
+
+
+def ndjson_response(request, rows, user_name, filename):
+    """
+    Stream a ``.values()`` queryset as newline-delimited JSON.
+
+    Rows are read with a server-side cursor in chunks, so memory stays flat
+    regardless of how many records the user has.
+    """
+    content = ndjson_lines(rows, user_name)
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        content = _aiter_chunks(content)
+    response = StreamingHttpResponse(content, content_type='application/x-ndjson; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.ndjson"'
+    return response
@@ -0,0 +1,119 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .drinks import drink_catalog
+from .models import BowelMovement, IngestedRecord, SlackRecord, SmokingRecord, WaterIntake
+from .rollup import record_created
+from .serializers import BowelMovementSerializer, SlackRecordSerializer, SmokingRecordSerializer, WaterIntakeSerializer
+
+# Record types accepted by batch ingestion.
+RECORD_TYPES = {
+    'water': (WaterIntake, WaterIntakeSerializer),
+    'bowel': (BowelMovement, BowelMovementSerializer),
+    'smoking': (SmokingRecord, SmokingRecordSerializer),
+    'slack': (SlackRecord, SlackRecordSerializer),
+}
+
+MAX_KEY_LENGTH = IngestedRecord._meta.get_field('key').max_length
+
+
+def apply_drink(data, drink):
+    """Fill a water intake payload from the chosen drink option (or mark it custom)."""
+    if drink is not None:
+        data['drink_name'] = drink['name']
+        data['drink_icon'] = drink['icon']
+        data['caffeine_mg'] = drink['caffeine_mg']
+        if not data.get('amount'):
+            data['amount'] = drink['amount']
+    elif not data.get('drink_name'):
+        data['drink_name'] = '自定义饮品'
+    return data
+
+
+def _invalid(key, errors):
+    return {'key': key, 'status': 'invalid', 'errors': errors}
+
+
+def ingest(user, items, retry=True):
+    """
+    Create a mixed batch of records for ``user``.
+
+    Each item is ``{"key": <client idempotency key>, "type": <RECORD_TYPES key>,
+    "data": <the fields the single-record create endpoint takes>}``. Valid new
+    items are written with one ``bulk_create`` per type in a single transaction;
+    keys already ingested (earlier in this batch or in a previous one) are
+    reported as duplicates with the id of the record they created. Returns one
+    result per item, in order.
+    """
+    results = [None] * len(items)
+    first_seen = {}
+    repeats = {}
+    for index, item in enumerate(items):
+        key = item.get('key') if isinstance(item, dict) else None
+        if not isinstance(key, str) or not 0 < len(key) <= MAX_KEY_LENGTH:
+            results[index] = _invalid(key, {'key': [f'key 必须是 1-{MAX_KEY_LENGTH} 个字符的字符串']})
+        elif item.get('type') not in RECORD_TYPES:
+            results[index] = _invalid(key, {'type': ['不支持的记录类型']})
+        elif key in first_seen:
+            repeats[index] = first_seen[key]
+        else:
+            first_seen[key] = index
+
+    ingested = IngestedRecord.objects.filter(user=user, key__in=list(first_seen)) \
+        .values_list('key', 'record_type', 'record_id')
+    for key, record_type, record_id in ingested:
+        results[first_seen[key]] = {'key': key, 'status': 'duplicate', 'type': record_type, 'id': record_id}
+
+    pending = [index for index in first_seen.values() if results[index] is None]
+    drinks = drink_catalog.lookup(user.id) if any(items[index]['type'] == 'water' for index in pending) else {}
+    now = timezone.now().isoformat()
+    new_records = defaultdict(list)
+    for index in pending:
+        item = items[index]
+        key, record_type, data = item['key'], item['type'], item.get('data')
+        if not isinstance(data, dict):
+            results[index] = _invalid(key, {'data': ['data 必须是对象']})
+            continue
+        data = dict(data)
+        if record_type == 'water':
+            drink_id = data.get('drink_id')
+            drink = drinks.get(int(drink_id)) if str(drink_id).isdigit() else None
+            if drink_id and drink is None:
+                results[index] = _invalid(key, {'drink_id': ['饮品不存在']})
+                continue
+            apply_drink(data, drink)
+        data.setdefault('recorded_at', now)
+
+        model, serializer_class = RECORD_TYPES[record_type]
+        serializer = serializer_class(data=data)
+        if not serializer.is_valid():
+            results[index] = _invalid(key, serializer.errors)
+            continue
+        new_records[record_type].append((index, model(user=user, **serializer.validated_data)))
+
+    try:
+        with transaction.atomic():
+            created = []
+            for record_type, entries in new_records.items():
+                model = RECORD_TYPES[record_type][0]
+                model.objects.bulk_create([record for _, record in entries])
+                created.extend((index, record_type, record) for index, record in entries)
+            # A concurrent replay of the same keys fails here and rolls the records back.
+            IngestedRecord.objects.bulk_create([
+                IngestedRecord(user=user, key=items[index]['key'], record_type=record_type, record_id=record.pk)
+                for index, record_type, record in created
+            ])
+            record_created(*(record for _, _, record in created))
+    except IntegrityError:
+        if not retry:
+            raise
+        return ingest(user, items, retry=False)
+
+    for index, record_type, record in created:
+        results[index] = {'key': items[index]['key'], 'status': 'created', 'type': record_type, 'id': record.pk}
+    for index, first in repeats.items():
+        results[index] = dict(results[first], status='duplicate') if results[first]['status'] != 'invalid' \
+            else results[first]
+    return results
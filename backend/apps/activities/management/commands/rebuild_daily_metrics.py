@@ -0,0 +1,23 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.activities.rollup import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute DailyUserMetrics from the raw activity records.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Only rebuild this user id (repeatable)')
+        parser.add_argument('--since', help='Only rebuild days from this date on (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since 参数格式应为 YYYY-MM-DD')
+        rows = rebuild(user_ids=options['users'], since=since)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} daily metric rows'))
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0002_slackrecord'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user', 'created_at'], name='activities_user_id_3c9068_idx'),
+        ),
+    ]
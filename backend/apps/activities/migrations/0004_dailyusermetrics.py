@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('activities', '0003_activity_user_created_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUserMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='日期')),
+                ('water_ml', models.IntegerField(default=0, verbose_name='饮水量(ml)')),
+                ('caffeine_mg', models.IntegerField(default=0, verbose_name='咖啡因(mg)')),
+                ('smoking_count', models.IntegerField(default=0, verbose_name='抽烟数量')),
+                ('slack_minutes', models.IntegerField(default=0, verbose_name='摸鱼时长(分钟)')),
+                ('bowel_events', models.IntegerField(default=0, verbose_name='排便次数')),
+                ('activity_count', models.IntegerField(default=0, verbose_name='活动次数')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_metrics', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': '每日汇总',
+                'verbose_name_plural': '每日汇总',
+                'db_table': 'daily_user_metrics',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyusermetrics',
+            constraint=models.UniqueConstraint(fields=('user', 'day'), name='daily_user_metrics_user_day'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('activities', '0004_dailyusermetrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestedRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, verbose_name='幂等键')),
+                ('record_type', models.CharField(max_length=20, verbose_name='记录类型')),
+                ('record_id', models.BigIntegerField(verbose_name='记录ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingested_records', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': '批量导入记录',
+                'verbose_name_plural': '批量导入记录',
+                'db_table': 'ingested_records',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='ingestedrecord',
+            constraint=models.UniqueConstraint(fields=('user', 'key'), name='ingested_records_user_key'),
+        ),
+    ]
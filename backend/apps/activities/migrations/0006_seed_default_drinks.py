@@ -0,0 +1,41 @@
+from django.db import migrations
+
+DEFAULT_DRINKS = [
+    {'name': '纯净水 300ml', 'amount': 300, 'icon': 'mdi-cup-water'},
+    {'name': '绿茶 350ml', 'amount': 350, 'icon': 'mdi-tea'},
+    {'name': '美式咖啡 240ml', 'amount': 240, 'icon': 'mdi-coffee', 'caffeine_mg': 120},
+    {'name': '能量饮料 250ml', 'amount': 250, 'icon': 'mdi-flash'},
+    {'name': '牛奶 250ml', 'amount': 250, 'icon': 'mdi-cow'},
+]
+
+
+def seed_default_drinks(apps, schema_editor):
+    DrinkOption = apps.get_model('activities', 'DrinkOption')
+    # Concurrent first requests used to seed the defaults more than once; keep the oldest copy.
+    seen = set()
+    for option in DrinkOption.objects.filter(user__isnull=True).order_by('id'):
+        if option.name in seen:
+            option.delete()
+        seen.add(option.name)
+
+    if DrinkOption.objects.filter(is_default=True).exists():
+        return
+    for option in DEFAULT_DRINKS:
+        DrinkOption.objects.create(
+            name=option['name'],
+            amount=option.get('amount', 300),
+            icon=option.get('icon'),
+            caffeine_mg=option.get('caffeine_mg'),
+            is_default=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0005_ingestedrecord'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_default_drinks, migrations.RunPython.noop),
+    ]
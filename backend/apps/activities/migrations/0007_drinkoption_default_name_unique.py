@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0006_seed_default_drinks'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='drinkoption',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('user__isnull', True)),
+                fields=('name',),
+                name='drink_options_default_name'
+            ),
+        ),
+    ]
@@ -0,0 +1,52 @@
+from collections import Counter, defaultdict
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+# Model -> (time field, {metric: summed field, or None to count rows}), as in apps.activities.rollup.
+ROLLUP_SOURCES = {
+    'WaterIntake': ('recorded_at', {'water_ml': 'amount', 'caffeine_mg': 'caffeine_mg'}),
+    'SmokingRecord': ('recorded_at', {'smoking_count': 'count'}),
+    'SlackRecord': ('recorded_at', {'slack_minutes': 'duration'}),
+    'BowelMovement': ('recorded_at', {'bowel_events': None}),
+    'Activity': ('created_at', {'activity_count': None}),
+}
+
+
+def backfill_daily_user_metrics(apps, schema_editor):
+    """Fill DailyUserMetrics from the records that predate it; rows written since are recomputed too."""
+    DailyUserMetrics = apps.get_model('activities', 'DailyUserMetrics')
+    tz = ZoneInfo(settings.TIME_ZONE)
+    totals = defaultdict(Counter)
+    for model_name, (time_field, metrics) in ROLLUP_SOURCES.items():
+        model = apps.get_model('activities', model_name)
+        aggregates = {
+            metric: Sum(Coalesce(field, Value(0))) if field else Count('id')
+            for metric, field in metrics.items()
+        }
+        rows = model.objects.annotate(day=TruncDate(time_field, tzinfo=tz)) \
+            .values('user_id', 'day') \
+            .annotate(**aggregates) \
+            .order_by()
+        for row in rows.iterator():
+            totals[row['user_id'], row['day']].update({metric: row[metric] or 0 for metric in metrics})
+
+    DailyUserMetrics.objects.all().delete()
+    DailyUserMetrics.objects.bulk_create(
+        [DailyUserMetrics(user_id=user_id, day=day, **values) for (user_id, day), values in totals.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0007_drinkoption_default_name_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_daily_user_metrics, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,24 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 
-class Activity(models.Model):
+class RolledUpRecord:
+    """
+    Mixin for records summed into DailyUserMetrics.
+
+    Saves run in a transaction with the rollup update made by apps.activities.signals,
+    so rollup.rebuild never sees a record without its increment; callers need no
+    transaction of their own. Deletes already send post_delete inside theirs.
+    """
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class Activity(RolledUpRecord, models.Model):
     """Activity tracking model."""
     CATEGORY_CHOICES = [
         ('water', '饮水记录'),
@@ -37,6 +51,7 @@ class Activity(models.Model):
         indexes = [
             models.Index(fields=['user', 'category']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['user', 'created_at']),
         ]
 
     def __str__(self):
@@ -65,12 +80,20 @@ class DrinkOption(models.Model):
         verbose_name = "饮品选项"
         verbose_name_plural = "饮品选项"
         unique_together = ('user', 'name')
+        constraints = [
+            # unique_together does not cover defaults, whose user is NULL.
+            models.UniqueConstraint(
+                fields=['name'],
+                condition=models.Q(user__isnull=True),
+                name='drink_options_default_name'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class WaterIntake(models.Model):
+class WaterIntake(RolledUpRecord, models.Model):
     """Water intake tracking."""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='water_intakes')
     amount = models.IntegerField(verbose_name="饮水量(ml)")
@@ -93,7 +116,7 @@ class WaterIntake(models.Model):
         return f"{self.user.username} - {self.amount}ml"
 
 
-class BowelMovement(models.Model):
+class BowelMovement(RolledUpRecord, models.Model):
     """Bowel movement tracking."""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bowel_movements')
     type = models.CharField(
@@ -141,7 +164,7 @@ class BowelMovement(models.Model):
         return f"{self.user.username} - {self.get_type_display()}"
 
 
-class SmokingRecord(models.Model):
+class SmokingRecord(RolledUpRecord, models.Model):
     """Smoking tracking."""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='smoking_records')
     count = models.IntegerField(default=1, verbose_name="数量")
@@ -175,7 +198,7 @@ class SmokingRecord(models.Model):
         return f"{self.user.username} - {self.count}支"
 
 
-class SlackRecord(models.Model):
+class SlackRecord(RolledUpRecord, models.Model):
     """Slack (摸鱼) tracking."""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='slack_records')
     duration = models.IntegerField(verbose_name="摸鱼时长(分钟)")
@@ -206,3 +229,46 @@ class SlackRecord(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.duration}分钟"
+
+
+class DailyUserMetrics(models.Model):
+    """Per-user totals for one local day, maintained by apps.activities.rollup."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_metrics')
+    day = models.DateField(verbose_name="日期")
+    water_ml = models.IntegerField(default=0, verbose_name="饮水量(ml)")
+    caffeine_mg = models.IntegerField(default=0, verbose_name="咖啡因(mg)")
+    smoking_count = models.IntegerField(default=0, verbose_name="抽烟数量")
+    slack_minutes = models.IntegerField(default=0, verbose_name="摸鱼时长(分钟)")
+    bowel_events = models.IntegerField(default=0, verbose_name="排便次数")
+    activity_count = models.IntegerField(default=0, verbose_name="活动次数")
+
+    class Meta:
+        db_table = 'daily_user_metrics'
+        verbose_name = "每日汇总"
+        verbose_name_plural = "每日汇总"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='daily_user_metrics_user_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.day}"
+
+
+class IngestedRecord(models.Model):
+    """Client idempotency key of a record created through batch ingestion."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ingested_records')
+    key = models.CharField(max_length=64, verbose_name="幂等键")
+    record_type = models.CharField(max_length=20, verbose_name="记录类型")
+    record_id = models.BigIntegerField(verbose_name="记录ID")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+
+    class Meta:
+        db_table = 'ingested_records'
+        verbose_name = "批量导入记录"
+        verbose_name_plural = "批量导入记录"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='ingested_records_user_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.key}"
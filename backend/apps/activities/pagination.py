@@ -0,0 +1,95 @@
+from datetime import datetime, time as dt_time
+from urllib.parse import urlencode
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ParseError
+
+
+def parse_bound(value, name):
+    """Parse a ``start``/``end`` query value: an ISO date (local midnight) or datetime."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ParseError(f'{name} 应为 YYYY-MM-DD 或 ISO 时间')
+        moment = datetime.combine(day, dt_time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def filter_time_range(queryset, request, field):
+    """Apply ``?start=`` (inclusive) and ``?end=`` (exclusive) to ``field``."""
+    return filter_bounds(queryset, field, request.GET.get('start'), request.GET.get('end'))
+
+
+def filter_bounds(queryset, field, start=None, end=None):
+    """Filter ``field`` to ``[start, end)``, both raw ``parse_bound`` values and optional."""
+    if start:
+        queryset = queryset.filter(**{f'{field}__gte': parse_bound(start, 'start')})
+    if end:
+        queryset = queryset.filter(**{f'{field}__lt': parse_bound(end, 'end')})
+    return queryset
+
+
+class RecordKeysetPagination:
+    """
+    Keyset pagination over a user's records on ``(field, id)``, newest first.
+
+    Pages are requested with ``?limit=`` and continued with the opaque ``cursor``
+    returned as ``next``; combined with a ``user`` filter every page is a range
+    scan on the ``(user, field)`` index no matter how far back it goes.
+    """
+
+    default_limit = 50
+    max_limit = 500
+
+    def __init__(self, field):
+        self.field = field
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.GET.get('limit', self.default_limit))
+        except ValueError:
+            raise ParseError('limit 必须是整数')
+        return max(1, min(limit, self.max_limit))
+
+    def decode_cursor(self, cursor):
+        moment, _, record_id = cursor.rpartition('_')
+        moment = parse_datetime(moment)
+        if moment is None or not record_id.isdigit():
+            raise ParseError('cursor 无效')
+        return moment, int(record_id)
+
+    def encode_cursor(self, row):
+        return f"{row[self.field].isoformat()}_{row['id']}"
+
+    def paginate_queryset(self, queryset, request):
+        """Return one page of ``queryset`` (a ``.values()`` queryset including ``field`` and ``id``)."""
+        self.request = request
+        self.limit = self.get_limit(request)
+        cursor = request.GET.get('cursor')
+        if cursor:
+            moment, record_id = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__lt': moment}) | Q(**{self.field: moment, 'id__lt': record_id})
+            )
+        page = list(queryset.order_by(f'-{self.field}', '-id')[:self.limit + 1])
+        self.has_more = len(page) > self.limit
+        self.page = page[:self.limit]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_more:
+            return None
+        params = {key: value for key, value in self.request.GET.items() if key in ('start', 'end')}
+        params.update(cursor=self.encode_cursor(self.page[-1]), limit=self.limit)
+        return f'?{urlencode(params)}'
+
+    def get_paginated_data(self, results):
+        return {
+            'results': results,
+            'next': self.get_next_link(),
+        }
@@ -0,0 +1,157 @@
+from collections import Counter, defaultdict
+from datetime import datetime, time as dt_time
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from wellness_hub.cache import cache_service
+from .models import Activity, BowelMovement, DailyUserMetrics, SlackRecord, SmokingRecord, WaterIntake
+
+# Source model -> (time field, {metric: summed field, or None to count rows}).
+ROLLUP_SOURCES = {
+    WaterIntake: ('recorded_at', {'water_ml': 'amount', 'caffeine_mg': 'caffeine_mg'}),
+    SmokingRecord: ('recorded_at', {'smoking_count': 'count'}),
+    SlackRecord: ('recorded_at', {'slack_minutes': 'duration'}),
+    BowelMovement: ('recorded_at', {'bowel_events': None}),
+    Activity: ('created_at', {'activity_count': None}),
+}
+
+METRICS = [metric for _, metrics in ROLLUP_SOURCES.values() for metric in metrics]
+
+
+def cache_namespace(user_id):
+    """Cache namespace of the views reading a user's rollup rows."""
+    return f'activities:user:{user_id}'
+
+
+def invalidate_cached_views(user_ids):
+    namespaces = [cache_namespace(user_id) for user_id in set(user_ids)]
+    if namespaces:
+        transaction.on_commit(lambda: cache_service.invalidate(*namespaces))
+
+
+def local_day(moment):
+    """The day ``moment`` falls on in TIME_ZONE (Asia/Shanghai)."""
+    return timezone.localtime(moment, timezone.get_default_timezone()).date()
+
+
+def record_deltas(records, sign=1):
+    """Group the metric changes caused by adding (or with ``sign=-1`` removing) ``records``."""
+    deltas = defaultdict(Counter)
+    for record in records:
+        time_field, metrics = ROLLUP_SOURCES[type(record)]
+        key = (record.user_id, local_day(getattr(record, time_field)))
+        for metric, field in metrics.items():
+            amount = (getattr(record, field) or 0) if field else 1
+            deltas[key][metric] += sign * amount
+    return deltas
+
+
+def apply_deltas(deltas):
+    """Add grouped metric changes to the rollup rows, creating missing rows."""
+    with transaction.atomic():
+        # Rows are touched in (user, day) order, as rebuild locks them, to avoid deadlocks.
+        for (user_id, day), changes in sorted(deltas.items()):
+            changes = {metric: amount for metric, amount in changes.items() if amount}
+            if not changes:
+                continue
+            rows = DailyUserMetrics.objects.filter(user_id=user_id, day=day)
+            increments = {metric: F(metric) + amount for metric, amount in changes.items()}
+            if rows.update(**increments):
+                continue
+            try:
+                with transaction.atomic():
+                    DailyUserMetrics.objects.create(user_id=user_id, day=day, **changes)
+            except IntegrityError:
+                # Another request created the row first.
+                rows.update(**increments)
+        invalidate_cached_views(user_id for user_id, _ in deltas)
+
+
+def record_created(*records):
+    apply_deltas(record_deltas(records))
+
+
+def record_deleted(*records):
+    apply_deltas(record_deltas(records, sign=-1))
+
+
+def record_changed(previous, current):
+    """Move an edited record's contribution from its stored version to its new one."""
+    deltas = record_deltas([previous], sign=-1)
+    for key, changes in record_deltas([current]).items():
+        deltas[key].update(changes)
+    apply_deltas(deltas)
+
+
+def rollup_fields(model):
+    """Field names whose change alters a record's contribution to the rollup."""
+    time_field, metrics = ROLLUP_SOURCES[model]
+    return {'user', 'user_id', time_field, *(field for field in metrics.values() if field)}
+
+
+def aggregate_totals(user_ids=None, start=None):
+    """Sum the raw records per (user, day); ``start`` is an aware datetime."""
+    tz = timezone.get_default_timezone()
+    totals = defaultdict(Counter)
+    for model, (time_field, metrics) in ROLLUP_SOURCES.items():
+        queryset = model.objects.all()
+        if user_ids is not None:
+            queryset = queryset.filter(user_id__in=user_ids)
+        if start is not None:
+            queryset = queryset.filter(**{f'{time_field}__gte': start})
+        aggregates = {
+            metric: Sum(Coalesce(field, Value(0))) if field else Count('id')
+            for metric, field in metrics.items()
+        }
+        rows = queryset.annotate(day=TruncDate(time_field, tzinfo=tz)) \
+            .values('user_id', 'day') \
+            .annotate(**aggregates) \
+            .order_by()
+        for row in rows.iterator():
+            totals[row['user_id'], row['day']].update({metric: row[metric] or 0 for metric in metrics})
+    return totals
+
+
+def rebuild(user_ids=None, since=None):
+    """
+    Recompute rollup rows from the raw records.
+
+    ``user_ids`` limits the rebuild to some users and ``since`` (a date) to days
+    from then on. Returns the number of rows written.
+
+    The rows in range are locked before the records are read and overwritten in
+    place, so a record saved meanwhile is either counted by the totals or has
+    its increment applied on top of them once the rebuild commits.
+    """
+    tz = timezone.get_default_timezone()
+    start = timezone.make_aware(datetime.combine(since, dt_time.min), tz) if since else None
+
+    with transaction.atomic():
+        rows = DailyUserMetrics.objects.all()
+        if user_ids is not None:
+            rows = rows.filter(user_id__in=user_ids)
+        if since is not None:
+            rows = rows.filter(day__gte=since)
+        existing = {
+            (user_id, day): pk
+            for pk, user_id, day in rows.select_for_update().order_by('user_id', 'day')
+            .values_list('id', 'user_id', 'day')
+        }
+        totals = aggregate_totals(user_ids, start)
+
+        DailyUserMetrics.objects.bulk_create(
+            [
+                DailyUserMetrics(user_id=user_id, day=day, **{metric: values[metric] for metric in METRICS})
+                for (user_id, day), values in sorted(totals.items())
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['user', 'day'],
+            update_fields=METRICS,
+        )
+        DailyUserMetrics.objects.filter(id__in=[pk for key, pk in existing.items() if key not in totals]).delete()
+        invalidate_cached_views({user_id for user_id, _ in existing} | {user_id for user_id, _ in totals})
+    return len(totals)
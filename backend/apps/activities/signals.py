@@ -0,0 +1,44 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from .drinks import drink_catalog
+from .models import DrinkOption
+from .rollup import ROLLUP_SOURCES, record_changed, record_created, record_deleted, rollup_fields
+
+
+def remember_rolled_up_values(sender, instance, update_fields=None, **kwargs):
+    """Load the stored version of an edited record so its old contribution can be taken back."""
+    if instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not rollup_fields(sender) & set(update_fields):
+        return
+    instance._rollup_previous = sender.objects.filter(pk=instance.pk).first()
+
+
+def keep_rollup_current(sender, instance, created=False, **kwargs):
+    """Fold new and edited records into DailyUserMetrics. QuerySet.update() bypasses this; rebuild after bulk fixes."""
+    if created:
+        record_created(instance)
+        return
+    previous = instance.__dict__.pop('_rollup_previous', None)
+    if previous is not None:
+        record_changed(previous, instance)
+
+
+def drop_from_rollup(sender, instance, **kwargs):
+    record_deleted(instance)
+
+
+for model in ROLLUP_SOURCES:
+    pre_save.connect(remember_rolled_up_values, sender=model, dispatch_uid=f'rollup_pre_save_{model.__name__}')
+    post_save.connect(keep_rollup_current, sender=model, dispatch_uid=f'rollup_save_{model.__name__}')
+    post_delete.connect(drop_from_rollup, sender=model, dispatch_uid=f'rollup_delete_{model.__name__}')
+
+
+def refresh_drink_catalog(sender, instance, **kwargs):
+    """Bump the catalog version once the change is visible to other workers."""
+    user_id = instance.user_id
+    transaction.on_commit(lambda: drink_catalog.invalidate(user_id))
+
+
+post_save.connect(refresh_drink_catalog, sender=DrinkOption, dispatch_uid='drink_catalog_save')
+post_delete.connect(refresh_drink_catalog, sender=DrinkOption, dispatch_uid='drink_catalog_delete')
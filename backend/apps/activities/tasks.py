@@ -0,0 +1,55 @@
+import tempfile
+from datetime import date, timedelta
+
+from celery import shared_task
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .export import EXPORT_TYPES, ndjson_lines, record_fields
+from .pagination import filter_bounds
+from .rollup import rebuild
+
+User = get_user_model()
+
+
+@shared_task(idempotency_key='{user_ids}:{since}:{days}', idempotency_ttl=5 * 60)
+def rebuild_daily_metrics(user_ids=None, since=None, days=None):
+    """
+    Recompute DailyUserMetrics rows (see rollup.rebuild).
+
+    ``since`` is an ISO date; ``days`` instead rebuilds the last that many days.
+    """
+    if days:
+        since = timezone.localdate() - timedelta(days=days - 1)
+    elif since:
+        since = date.fromisoformat(since)
+    return rebuild(user_ids=user_ids, since=since)
+
+
+@shared_task(idempotency_key='{export_id}', idempotency_ttl=24 * 60 * 60)
+def export_records(export_id, user_id, record_type, start=None, end=None):
+    """
+    Write the user's records of one type to ``exports/<user id>/<export id>.ndjson`` in storage.
+
+    ``start`` / ``end`` take the same values as the list endpoints. Returns the
+    owner, the file URL and the number of records written.
+    """
+    model, serializer_class, time_field = EXPORT_TYPES[record_type]
+    user_name = User.objects.filter(id=user_id).values_list('username', flat=True).first()
+    rows = filter_bounds(model.objects.filter(user_id=user_id), time_field, start, end) \
+        .values(*record_fields(serializer_class)) \
+        .order_by(f'-{time_field}', '-id')
+
+    count = 0
+    with tempfile.TemporaryFile() as spool:
+        for line in ndjson_lines(rows, user_name):
+            spool.write(line.encode())
+            count += 1
+        spool.seek(0)
+        path = f'exports/{user_id}/{export_id}.ndjson'
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        path = default_storage.save(path, File(spool))
+    return {'user_id': user_id, 'url': default_storage.url(path), 'count': count}
@@ -0,0 +1,358 @@
+import importlib
+import json
+from datetime import timedelta
+from unittest import mock
+from urllib.parse import parse_qsl
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import InterfaceError, OperationalError
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from wellness_hub.redis_client import get_redis
+from . import export
+from .drinks import drink_catalog
+from .models import DailyUserMetrics, DrinkOption, IngestedRecord, SmokingRecord, WaterIntake
+from .rollup import local_day, rebuild
+from .tasks import export_records, rebuild_daily_metrics
+
+User = get_user_model()
+
+
+class DailyRollupTests(TestCase):
+    """DailyUserMetrics follows record creates, edits and deletes, and rebuilds in place."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='rollup', password='x')
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.today = local_day(self.now)
+
+    def metrics(self, day=None):
+        row = DailyUserMetrics.objects.filter(user=self.user, day=day or self.today).first()
+        return (row.water_ml, row.caffeine_mg, row.smoking_count) if row else None
+
+    def test_create_edit_and_delete(self):
+        water = WaterIntake.objects.create(user=self.user, amount=300, caffeine_mg=50, recorded_at=self.now)
+        SmokingRecord.objects.create(user=self.user, count=2, recorded_at=self.now)
+        self.assertEqual(self.metrics(), (300, 50, 2))
+
+        water.amount = 500
+        water.caffeine_mg = None
+        water.save()
+        self.assertEqual(self.metrics(), (500, 0, 2))
+
+        water.delete()
+        self.assertEqual(self.metrics(), (0, 0, 2))
+
+    def test_edit_moves_record_to_another_day(self):
+        water = WaterIntake.objects.create(user=self.user, amount=300, recorded_at=self.now)
+        water.recorded_at = self.now - timedelta(days=1)
+        water.save()
+        self.assertEqual(self.metrics(), (0, 0, 0))
+        self.assertEqual(self.metrics(local_day(water.recorded_at)), (300, 0, 0))
+
+    def test_unrelated_update_fields_skip_rollup(self):
+        water = WaterIntake.objects.create(user=self.user, amount=300, recorded_at=self.now)
+        water.drink_name = '绿茶'
+        with self.assertNumQueries(3):  # savepoint, update, release
+            water.save(update_fields=['drink_name'])
+        self.assertEqual(self.metrics(), (300, 0, 0))
+
+    def test_rebuild_overwrites_drifted_rows(self):
+        WaterIntake.objects.create(user=self.user, amount=300, recorded_at=self.now)
+        yesterday = self.today - timedelta(days=1)
+        DailyUserMetrics.objects.filter(user=self.user, day=self.today).update(water_ml=1)
+        DailyUserMetrics.objects.create(user=self.user, day=yesterday, water_ml=99)
+        self.assertEqual(rebuild(user_ids=[self.user.id]), 1)
+        self.assertEqual(self.metrics(), (300, 0, 0))
+        self.assertIsNone(self.metrics(yesterday))
+
+    def test_backfill_migration(self):
+        WaterIntake.objects.create(user=self.user, amount=300, recorded_at=self.now)
+        SmokingRecord.objects.create(user=self.user, count=4, recorded_at=self.now - timedelta(days=3))
+        DailyUserMetrics.objects.all().delete()
+        migration = importlib.import_module('apps.activities.migrations.0008_backfill_daily_user_metrics')
+        migration.backfill_daily_user_metrics(apps, None)
+        self.assertEqual(self.metrics(), (300, 0, 0))
+        self.assertEqual(self.metrics(self.today - timedelta(days=3)), (0, 0, 4))
+
+
+class RebuildDailyMetricsTaskTests(TestCase):
+    """rebuild_daily_metrics under eager Celery: retries and idempotency keys."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='metrics', password='x')
+
+    def setUp(self):
+        get_redis().flushall()
+
+    def test_rebuilds_rollup(self):
+        WaterIntake.objects.create(user=self.user, amount=250, recorded_at=timezone.now())
+        DailyUserMetrics.objects.all().delete()
+        self.assertEqual(rebuild_daily_metrics.delay(days=1).get(), 1)
+        self.assertEqual(DailyUserMetrics.objects.get(user=self.user).water_ml, 250)
+
+    def test_retries_transient_database_errors(self):
+        with mock.patch('apps.activities.tasks.rebuild', side_effect=[OperationalError('gone'), 3]) as rebuild:
+            self.assertEqual(rebuild_daily_metrics.delay(days=2).get(), 3)
+        self.assertEqual(rebuild.call_count, 2)
+
+    def test_gives_up_after_max_retries(self):
+        with mock.patch('apps.activities.tasks.rebuild', side_effect=OperationalError('gone')) as rebuild:
+            with self.assertRaises(OperationalError):
+                rebuild_daily_metrics.delay(days=2)
+        self.assertEqual(rebuild.call_count, rebuild_daily_metrics.max_retries + 1)
+        self.assertIsNone(get_redis().get('celery:once:apps.activities.tasks.rebuild_daily_metrics:None:None:2'))
+
+    def test_duplicate_runs_are_skipped(self):
+        with mock.patch('apps.activities.tasks.rebuild', return_value=1) as rebuild:
+            self.assertEqual(rebuild_daily_metrics.delay(days=2).get(), 1)
+            self.assertIsNone(rebuild_daily_metrics.delay(days=2).get())
+            self.assertEqual(rebuild_daily_metrics.delay(days=3).get(), 1)
+        self.assertEqual(rebuild.call_count, 2)
+
+    def test_failed_run_releases_its_key(self):
+        with mock.patch('apps.activities.tasks.rebuild', side_effect=[ValueError('bad'), 1]) as rebuild:
+            with self.assertRaises(ValueError):
+                rebuild_daily_metrics.delay(days=2)
+            self.assertEqual(rebuild_daily_metrics.delay(days=2).get(), 1)
+        self.assertEqual(rebuild.call_count, 2)
+
+
+class RecordListTests(TestCase):
+    """Record lists: keyset pages, time ranges, bad parameters and the NDJSON stream."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lister', password='x')
+        other = User.objects.create_user(username='bystander', password='x')
+        cls.start = timezone.now().replace(microsecond=0) - timedelta(days=3)
+        # Two records per day so pages have to break ties on id.
+        cls.records = [
+            WaterIntake.objects.create(user=cls.user, amount=100 + n, recorded_at=cls.start + timedelta(days=n // 2))
+            for n in range(6)
+        ]
+        WaterIntake.objects.create(user=other, amount=999, recorded_at=cls.start)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def amounts(self, data):
+        return [row['amount'] for row in data['results']]
+
+    def test_cursor_walks_every_record_once(self):
+        seen, params = [], {'limit': 4}
+        while True:
+            response = self.client.get('/api/activities/water/', params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            seen += self.amounts(data)
+            if not data['next']:
+                break
+            params = dict(parse_qsl(data['next'][1:]))
+        self.assertEqual(seen, [105, 104, 103, 102, 101, 100])
+        self.assertEqual(data['results'][0]['user_name'], 'lister')
+
+    def test_time_range_is_kept_across_pages(self):
+        start = (self.start + timedelta(days=1)).isoformat()
+        data = self.client.get('/api/activities/water/', {'start': start, 'limit': 1}).json()
+        self.assertEqual(self.amounts(data), [105])
+        self.assertIn('start=', data['next'])
+        end = (self.start + timedelta(days=2)).isoformat()
+        data = self.client.get('/api/activities/water/', {'start': start, 'end': end}).json()
+        self.assertEqual(self.amounts(data), [103, 102])
+        self.assertIsNone(data['next'])
+
+    def test_bad_parameters_answer_400(self):
+        for params in ({'cursor': 'nonsense'}, {'limit': 'all'}, {'start': 'yesterday'}):
+            self.assertEqual(self.client.get('/api/activities/water/', params).status_code, 400)
+
+    def test_ndjson_export_streams_the_range(self):
+        response = self.client.get('/api/activities/water/', {
+            'export': 'ndjson', 'end': (self.start + timedelta(days=1)).isoformat(), 'limit': 1,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['amount'] for row in rows], [101, 100])
+
+    def test_activity_list_pages_on_created_at(self):
+        for action in ('start', 'stop'):
+            self.client.post('/api/activities/create/', {'category': 'water', 'action': action}, format='json')
+        data = self.client.get('/api/activities/', {'limit': 1}).json()
+        self.assertEqual(len(data['results']), 1)
+        data = self.client.get('/api/activities/', dict(parse_qsl(data['next'][1:]))).json()
+        self.assertEqual(len(data['results']), 1)
+        self.assertIsNone(data['next'])
+
+
+class IngestRecordsTests(TestCase):
+    """Batch ingestion replays a stored result for any idempotency key it has seen."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='syncer', password='x')
+
+    def setUp(self):
+        get_redis().flushall()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.batch = [
+            {'key': 'water-1', 'type': 'water', 'data': {'amount': 250}},
+            {'key': 'smoke-1', 'type': 'smoking', 'data': {'count': 2}},
+        ]
+
+    def post(self, records):
+        response = self.client.post('/api/activities/batch/', {'records': records}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_duplicate_keys_replay_the_stored_result(self):
+        first = self.post(self.batch)
+        self.assertEqual((first['created'], first['duplicate']), (2, 0))
+
+        second = self.post(self.batch)
+        self.assertEqual((second['created'], second['duplicate']), (0, 2))
+        self.assertEqual(
+            [(result['key'], result['type'], result['id']) for result in second['results']],
+            [(result['key'], result['type'], result['id']) for result in first['results']],
+        )
+        self.assertEqual(WaterIntake.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(SmokingRecord.objects.filter(user=self.user).count(), 1)
+
+    def test_repeats_within_a_batch_and_invalid_items(self):
+        data = self.post(self.batch[:1] + [
+            self.batch[0],
+            {'key': 'bad-type', 'type': 'sleep', 'data': {}},
+            {'key': '', 'type': 'water', 'data': {'amount': 100}},
+        ])
+        statuses = [result['status'] for result in data['results']]
+        self.assertEqual(statuses, ['created', 'duplicate', 'invalid', 'invalid'])
+        self.assertEqual(data['results'][1]['id'], data['results'][0]['id'])
+        self.assertEqual(WaterIntake.objects.filter(user=self.user).count(), 1)
+
+    def test_concurrent_replay_falls_back_to_the_stored_result(self):
+        first = self.post(self.batch)
+        # The key lookup misses as if the other request had not committed yet; the insert then collides.
+        lookup = IngestedRecord.objects.filter
+        misses = [True]
+
+        def racy_lookup(**lookups):
+            return lookup(pk__in=[]) if misses and misses.pop() else lookup(**lookups)
+
+        with mock.patch.object(IngestedRecord.objects, 'filter', side_effect=racy_lookup):
+            second = self.post(self.batch)
+        self.assertEqual(second['duplicate'], 2)
+        self.assertEqual([result['id'] for result in second['results']], [result['id'] for result in first['results']])
+        self.assertEqual(WaterIntake.objects.filter(user=self.user).count(), 1)
+
+
+class ExportTaskTests(TestCase):
+    """export_records and the export endpoints, with the task run eagerly."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='exporter', password='x')
+        cls.other = User.objects.create_user(username='someone', password='x')
+        for amount in (100, 200, 300):
+            WaterIntake.objects.create(user=cls.user, amount=amount, recorded_at=timezone.now())
+        WaterIntake.objects.create(user=cls.other, amount=999, recorded_at=timezone.now())
+
+    def setUp(self):
+        get_redis().flushall()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def read_export(self, export_id, user=None):
+        with default_storage.open(f'exports/{(user or self.user).id}/{export_id}.ndjson') as handle:
+            return [json.loads(line) for line in handle.read().decode().splitlines()]
+
+    def test_export_endpoints(self):
+        response = self.client.post('/api/activities/exports/', {'type': 'water'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        export_id = response.json()['id']
+
+        status = self.client.get(f'/api/activities/exports/{export_id}/').json()
+        self.assertEqual(status['status'], 'SUCCESS')
+        self.assertEqual(status['count'], 3)
+        self.assertEqual(sorted(row['amount'] for row in self.read_export(export_id)), [100, 200, 300])
+
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(f'/api/activities/exports/{export_id}/').status_code, 404)
+
+    def test_retries_transient_errors(self):
+        lines = export.ndjson_lines
+        calls = []
+
+        def flaky(rows, user_name):
+            calls.append(user_name)
+            if len(calls) == 1:
+                raise InterfaceError('connection already closed')
+            return lines(rows, user_name)
+
+        with mock.patch('apps.activities.tasks.ndjson_lines', side_effect=flaky):
+            result = export_records.delay('retry', self.user.id, 'water').get()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(result['count'], 3)
+        self.assertEqual(len(self.read_export('retry')), 3)
+
+    def test_duplicate_export_is_skipped(self):
+        self.assertEqual(export_records.delay('once', self.user.id, 'water').get()['count'], 3)
+        with mock.patch('apps.activities.tasks.ndjson_lines') as lines:
+            self.assertIsNone(export_records.apply_async(
+                args=('once', self.user.id, 'water'), task_id='once'
+            ).get())
+        lines.assert_not_called()
+        # The skipped run's empty result is not mistaken for an export.
+        self.assertEqual(self.client.get('/api/activities/exports/once/').status_code, 404)
+
+
+class DrinkOptionsETagTests(TestCase):
+    """The drink list revalidates with its ETag and changes tag when an option changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='drinker', password='x')
+
+    def setUp(self):
+        get_redis().flushall()
+        drink_catalog._cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_matching_etag_answers_304(self):
+        response = self.client.get('/api/activities/drinks/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+        # Warm catalog: revalidation costs no queries and sends no body.
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/activities/drinks/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_changed_options_get_a_new_etag(self):
+        etag = self.client.get('/api/activities/drinks/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            DrinkOption.objects.create(user=self.user, name='美式', amount=350, caffeine_mg=150)
+        response = self.client.get('/api/activities/drinks/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('美式', [option['name'] for option in response.json()])
+
+    def test_etag_without_redis_hashes_the_options(self):
+        with mock.patch.object(drink_catalog, '_versions', return_value=None):
+            etag = self.client.get('/api/activities/drinks/')['ETag']
+            response = self.client.get('/api/activities/drinks/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
@@ -21,6 +21,13 @@ urlpatterns = [
     path('slack/', views.slack_record_list, name='slack-record-list'),
     path('slack/create/', views.create_slack_record, name='create-slack-record'),
 
+    # Batch / offline sync ingestion
+    path('batch/', views.ingest_records, name='ingest-records'),
+
+    # Deferred exports
+    path('exports/', views.create_export, name='create-export'),
+    path('exports/<str:export_id>/', views.export_status, name='export-status'),
+
     # Statistics
     path('statistics/', views.statistics, name='activity-statistics'),
 
@@ -1,48 +1,66 @@
+import uuid
+
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from django.db import models
+from celery.result import AsyncResult
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
+from wellness_hub.cache import cached_view
 from .serializers import (
     ActivitySerializer, WaterIntakeSerializer,
     BowelMovementSerializer, SmokingRecordSerializer,
     SlackRecordSerializer, DrinkOptionSerializer
 )
-from .models import Activity, WaterIntake, BowelMovement, SmokingRecord, SlackRecord, DrinkOption
-
-DEFAULT_DRINKS = [
-    {'name': '纯净水 300ml', 'amount': 300, 'icon': 'mdi-cup-water'},
-    {'name': '绿茶 350ml', 'amount': 350, 'icon': 'mdi-tea'},
-    {'name': '美式咖啡 240ml', 'amount': 240, 'icon': 'mdi-coffee', 'caffeine_mg': 120},
-    {'name': '能量饮料 250ml', 'amount': 250, 'icon': 'mdi-flash'},
-    {'name': '牛奶 250ml', 'amount': 250, 'icon': 'mdi-cow'},
-]
-
-
-def ensure_default_drinks():
-    if not DrinkOption.objects.filter(is_default=True).exists():
-        for option in DEFAULT_DRINKS:
-            DrinkOption.objects.create(
-                name=option['name'],
-                amount=option.get('amount', 300),
-                icon=option.get('icon'),
-                caffeine_mg=option.get('caffeine_mg'),
-                is_default=True
-            )
+from .models import (
+    Activity, WaterIntake, BowelMovement, SmokingRecord, SlackRecord, DrinkOption,
+    DailyUserMetrics
+)
+from .drinks import drink_catalog
+from .ingest import apply_drink, ingest
+from .export import EXPORT_TYPES, format_rows, ndjson_response, record_fields
+from .pagination import RecordKeysetPagination, filter_time_range, parse_bound
+from .tasks import export_records
 
 User = get_user_model()
 
+# Seconds the rollup-backed summaries may be cached; writes invalidate them sooner.
+SUMMARY_CACHE_TTL = 300
+
+
+def local_date_key(request):
+    # Both summaries default to "today", so a cached copy must not outlive the day.
+    return timezone.localdate()
+
+
+def record_list(request, model, serializer_class, time_field='recorded_at'):
+    """
+    List the user's records newest first.
+
+    Supports ``?start=`` / ``?end=`` on ``time_field`` and keyset pages via
+    ``?limit=`` / ``?cursor=``; ``?export=ndjson`` streams the whole range instead.
+    Rows are read with ``.values()`` and rendered without loading model instances.
+    """
+    rows = filter_time_range(model.objects.filter(user_id=request.user.id), request, time_field)
+    rows = rows.values(*record_fields(serializer_class))
+    user_name = request.user.username
+
+    if request.GET.get('export') == 'ndjson':
+        return ndjson_response(request, rows.order_by(f'-{time_field}', '-id'), user_name, model._meta.db_table)
+
+    paginator = RecordKeysetPagination(time_field)
+    page = paginator.paginate_queryset(rows, request)
+    return JsonResponse(paginator.get_paginated_data(format_rows(page, user_name)))
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def activity_list(request):
     """Get user activities."""
-    activities = Activity.objects.filter(user=request.user).order_by('-created_at')
-    serializer = ActivitySerializer(activities, many=True)
-    return JsonResponse(serializer.data, safe=False)
+    return record_list(request, Activity, ActivitySerializer, time_field='created_at')
 
 
 @api_view(['POST'])
@@ -60,11 +78,10 @@ def create_activity(request):
 @permission_classes([IsAuthenticated])
 def water_intake_list(request):
     """Get water intake records."""
-    records = WaterIntake.objects.filter(user=request.user).order_by('-recorded_at')
-    serializer = WaterIntakeSerializer(records, many=True)
-    return JsonResponse(serializer.data, safe=False)
+    return record_list(request, WaterIntake, WaterIntakeSerializer)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_view('activities:user:{user}', SUMMARY_CACHE_TTL, key=local_date_key)
 def water_summary(request):
     """Return daily totals for a given month."""
     month_param = request.GET.get('month')
@@ -75,7 +92,7 @@ def water_summary(request):
         except ValueError:
             return JsonResponse({'detail': 'month 参数格式应为 YYYY-MM'}, status=400)
     else:
-        now = timezone.now()
+        now = timezone.localtime()
         start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
 
     # compute range to end of month
@@ -84,19 +101,17 @@ def water_summary(request):
     else:
         end = start.replace(month=start.month + 1)
 
-    qs = WaterIntake.objects.filter(
-        user=request.user,
-        recorded_at__gte=start,
-        recorded_at__lt=end
-    ).annotate(date=models.functions.TruncDate('recorded_at')) \
-     .values('date') \
-     .annotate(total=models.Sum('amount')) \
-     .order_by('date')
+    qs = DailyUserMetrics.objects.filter(
+        user_id=request.user.id,
+        day__gte=start.date(),
+        day__lt=end.date(),
+        water_ml__gt=0
+    ).values('day', 'water_ml').order_by('day')
 
     data = [
         {
-            'date': item['date'].isoformat(),
-            'total': item['total']
+            'date': item['day'].isoformat(),
+            'total': item['water_ml']
         }
         for item in qs
     ]
@@ -109,25 +124,13 @@ def water_summary(request):
 def create_water_intake(request):
     """Create a water intake record."""
     data = request.data.copy()
-    drink_id = data.get('drink_id')
-    drink_name = data.get('drink_name')
-
     drink = None
+    drink_id = data.get('drink_id')
     if drink_id:
-        drink = DrinkOption.objects.filter(
-            models.Q(user=request.user) | models.Q(is_default=True, user__isnull=True),
-            id=drink_id
-        ).first()
+        drink = drink_catalog.get(request.user.id, drink_id)
         if not drink:
             return JsonResponse({'detail': '饮品不存在'}, status=status.HTTP_404_NOT_FOUND)
-        data['drink_name'] = drink.name
-        data['drink_icon'] = drink.icon
-        data['caffeine_mg'] = drink.caffeine_mg
-        if not data.get('amount'):
-            data['amount'] = drink.amount
-    else:
-        if not drink_name:
-            data['drink_name'] = '自定义饮品'
+    apply_drink(data, drink)
 
     if not data.get('recorded_at'):
         data['recorded_at'] = timezone.now().isoformat()
@@ -143,9 +146,7 @@ def create_water_intake(request):
 @permission_classes([IsAuthenticated])
 def bowel_movement_list(request):
     """Get bowel movement records."""
-    records = BowelMovement.objects.filter(user=request.user).order_by('-recorded_at')
-    serializer = BowelMovementSerializer(records, many=True)
-    return JsonResponse(serializer.data, safe=False)
+    return record_list(request, BowelMovement, BowelMovementSerializer)
 
 
 @api_view(['POST'])
@@ -163,9 +164,7 @@ def create_bowel_movement(request):
 @permission_classes([IsAuthenticated])
 def smoking_record_list(request):
     """Get smoking records."""
-    records = SmokingRecord.objects.filter(user=request.user).order_by('-recorded_at')
-    serializer = SmokingRecordSerializer(records, many=True)
-    return JsonResponse(serializer.data, safe=False)
+    return record_list(request, SmokingRecord, SmokingRecordSerializer)
 
 
 @api_view(['POST'])
@@ -183,9 +182,7 @@ def create_smoking_record(request):
 @permission_classes([IsAuthenticated])
 def slack_record_list(request):
     """Get slack records."""
-    records = SlackRecord.objects.filter(user=request.user).order_by('-recorded_at')
-    serializer = SlackRecordSerializer(records, many=True)
-    return JsonResponse(serializer.data, safe=False)
+    return record_list(request, SlackRecord, SlackRecordSerializer)
 
 
 @api_view(['POST'])
@@ -199,34 +196,43 @@ def create_slack_record(request):
     return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def ingest_records(request):
+    """Create a batch of water, bowel, smoking and slack records, deduplicated by client key."""
+    records = request.data.get('records') if isinstance(request.data, dict) else None
+    if not isinstance(records, list) or not records:
+        return JsonResponse({'detail': 'records 必须是非空列表'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(records) > settings.ACTIVITY_BATCH_MAX_RECORDS:
+        return JsonResponse(
+            {'detail': f'单次最多提交 {settings.ACTIVITY_BATCH_MAX_RECORDS} 条记录'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    results = ingest(request.user, records)
+    counts = {'created': 0, 'duplicate': 0, 'invalid': 0}
+    for result in results:
+        counts[result['status']] += 1
+    return JsonResponse({**counts, 'results': results})
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_view('activities:user:{user}', SUMMARY_CACHE_TTL, key=local_date_key)
 def statistics(request):
     """Get activity statistics."""
-    user = request.user
-
-    # Water intake statistics
-    today_water = WaterIntake.objects.filter(
-        user=user,
-        recorded_at__date=timezone.now().date()
-    ).aggregate(total=models.Sum('amount'))['total'] or 0
-
-    # Today's activities count
-    today_activities = Activity.objects.filter(
-        user=user,
-        created_at__date=timezone.now().date()
-    ).count()
-
-    # Today's smoking count
-    today_smoking = SmokingRecord.objects.filter(
-        user=user,
-        recorded_at__date=timezone.now().date()
-    ).aggregate(total=models.Sum('count'))['total'] or 0
+    today = DailyUserMetrics.objects.filter(
+        user_id=request.user.id,
+        day=timezone.localdate()
+    ).first() or DailyUserMetrics()
 
     data = {
-        'today_water_intake': today_water,
-        'today_activities': today_activities,
-        'today_smoking': today_smoking,
+        'today_water_intake': today.water_ml,
+        'today_activities': today.activity_count,
+        'today_smoking': today.smoking_count,
+        'today_caffeine_mg': today.caffeine_mg,
+        'today_slack_minutes': today.slack_minutes,
+        'today_bowel_movements': today.bowel_events,
     }
 
     return JsonResponse(data)
@@ -236,13 +242,16 @@ def statistics(request):
 @permission_classes([IsAuthenticated])
 def drink_options_view(request):
     """List or create drink options."""
-    ensure_default_drinks()
     if request.method == 'GET':
-        options = DrinkOption.objects.filter(
-            models.Q(user__isnull=True, is_default=True) | models.Q(user=request.user)
-        ).order_by('-is_default', 'name')
-        serializer = DrinkOptionSerializer(options, many=True)
-        return JsonResponse(serializer.data, safe=False)
+        etag, options = drink_catalog.options(request.user.id)
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = JsonResponse([dict(option) for option in options], safe=False)
+        response['ETag'] = etag
+        # Let browsers keep the list but revalidate it on every use.
+        response['Cache-Control'] = 'private, no-cache'
+        return response
 
     serializer = DrinkOptionSerializer(data=request.data)
     if serializer.is_valid():
@@ -255,7 +264,7 @@ def drink_options_view(request):
 @permission_classes([IsAuthenticated])
 def drink_option_detail(request, pk):
     """Update or delete a custom drink option."""
-    option = DrinkOption.objects.filter(user=request.user, pk=pk).first()
+    option = DrinkOption.objects.filter(user_id=request.user.id, pk=pk).first()
     if not option:
         return JsonResponse({'detail': '饮品不存在或无权访问'}, status=404)
 
@@ -268,3 +277,46 @@ def drink_option_detail(request, pk):
         serializer.save()
         return JsonResponse(serializer.data)
     return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_export(request):
+    """
+    Queue an NDJSON export of one record type; poll ``exports/<id>/`` for the file.
+
+    Body: ``type`` (activities, water, bowel, smoking, slack) and optional
+    ``start`` / ``end`` as on the list endpoints.
+    """
+    record_type = request.data.get('type')
+    if record_type not in EXPORT_TYPES:
+        return JsonResponse({'detail': f'type 必须是 {", ".join(EXPORT_TYPES)} 之一'}, status=status.HTTP_400_BAD_REQUEST)
+    bounds = {}
+    for name in ('start', 'end'):
+        value = request.data.get(name)
+        if value:
+            parse_bound(str(value), name)
+            bounds[name] = str(value)
+
+    export_id = uuid.uuid4().hex
+    export_records.apply_async(
+        kwargs={'export_id': export_id, 'user_id': request.user.id, 'record_type': record_type, **bounds},
+        task_id=export_id,
+    )
+    return JsonResponse({'id': export_id, 'status': 'PENDING'}, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_status(request, export_id):
+    """State of a queued export, with the file URL once it is ready."""
+    result = AsyncResult(export_id)
+    data = {'id': export_id, 'status': result.state}
+    if result.successful():
+        # Anything but an export's own result (e.g. a skipped duplicate) is not the caller's file.
+        export = result.result
+        if not isinstance(export, dict) or export.get('user_id') != request.user.id:
+            return JsonResponse({'detail': '导出不存在'}, status=status.HTTP_404_NOT_FOUND)
+        data['url'] = request.build_absolute_uri(export['url'])
+        data['count'] = export['count']
+    return JsonResponse(data)
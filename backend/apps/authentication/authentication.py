@@ -1,9 +1,12 @@
+import uuid
+
 import jwt
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework import exceptions
 from rest_framework.authentication import BaseAuthentication
 from datetime import datetime, timedelta
+from .principals import authenticate_token
 
 User = get_user_model()
 
@@ -13,51 +16,60 @@ class JWTAuthentication(BaseAuthentication):
 
     def authenticate(self, request):
         """Authenticate request using JWT."""
+        # JWTAuthenticationMiddleware already resolved the token for this request.
+        result = getattr(getattr(request, '_request', request), 'jwt_auth_result', None)
+        if isinstance(result, exceptions.AuthenticationFailed):
+            raise result
+        if result is not None:
+            return result
+
         auth_header = request.headers.get('Authorization')
 
         if not auth_header or not auth_header.startswith('Bearer '):
             return None
 
         token = auth_header.split(' ')[1]
-
-        try:
-            payload = jwt.decode(
-                token,
-                settings.JWT_SECRET_KEY,
-                algorithms=[settings.JWT_ALGORITHM]
-            )
-        except jwt.ExpiredSignatureError:
-            raise exceptions.AuthenticationFailed('Token已过期')
-        except jwt.InvalidTokenError:
-            raise exceptions.AuthenticationFailed('无效的Token')
-
-        user_id = payload.get('user_id')
-        if not user_id:
-            raise exceptions.AuthenticationFailed('Token缺少用户信息')
-
-        try:
-            user = User.objects.get(id=user_id, is_active=True)
-        except User.DoesNotExist:
-            raise exceptions.AuthenticationFailed('用户不存在')
-
-        return (user, token)
+        return (authenticate_token(token), token)
 
     def authenticate_header(self, request):
         """Return authentication header."""
         return 'Bearer'
 
 
-def generate_jwt_token(user):
-    """Generate JWT token for user."""
+def _encode_token(user, token_type, lifetime, family):
+    now = datetime.utcnow()
     payload = {
         'user_id': user.id,
         'username': user.username,
-        'exp': datetime.utcnow() + timedelta(seconds=settings.JWT_ACCESS_TOKEN_LIFETIME),
-        'iat': datetime.utcnow(),
+        'ver': user.token_version,
+        'type': token_type,
+        'jti': uuid.uuid4().hex,
+        'fam': family,
+        'exp': now + timedelta(seconds=lifetime),
+        'iat': now,
     }
 
     return jwt.encode(
         payload,
         settings.JWT_SECRET_KEY,
         algorithm=settings.JWT_ALGORITHM
-    )
\ No newline at end of file
+    )
+
+
+def generate_jwt_token(user, family=None):
+    """Generate a short-lived access token for user."""
+    return _encode_token(user, 'access', settings.JWT_ACCESS_TOKEN_LIFETIME, family or uuid.uuid4().hex)
+
+
+def generate_token_pair(user, family=None):
+    """
+    Generate an access token and a single-use refresh token.
+
+    Both carry the same family id, which identifies one login session: revoking
+    the family (logout, refresh token reuse) revokes every token rotated from it.
+    """
+    family = family or uuid.uuid4().hex
+    return {
+        'token': generate_jwt_token(user, family),
+        'refresh_token': _encode_token(user, 'refresh', settings.JWT_REFRESH_TOKEN_LIFETIME, family),
+    }
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+class HashPoolSaturated(Exception):
+    """Raised when the password hashing pool has no room for another job."""
+
+
+class PasswordHashPool:
+    """
+    Dedicated thread pool for password hashing.
+
+    Hashers (bcrypt, PBKDF2) release the GIL, so hashing here keeps the event loop
+    and the default executor free for other requests. At most ``workers`` hashes
+    run at once and ``max_pending`` more may wait; beyond that ``run`` raises
+    HashPoolSaturated straight away instead of queueing.
+    """
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+        return self._executor
+
+    async def run(self, func, *args):
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_pending:
+                raise HashPoolSaturated()
+            self._in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), self._call, func, args)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    @staticmethod
+    def _call(func, args):
+        # A rehash saves the user from this thread, so release the connection like a request would.
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+
+
+password_hash_pool = PasswordHashPool(
+    workers=settings.AUTH_HASH_WORKERS,
+    max_pending=settings.AUTH_HASH_QUEUE_LIMIT,
+)
@@ -1,6 +1,7 @@
 from django.utils.deprecation import MiddlewareMixin
 from django.http import JsonResponse
 from django.contrib.auth import get_user_model
+from rest_framework import exceptions
 from .authentication import JWTAuthentication
 
 User = get_user_model()
@@ -29,9 +30,13 @@ class JWTAuthenticationMiddleware(MiddlewareMixin):
             result = auth.authenticate(request)
             if result:
                 request.user, request.auth = result
-        except Exception:
+                # Reused by DRF's JWTAuthentication so the token is decoded once
+                request.jwt_auth_result = result
+        except exceptions.AuthenticationFailed as exc:
             # Authentication failed, but don't block request
             # DRF permissions will handle authentication requirements
+            request.jwt_auth_result = exc
+        except Exception:
             pass
 
         return None
@@ -0,0 +1,125 @@
+import copy
+
+import jwt
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework import exceptions
+
+from wellness_hub.lru import TTLCache
+from .revocation import denylist
+
+User = get_user_model()
+
+# Process-level cache of authenticated users keyed by id. A token is accepted only
+# while its ``ver`` claim matches User.token_version, so bumping the version (see
+# User.set_password) revokes older tokens. Entries are dropped by
+# apps.authentication.signals when the user is saved or deleted; other workers
+# notice within AUTH_PRINCIPAL_CACHE_TTL seconds.
+principals = TTLCache(maxsize=settings.AUTH_PRINCIPAL_CACHE_SIZE, ttl=settings.AUTH_PRINCIPAL_CACHE_TTL)
+
+
+def decode_token(token, token_type='access', check_revoked=True):
+    """Verify a JWT of the given type, check it was not revoked and return its payload."""
+    try:
+        payload = jwt.decode(
+            token,
+            settings.JWT_SECRET_KEY,
+            algorithms=[settings.JWT_ALGORITHM]
+        )
+    except jwt.ExpiredSignatureError:
+        raise exceptions.AuthenticationFailed('Token已过期')
+    except jwt.InvalidTokenError:
+        raise exceptions.AuthenticationFailed('无效的Token')
+
+    if not payload.get('user_id'):
+        raise exceptions.AuthenticationFailed('Token缺少用户信息')
+    # Tokens issued before refresh tokens existed carry no type and are access tokens.
+    if payload.get('type', 'access') != token_type:
+        raise exceptions.AuthenticationFailed('无效的Token')
+    if check_revoked and denylist.is_revoked(payload):
+        raise exceptions.AuthenticationFailed('Token已失效')
+    return payload
+
+
+def _check_version(user, payload):
+    if user.token_version != payload.get('ver', 0):
+        raise exceptions.AuthenticationFailed('Token已失效')
+    # Callers may modify request.user, so never hand out the cached instance itself.
+    return copy.copy(user)
+
+
+def get_cached_principal(payload):
+    """Return the user for a decoded token from the cache, or None on a miss."""
+    user = principals.get(payload['user_id'])
+    if user is None or user.token_version < payload.get('ver', 0):
+        # A newer token than the cached user means the cache is stale.
+        return None
+    return _check_version(user, payload)
+
+
+def load_principal(payload):
+    """Load the user for a decoded token from the database and cache it."""
+    try:
+        user = User.objects.get(id=payload['user_id'], is_active=True)
+    except User.DoesNotExist:
+        raise exceptions.AuthenticationFailed('用户不存在')
+    principals.set(user.id, user)
+    return _check_version(user, payload)
+
+
+def invalidate_principal(user_id):
+    principals.delete(user_id)
+
+
+class ClaimsPrincipal(SimpleLazyObject):
+    """
+    Authenticated user built from verified token claims.
+
+    ``id``, ``pk`` and ``username`` come from the token, and ``is_authenticated``,
+    ``is_anonymous`` and ``is_active`` are constant (deactivating a user revokes
+    their tokens), so ``IsAuthenticated`` and ``user_id=request.user.id`` filters
+    need no user row. ``is_staff``, ``is_superuser`` and anything else (including
+    isinstance checks and model assignment) load the real user through the
+    principal cache on first use, so privilege changes apply right away.
+    """
+
+    def __init__(self, payload):
+        self.__dict__['claims'] = payload
+        super().__init__(lambda: get_cached_principal(payload) or load_principal(payload))
+
+    @property
+    def id(self):
+        return self.claims['user_id']
+
+    pk = id
+
+    @property
+    def username(self):
+        return self.claims.get('username', '')
+
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+
+    @property
+    def is_staff(self):
+        return self._user.is_staff
+
+    @property
+    def is_superuser(self):
+        return self._user.is_superuser
+
+    @property
+    def _user(self):
+        if self._wrapped is empty:
+            self._setup()
+        return self._wrapped
+
+    def __bool__(self):
+        return True
+
+
+def authenticate_token(token):
+    """Return a ClaimsPrincipal for an access token, raising AuthenticationFailed otherwise."""
+    return ClaimsPrincipal(decode_token(token))
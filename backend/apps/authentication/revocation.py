@@ -0,0 +1,176 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+
+import redis
+from django.conf import settings
+
+from wellness_hub.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Revoking a user's tokens sets a version floor; this one also rejects the current version.
+DEACTIVATED = 2 ** 31
+
+# Drop floors whose tokens have all expired; HDEL in chunks to stay under Lua's unpack limit.
+PRUNE_FLOORS_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for i = 1, #expired, 1000 do
+  redis.call('HDEL', KEYS[2], unpack(expired, i, math.min(i + 999, #expired)))
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+return #expired
+"""
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings."""
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class TokenDenylist:
+    """
+    Revoked token ids checked without a database or Redis round trip.
+
+    Redis is the source of truth: ``jti`` holds revoked token and token family ids
+    scored by when they expire, ``floors`` maps user id to the lowest token version
+    still accepted (``floor_expiry`` records when each stops mattering, once every
+    token issued before it has expired), and ``version`` is bumped on every change.
+    Each worker keeps a Bloom filter of the ids plus a copy of the floors and
+    re-syncs at most every ``sync_interval`` seconds, only when ``version`` moved.
+    A Bloom hit is confirmed against Redis, so false positives never reject a
+    valid token.
+
+    Used refresh tokens are tracked apart from all of this under ``claimed:<jti>``
+    keys that expire with the token: access tokens never carry those ids, so a
+    routine refresh must not make every worker reload the denylist.
+
+    Revocations made on another worker take effect here within ``sync_interval``.
+    If Redis is unavailable the last synced state keeps being used.
+    """
+
+    def __init__(self, sync_interval, capacity, error_rate, floor_ttl, prefix='auth:denylist:'):
+        self.sync_interval = sync_interval
+        self.floor_ttl = floor_ttl
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._floors = {}
+        self._version = None
+        self._next_sync = 0.0
+
+    @property
+    def redis(self):
+        return get_redis()
+
+    def _key(self, name):
+        return self.prefix + name
+
+    def is_revoked(self, payload):
+        """True when the token, its family or its user version has been revoked."""
+        self._maybe_sync()
+        floor = self._floors.get(payload.get('user_id'), 0)
+        if payload.get('ver', 0) < floor:
+            return True
+        ids = [value for value in (payload.get('jti'), payload.get('fam')) if value]
+        suspects = [value for value in ids if value in self._bloom]
+        if not suspects:
+            return False
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for value in suspects:
+                pipe.zscore(self._key('jti'), value)
+            return any(score is not None for score in pipe.execute())
+        except redis.RedisError:
+            logger.exception('Could not confirm revoked token, rejecting it')
+            return True
+
+    def revoke(self, token_id, expires_at):
+        """Revoke a token or token family id until ``expires_at`` (a unix timestamp)."""
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zadd(self._key('jti'), {token_id: expires_at})
+        pipe.incr(self._key('version'))
+        pipe.execute()
+        with self._lock:
+            self._bloom.add(token_id)
+
+    def claim(self, token_id, expires_at):
+        """Use up a single-use token id; returns False when it was already used."""
+        ttl = max(int(math.ceil(expires_at - time.time())), 1)
+        return bool(self.redis.set(self._key(f'claimed:{token_id}'), 1, nx=True, ex=ttl))
+
+    def set_floor(self, user_id, version):
+        """Reject every token of a user whose version is below ``version``."""
+        self._maybe_sync()
+        if self._floors.get(user_id, 0) == version:
+            return
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(self._key('floors'), user_id, version)
+        pipe.zadd(self._key('floor_expiry'), {user_id: time.time() + self.floor_ttl})
+        pipe.incr(self._key('version'))
+        pipe.execute()
+        with self._lock:
+            self._floors[user_id] = version
+
+    def _maybe_sync(self):
+        now = time.monotonic()
+        if now < self._next_sync:
+            return
+        self._next_sync = now + self.sync_interval
+        try:
+            self.sync()
+        except redis.RedisError:
+            logger.exception('Could not sync the token denylist')
+
+    def sync(self):
+        """Reload the Bloom filter and floors from Redis when they changed."""
+        version = self.redis.get(self._key('version'))
+        if version == self._version:
+            return
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zremrangebyscore(self._key('jti'), '-inf', now)
+        pipe.eval(PRUNE_FLOORS_SCRIPT, 2, self._key('floor_expiry'), self._key('floors'), now)
+        pipe.zrange(self._key('jti'), 0, -1)
+        pipe.hgetall(self._key('floors'))
+        pipe.get(self._key('version'))
+        _, _, token_ids, floors, version = pipe.execute()
+
+        bloom = BloomFilter(max(self.capacity, len(token_ids) * 2), self.error_rate)
+        for token_id in token_ids:
+            bloom.add(token_id)
+        with self._lock:
+            self._bloom = bloom
+            self._floors = {int(user_id): int(floor) for user_id, floor in floors.items()}
+            self._version = version
+
+
+denylist = TokenDenylist(
+    sync_interval=settings.JWT_DENYLIST_SYNC_INTERVAL,
+    capacity=settings.JWT_DENYLIST_CAPACITY,
+    error_rate=settings.JWT_DENYLIST_ERROR_RATE,
+    # A floor outlives the longest-lived token issued before it.
+    floor_ttl=settings.JWT_REFRESH_TOKEN_LIFETIME,
+)
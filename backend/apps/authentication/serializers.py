@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.password_validation import validate_password
-from .authentication import generate_jwt_token
 
 User = get_user_model()
 
@@ -26,14 +26,18 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return attrs
 
     def create(self, validated_data):
-        """Create new user."""
+        """Create new user; ``password_hash`` may be passed to save() when hashed elsewhere."""
         validated_data.pop('password_confirm')
         password = validated_data.pop('password')
+        password_hash = validated_data.pop('password_hash', None) or make_password(password)
 
-        user = User.objects.create_user(
-            password=password,
+        user = User(
+            username=User.normalize_username(validated_data.pop('username')),
+            email=User.objects.normalize_email(validated_data.pop('email', '')),
             **validated_data
         )
+        user.password = password_hash
+        user.save()
 
         # Create user profile
         from apps.users.models import UserProfile
@@ -43,33 +47,19 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 
 
 class UserLoginSerializer(serializers.Serializer):
-    """User login serializer."""
+    """
+    User login serializer.
+
+    Only validates the input; LoginView checks the password on the hashing pool.
+    """
     username = serializers.CharField()
     password = serializers.CharField()
 
     def validate(self, attrs):
-        """Validate credentials."""
-        username = attrs.get('username')
-        password = attrs.get('password')
-
-        if username and password:
-            user = User.objects.filter(username=username).first()
-
-            if user and user.check_password(password):
-                if not user.is_active:
-                    raise serializers.ValidationError("账户已被禁用")
-
-                # Update last login
-                from django.utils import timezone
-                user.last_login_at = timezone.now()
-                user.save(update_fields=['last_login_at'])
-
-                attrs['user'] = user
-                return attrs
-            else:
-                raise serializers.ValidationError("用户名或密码错误")
-        else:
+        """Validate credentials are present."""
+        if not attrs.get('username') or not attrs.get('password'):
             raise serializers.ValidationError("必须提供用户名和密码")
+        return attrs
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
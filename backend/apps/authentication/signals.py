@@ -0,0 +1,54 @@
+import logging
+
+import redis
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from django.contrib.auth import get_user_model
+from .principals import invalidate_principal
+from .revocation import DEACTIVATED, denylist
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# Fields that decide which of a user's tokens are still accepted.
+REVOCATION_FIELDS = {'token_version', 'is_active'}
+
+
+def token_floor(token_version, is_active):
+    return token_version if is_active else DEACTIVATED
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_principal(sender, instance, **kwargs):
+    """Password changes, deactivation and profile edits must not be served from a cached user."""
+    invalidate_principal(instance.id)
+
+
+@receiver(pre_save, sender=User)
+def remember_token_floor(sender, instance, update_fields=None, **kwargs):
+    """Load the stored floor so only saves that move it reach Redis."""
+    if instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not REVOCATION_FIELDS & set(update_fields):
+        return
+    previous = sender.objects.filter(pk=instance.pk).values_list('token_version', 'is_active').first()
+    if previous is not None:
+        instance._token_floor_previous = token_floor(*previous)
+
+
+@receiver(post_save, sender=User)
+def revoke_stale_tokens(sender, instance, created=False, **kwargs):
+    """Tokens issued before a password change, or to a deactivated user, stop working."""
+    previous = instance.__dict__.pop('_token_floor_previous', None)
+    if created or previous is None:
+        return
+    floor = token_floor(instance.token_version, instance.is_active)
+    if floor == previous:
+        return
+    try:
+        denylist.set_floor(instance.id, floor)
+    except redis.RedisError:
+        # The ``ver`` check against the reloaded principal still rejects the old tokens.
+        logger.exception('Could not set the token floor for user %s', instance.id)
@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+
+import redis
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+
+from wellness_hub.redis_client import get_redis
+
+from .authentication import generate_jwt_token, generate_token_pair
+from .hashing import HashPoolSaturated, PasswordHashPool
+from .principals import authenticate_token, invalidate_principal
+from .revocation import DEACTIVATED, TokenDenylist, denylist
+
+User = get_user_model()
+
+
+class RevokeStaleTokensTests(TestCase):
+    """The token floor only reaches Redis when a save moves it."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='tokens', password='x')
+
+    def test_profile_edits_skip_redis(self):
+        with mock.patch.object(denylist, 'set_floor') as set_floor:
+            self.user.phone = '13800000000'
+            self.user.save()
+            self.user.save(update_fields=['last_login_at'])
+        set_floor.assert_not_called()
+
+    def test_password_change_and_deactivation_set_floor(self):
+        with mock.patch.object(denylist, 'set_floor') as set_floor:
+            self.user.set_password('y')
+            self.user.save()
+            set_floor.assert_called_once_with(self.user.id, 1)
+            self.user.is_active = False
+            self.user.save(update_fields=['is_active'])
+            set_floor.assert_called_with(self.user.id, DEACTIVATED)
+
+    def test_redis_errors_are_logged(self):
+        with mock.patch.object(denylist, 'set_floor', side_effect=redis.ConnectionError('down')):
+            with self.assertLogs('apps.authentication.signals', 'ERROR'):
+                self.user.set_password('y')
+                self.user.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.token_version, 1)
+
+
+class TokenDenylistTests(TestCase):
+    """Refresh claims stay out of the synced denylist; expired floors are pruned."""
+
+    def setUp(self):
+        self.redis = get_redis()
+        self.redis.flushall()
+        self.denylist = TokenDenylist(sync_interval=0, capacity=100, error_rate=0.01, floor_ttl=60)
+
+    def version(self):
+        return self.redis.get('auth:denylist:version')
+
+    def test_claim_is_single_use_and_skips_the_sync(self):
+        expires_at = time.time() + 60
+        self.assertTrue(self.denylist.claim('refresh-1', expires_at))
+        self.assertFalse(self.denylist.claim('refresh-1', expires_at))
+        self.assertIsNone(self.version())
+        self.assertEqual(self.redis.zcard('auth:denylist:jti'), 0)
+        self.assertLessEqual(self.redis.ttl('auth:denylist:claimed:refresh-1'), 60)
+
+    def test_refresh_rotates_without_bumping_the_version(self):
+        user = User.objects.create_user(username='refresher', password='x')
+        pair = generate_token_pair(user)
+        client = APIClient()
+        response = client.post('/api/auth/refresh/', {'refresh_token': pair['refresh_token']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(self.version())
+        replayed = client.post('/api/auth/refresh/', {'refresh_token': pair['refresh_token']}, format='json')
+        self.assertEqual(replayed.status_code, 401)
+
+    def test_sync_prunes_expired_floors(self):
+        self.denylist.set_floor(1, 3)
+        with mock.patch('apps.authentication.revocation.time.time', return_value=time.time() - 120):
+            self.denylist.set_floor(2, 5)
+        self.denylist.revoke('access-1', time.time() + 60)
+        self.denylist.sync()
+        self.assertEqual(self.redis.hgetall('auth:denylist:floors'), {'1': '3'})
+        self.assertEqual(self.denylist._floors, {1: 3})
+        self.assertTrue(self.denylist.is_revoked({'user_id': 1, 'ver': 2}))
+        self.assertFalse(self.denylist.is_revoked({'user_id': 2, 'ver': 4}))
+
+
+class ClaimsPrincipalTests(TestCase):
+    """Token principals answer identity from claims and privilege flags from the user."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='principal', password='x')
+        invalidate_principal(self.user.id)
+
+    def test_identity_needs_no_query(self):
+        principal = authenticate_token(generate_jwt_token(self.user))
+        with self.assertNumQueries(0):
+            self.assertEqual((principal.id, principal.pk), (self.user.id, self.user.id))
+            self.assertEqual(principal.username, 'principal')
+            self.assertTrue(principal.is_authenticated and principal.is_active)
+            self.assertFalse(principal.is_anonymous)
+
+    def test_privilege_flags_come_from_the_user(self):
+        principal = authenticate_token(generate_jwt_token(self.user))
+        self.assertFalse(principal.is_staff)
+        self.assertFalse(principal.is_superuser)
+
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        principal = authenticate_token(generate_jwt_token(self.user))
+        self.assertTrue(principal.is_staff)
+        self.assertTrue(principal.is_superuser)
+        self.assertTrue(principal.has_perm('users.change_user'))
+
+
+class PasswordHashPoolTests(SimpleTestCase):
+    """A full hashing pool refuses work at once instead of queueing it."""
+
+    async def test_saturated_pool_rejects_without_queueing(self):
+        pool = PasswordHashPool(workers=1, max_pending=1)
+        release = threading.Event()
+        running = [asyncio.ensure_future(pool.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with self.assertRaises(HashPoolSaturated):
+            await pool.run(str, 'third')
+        release.set()
+        self.assertEqual(await asyncio.gather(*running), [True, True])
+        self.assertEqual(await pool.run(str, 'after'), 'after')
+
+
+
+class HashPoolSaturatedViewTests(TestCase):
+    """Login and registration answer 429 while the hashing pool is full."""
+
+    def test_login_and_register_answer_429(self):
+        User.objects.create_user(username='busy', password='x')
+        with mock.patch('apps.authentication.views.password_hash_pool.run', side_effect=HashPoolSaturated):
+            login = self.client.post(
+                '/api/auth/login/', {'username': 'busy', 'password': 'x'}, content_type='application/json'
+            )
+            register = self.client.post('/api/auth/register/', {
+                'username': 'newcomer',
+                'email': 'newcomer@example.com',
+                'phone': '13800000000',
+                'password': 'Sturdy-pass-123',
+                'password_confirm': 'Sturdy-pass-123',
+            }, content_type='application/json')
+        for response in (login, register):
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '1')
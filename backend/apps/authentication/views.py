@@ -1,5 +1,14 @@
-from rest_framework import status, permissions
-from rest_framework.decorators import api_view, permission_classes
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views import View
+from rest_framework import status, permissions, exceptions
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.contrib.auth import get_user_model
@@ -9,49 +18,106 @@ from .serializers import (
     UserProfileSerializer,
     ChangePasswordSerializer
 )
-from .authentication import generate_jwt_token
+from .authentication import generate_token_pair
+from .hashing import HashPoolSaturated, password_hash_pool
+from .principals import decode_token, load_principal
+from .revocation import denylist
 
 User = get_user_model()
 
 
-class RegisterView(APIView):
+class AsyncJSONView(View):
+    """
+    Async JSON endpoint for anonymous callers, outside DRF.
+
+    DRF views run synchronously; login and registration are async so password
+    hashing can wait on the hashing pool without holding a worker thread.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True  # token auth only, like DRF's APIView
+        return view
+
+    @staticmethod
+    def json(data, status=status.HTTP_200_OK, **kwargs):
+        return JsonResponse(data, status=status, json_dumps_params={'ensure_ascii': False}, **kwargs)
+
+    def parse_body(self, request):
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+    def saturated(self):
+        response = self.json({'detail': '请求过多，请稍后重试'}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        response['Retry-After'] = '1'
+        return response
+
+
+class RegisterView(AsyncJSONView):
     """User registration view."""
-    permission_classes = [permissions.AllowAny]
 
-    def post(self, request):
+    async def post(self, request):
         """Register new user."""
-        serializer = UserRegistrationSerializer(data=request.data)
-        if serializer.is_valid():
-            user = serializer.save()
-            token = generate_jwt_token(user)
+        data = self.parse_body(request)
+        if data is None:
+            return self.json({'detail': '无效的JSON'}, status=status.HTTP_400_BAD_REQUEST)
 
-            return Response({
-                'user': UserProfileSerializer(user, context={'request': request}).data,
-                'token': token,
-                'message': '注册成功'
-            }, status=status.HTTP_201_CREATED)
+        serializer = UserRegistrationSerializer(data=data)
+        if not await sync_to_async(serializer.is_valid)():
+            return self.json(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            password_hash = await password_hash_pool.run(make_password, serializer.validated_data['password'])
+        except HashPoolSaturated:
+            return self.saturated()
+        user = await sync_to_async(serializer.save)(password_hash=password_hash)
+
+        return self.json({
+            'user': UserProfileSerializer(user, context={'request': request}).data,
+            **generate_token_pair(user),
+            'message': '注册成功'
+        }, status=status.HTTP_201_CREATED)
 
 
-class LoginView(APIView):
+class LoginView(AsyncJSONView):
     """User login view."""
-    permission_classes = [permissions.AllowAny]
 
-    def post(self, request):
+    async def post(self, request):
         """Login user."""
-        serializer = UserLoginSerializer(data=request.data, context={'request': request})
-        if serializer.is_valid():
-            user = serializer.validated_data['user']
-            token = generate_jwt_token(user)
-
-            return Response({
-                'user': UserProfileSerializer(user, context={'request': request}).data,
-                'token': token,
-                'message': '登录成功'
-            })
-
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = self.parse_body(request)
+        if data is None:
+            return self.json({'detail': '无效的JSON'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = UserLoginSerializer(data=data)
+        if not serializer.is_valid():
+            return self.json(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user = await User.objects.filter(username=serializer.validated_data['username']).afirst()
+        try:
+            valid = user is not None and await password_hash_pool.run(
+                user.check_password, serializer.validated_data['password']
+            )
+        except HashPoolSaturated:
+            return self.saturated()
+
+        if not valid:
+            return self.json({'non_field_errors': ['用户名或密码错误']}, status=status.HTTP_400_BAD_REQUEST)
+        if not user.is_active:
+            return self.json({'non_field_errors': ['账户已被禁用']}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Update last login
+        user.last_login_at = timezone.now()
+        await user.asave(update_fields=['last_login_at'])
+
+        return self.json({
+            'user': UserProfileSerializer(user, context={'request': request}).data,
+            **generate_token_pair(user),
+            'message': '登录成功'
+        })
 
 
 class ProfileView(APIView):
@@ -96,7 +162,9 @@ class ChangePasswordView(APIView):
             user.set_password(serializer.validated_data['new_password'])
             user.save()
 
+            # Bumping token_version revoked every existing token, hand out new ones
             return Response({
+                **generate_token_pair(user),
                 'message': '密码修改成功'
             })
 
@@ -109,17 +177,37 @@ class LogoutView(APIView):
 
     def post(self, request):
         """Logout user."""
-        # In JWT-based authentication, logout is client-side
-        # Server can implement token blacklisting if needed
+        # Revoke the whole login session: this access token and every refresh token rotated with it
+        claims = request.user.claims
+        if claims.get('jti'):
+            denylist.revoke(claims['jti'], claims['exp'])
+        if claims.get('fam'):
+            denylist.revoke(claims['fam'], time.time() + settings.JWT_REFRESH_TOKEN_LIFETIME)
         return Response({
             'message': '退出登录成功'
         })
 
 
 @api_view(['POST'])
+@authentication_classes([])
 @permission_classes([permissions.AllowAny])
 def refresh_token(request):
-    """Refresh JWT token."""
-    # For simplicity, we'll just generate a new token
-    # In production, implement proper token refresh logic
-    return Response({'message': 'Token refresh not implemented'}, status=501)
\ No newline at end of file
+    """Exchange a refresh token for a new access token and refresh token."""
+    token = request.data.get('refresh_token')
+    if not token:
+        return Response({'detail': '缺少refresh_token'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        payload = decode_token(token, token_type='refresh', check_revoked=False)
+        # Family and user-wide revocations; this token's own jti is checked by the claim below
+        if denylist.is_revoked(dict(payload, jti=None)):
+            raise exceptions.AuthenticationFailed('Token已失效')
+        if not denylist.claim(payload['jti'], payload['exp']):
+            # A refresh token was presented twice, so a copy leaked: end the whole session
+            denylist.revoke(payload['fam'], time.time() + settings.JWT_REFRESH_TOKEN_LIFETIME)
+            raise exceptions.AuthenticationFailed('Token已失效')
+        user = load_principal(payload)
+    except exceptions.AuthenticationFailed as exc:
+        return Response({'detail': exc.detail}, status=status.HTTP_401_UNAUTHORIZED)
+
+    return Response(generate_token_pair(user, family=payload['fam']))
\ No newline at end of file
@@ -1,30 +1,24 @@
 from urllib.parse import parse_qs
 
-import jwt
 from channels.auth import AuthMiddlewareStack
-from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
-from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
+from rest_framework import exceptions
 
-User = get_user_model()
+from wellness_hub.db import database_sync_to_async
 
+from .principals import decode_token, get_cached_principal, load_principal
 
-@database_sync_to_async
-def _get_user_from_token(token: str):
-    try:
-        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
-    except (jwt.ExpiredSignatureError, jwt.DecodeError, jwt.InvalidTokenError):
-        return AnonymousUser()
+User = get_user_model()
 
-    user_id = payload.get('user_id')
-    if not user_id:
-        return AnonymousUser()
 
+async def _get_user_from_token(token: str):
+    # Cache hits are served without a hop to the database thread.
     try:
-        return User.objects.get(id=user_id, is_active=True)
-    except User.DoesNotExist:
+        payload = decode_token(token)
+        return get_cached_principal(payload) or await database_sync_to_async(load_principal)(payload)
+    except exceptions.AuthenticationFailed:
         return AnonymousUser()
 
 
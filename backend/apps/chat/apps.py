@@ -4,7 +4,4 @@ from django.apps import AppConfig
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.chat'
-    verbose_name = '聊天'
-
-    def ready(self):
-        import apps.chat.signals
\ No newline at end of file
+    verbose_name = '聊天'
\ No newline at end of file
@@ -1,11 +1,34 @@
 import json
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from .models import ChatRoom, ChatMessage, ChatRoomMember, OnlineUser
+
+from wellness_hub.db import database_sync_to_async
+
+from .models import ChatMessage, ChatRoom, ChatRoomMember
+from .frames import build_event, dumps
+from .pipeline import get_message_pipeline
+from .presence import ONLINE_USERS_GROUP, presence, broadcast_online, broadcast_offline
+from .read_state import (
+    read_cursors,
+    read_cursor_frame,
+    unread_counts_frame,
+    user_group_name,
+    abroadcast_read_cursor,
+)
+from .room_cache import room_cache, ainvalidate_room
+from .typing_state import typing_aggregator
 
 DEFAULT_ROOM_NAME = 'Wellness Hub Lounge'
+# Close code for sockets that stopped answering heartbeats.
+HEARTBEAT_TIMEOUT_CODE = 4408
+PONG_FRAME = dumps({'type': 'pong'})
+# Message types a client may send; system messages are only written by the server.
+CLIENT_MESSAGE_TYPES = frozenset(
+    value for value, _ in ChatMessage._meta.get_field('message_type').choices if value != 'system'
+)
 
 User = get_user_model()
 
@@ -20,7 +43,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
-        self.room = await self.get_or_create_room('global')
+        # Per-connection caches tagged with the room_cache generation they were read
+        # under; a stale tag falls back to the process-wide room_cache.
+        self.rooms = {}
+        self.memberships = {}
+        room_cache.listen()
+
+        self.room = await self.resolve_room('global')
         if not self.room:
             await self.close()
             return
@@ -28,17 +57,25 @@ class ChatConsumer(AsyncWebsocketConsumer):
         self.room_group_name = self.get_room_group_name(self.room)
 
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.add_to_room(self.room, self.user)
+        await self.channel_layer.group_add(user_group_name(self.user.id), self.channel_name)
+        if not await self.is_room_member(self.room, self.user):
+            if await self.add_to_room(self.room, self.user):
+                await ainvalidate_room(self.room.id)
+            self.memberships[self.room.id] = room_cache.generation(self.room.id)
         await self.track_user_online(self.room)
-        await self.broadcast_online_status('user_online')
 
         await self.accept()
         await self.broadcast_system_event('join')
+        # Lets a reconnecting client catch up on unread state without pulling history.
+        await self.send(text_data=dumps(unread_counts_frame(await read_cursors.aunread_counts(self.user.id))))
 
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection."""
-        if hasattr(self, 'room_group_name'):
-            await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        if not hasattr(self, 'room_group_name'):
+            return
+        typing_aggregator.update(self.room_group_name, self.room.id, self.user, False)
+        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        await self.channel_layer.group_discard(user_group_name(self.user.id), self.channel_name)
         await self.track_user_offline()
         await self.broadcast_system_event('leave')
 
@@ -48,7 +85,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
             text_data_json = json.loads(text_data)
             message_type = text_data_json.get('type')
 
-            if message_type == 'chat_message':
+            if message_type == 'ping':
+                await self.handle_ping()
+            elif message_type == 'chat_message':
                 await self.handle_chat_message(text_data_json)
             elif message_type == 'typing':
                 await self.handle_typing(text_data_json)
@@ -56,11 +95,18 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 await self.handle_join_room(text_data_json)
             elif message_type == 'leave_room':
                 await self.handle_leave_room(text_data_json)
+            elif message_type == 'mark_read':
+                await self.handle_mark_read(text_data_json)
         except json.JSONDecodeError:
             await self.send_error('Invalid JSON format')
         except Exception as e:
             await self.send_error(str(e))
 
+    async def handle_ping(self):
+        """Record a heartbeat; the lease is extended with the next batched refresh."""
+        presence.touch(self.channel_name)
+        await self.send(text_data=PONG_FRAME)
+
     async def handle_chat_message(self, data):
         """Handle chat message."""
         room_id = data.get('room_id') or 'global'
@@ -70,6 +116,12 @@ class ChatConsumer(AsyncWebsocketConsumer):
         if not room_id or not content:
             await self.send_error('Room ID and content are required')
             return
+        if not isinstance(content, str):
+            await self.send_error('Content must be a string')
+            return
+        if not isinstance(message_type, str) or message_type not in CLIENT_MESSAGE_TYPES:
+            await self.send_error('Invalid message type')
+            return
 
         room = await self.resolve_room(room_id)
         if not room:
@@ -82,53 +134,64 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.send_error('Not a member of this room')
             return
 
-        # Save message
-        message = await self.save_message(room, self.user, content, message_type)
-
-        room_group = self.get_room_group_name(room)
-
-        await self.channel_layer.group_send(
-            room_group,
-            {
-                'type': 'chat_message',
-                'message': {
-                    'id': message.id,
-                    'room_id': room.id,
-                    'user': {
-                        'id': self.user.id,
-                        'username': self.user.username,
-                        'avatar': self.user.avatar.url if self.user.avatar else None
-                    },
-                    'content': content,
-                    'message_type': message_type,
-                    'created_at': message.created_at.isoformat(),
-                }
+        # Queue message for write-behind persistence and broadcast right away
+        message = self.save_message(room, self.user, content, message_type)
+        await read_cursors.arecord_message(message)
+
+        await self.broadcast(room, {
+            'type': 'chat_message',
+            'message': {
+                'id': message.id,
+                'room_id': room.id,
+                'user': {
+                    'id': self.user.id,
+                    'username': self.user.username,
+                    'avatar': self.user.avatar.url if self.user.avatar else None
+                },
+                'content': content,
+                'message_type': message_type,
+                'created_at': message.created_at.isoformat(),
             }
-        )
+        })
 
     async def handle_typing(self, data):
-        """Handle typing indicator."""
+        """Handle typing indicator; broadcasts are coalesced by the typing aggregator."""
         room_id = data.get('room_id')
-        is_typing = data.get('is_typing', False)
+        is_typing = bool(data.get('is_typing', False))
 
         room = await self.resolve_room(room_id)
         if not room:
             return
 
-        room_group = self.get_room_group_name(room)
+        typing_aggregator.update(self.get_room_group_name(room), room.id, self.user, is_typing)
 
-        await self.channel_layer.group_send(
-            room_group,
-            {
-                'type': 'typing',
-                'user': {
-                    'id': self.user.id,
-                    'username': self.user.username
-                },
-                'is_typing': is_typing,
-                'room_id': room.id
-            }
-        )
+    async def handle_mark_read(self, data):
+        """Advance the read cursor up to ``message_id`` (or everything so far)."""
+        room = await self.resolve_room(data.get('room_id'))
+        if not room:
+            await self.send_error('Room not found')
+            return
+        if not await self.is_room_member(room, self.user):
+            await self.send_error('Not a member of this room')
+            return
+
+        message_id = data.get('message_id')
+        if message_id:
+            try:
+                message_id = int(message_id)
+            except (TypeError, ValueError):
+                await self.send_error('Invalid message ID')
+                return
+            read_at = await read_cursors.amessage_time(room.id, message_id)
+            if read_at is None:
+                await self.send_error('Message not found')
+                return
+        else:
+            read_at = timezone.now()
+
+        last_read_at, unread, _ = await read_cursors.amark_read(self.user.id, room.id, read_at)
+        # Acknowledges this socket and syncs the user's other tabs.
+        await abroadcast_read_cursor(self.user.id, read_cursor_frame(room.id, last_read_at, unread))
 
     async def handle_join_room(self, data):
         """Handle joining a room."""
@@ -137,21 +200,19 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
 
         # Add user to room members
-        await self.add_to_room(room, self.user)
+        if await self.add_to_room(room, self.user):
+            await ainvalidate_room(room.id)
+        self.memberships[room.id] = room_cache.generation(room.id)
 
         # Broadcast user joined
-        room_group = self.get_room_group_name(room)
-        await self.channel_layer.group_send(
-            room_group,
-            {
-                'type': 'user_joined',
-                'user': {
-                    'id': self.user.id,
-                    'username': self.user.username
-                },
-                'room_id': room.id
-            }
-        )
+        await self.broadcast(room, {
+            'type': 'user_joined',
+            'user': {
+                'id': self.user.id,
+                'username': self.user.username
+            },
+            'room_id': room.id
+        })
 
     async def handle_leave_room(self, data):
         """Handle leaving a room."""
@@ -161,20 +222,17 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         # Remove user from room
         await self.remove_from_room(room, self.user)
+        await ainvalidate_room(room.id)
 
         # Broadcast user left
-        room_group = self.get_room_group_name(room)
-        await self.channel_layer.group_send(
-            room_group,
-            {
-                'type': 'user_left',
-                'user': {
-                    'id': self.user.id,
-                    'username': self.user.username
-                },
-                'room_id': room.id
-            }
-        )
+        await self.broadcast(room, {
+            'type': 'user_left',
+            'user': {
+                'id': self.user.id,
+                'username': self.user.username
+            },
+            'room_id': room.id
+        })
 
     async def broadcast_system_event(self, action: str):
         """Broadcast join/leave events to the room and online users channel."""
@@ -183,114 +241,67 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'username': self.user.username,
             'avatar': self.user.avatar.url if self.user.avatar else None
         }
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'system_event',
-                'event': action,
-                'user': payload,
-                'message': f"{self.user.username} {'加入' if action == 'join' else '离开'}聊天室"
-            }
-        )
+        await self.channel_layer.group_send(self.room_group_name, build_event({
+            'type': 'system_event',
+            'event': action,
+            'user': payload,
+            'message': f"{self.user.username} {'加入' if action == 'join' else '离开'}聊天室"
+        }))
+
+    async def broadcast(self, room, frame):
+        """Encode a frame once and fan it out to the room group."""
+        await self.channel_layer.group_send(self.get_room_group_name(room), build_event(frame))
+
+    # Group events carry the frame already encoded by the sender (see frames.build_event),
+    # so the handlers below just forward it to the socket.
 
     async def system_event(self, event):
         """Forward system events to clients."""
-        await self.send(text_data=json.dumps({
-            'type': 'system_event',
-            'event': event['event'],
-            'user': event['user'],
-            'message': event['message']
-        }))
+        await self.send(text_data=event['frame'])
 
     async def chat_message(self, event):
         """Send chat message to WebSocket."""
-        await self.send(text_data=json.dumps({
-            'type': 'chat_message',
-            'message': event['message']
-        }))
+        await self.send(text_data=event['frame'])
 
     async def typing(self, event):
         """Send typing indicator to WebSocket."""
-        await self.send(text_data=json.dumps({
-            'type': 'typing',
-            'user': event['user'],
-            'is_typing': event['is_typing'],
-            'room_id': event['room_id']
-        }))
+        await self.send(text_data=event['frame'])
 
     async def user_joined(self, event):
         """Send user joined notification."""
-        await self.send(text_data=json.dumps({
-            'type': 'user_joined',
-            'user': event['user'],
-            'room_id': event['room_id']
-        }))
+        await self.send(text_data=event['frame'])
 
     async def user_left(self, event):
         """Send user left notification."""
-        await self.send(text_data=json.dumps({
-            'type': 'user_left',
-            'user': event['user'],
-            'room_id': event['room_id']
-        }))
+        await self.send(text_data=event['frame'])
+
+    async def read_cursor(self, event):
+        """Send a read cursor update for one of this user's rooms."""
+        await self.send(text_data=event['frame'])
+
+    async def heartbeat_timeout(self, event):
+        """Release and close a socket that stopped pinging; the peer may be gone for good."""
+        await self.track_user_offline()
+        await self.close(code=HEARTBEAT_TIMEOUT_CODE)
 
     async def send_error(self, message):
         """Send error message."""
-        await self.send(text_data=json.dumps({
+        await self.send(text_data=dumps({
             'type': 'error',
             'message': message
         }))
 
-    @database_sync_to_async
-    def track_user_online(self, room):
-        """Track user as online."""
-        OnlineUser.objects.update_or_create(
-            user=self.user,
-            defaults={
-                'channel_name': self.channel_name,
-                'last_seen': timezone.now(),
-                'current_room': room
-            }
-        )
-        self.user.is_online = True
-        self.user.save(update_fields=['is_online'])
-
-    @database_sync_to_async
-    def clear_online_record(self):
-        OnlineUser.objects.filter(user=self.user).delete()
+    async def track_user_online(self, room):
+        """Register this socket with the presence registry; announce the user's first tab."""
+        frame = await presence.aconnect(self.user, self.channel_name, room.id)
+        if frame:
+            await broadcast_online(frame)
 
     async def track_user_offline(self):
-        """Track user as offline."""
-        await self.clear_online_record()
-        await self.mark_user_offline()
-        await self.broadcast_online_status('user_offline')
-
-    @database_sync_to_async
-    def mark_user_offline(self):
-        self.user.is_online = False
-        self.user.save(update_fields=['is_online'])
-        ChatRoomMember.objects.filter(user=self.user).update(is_online=False)
-
-    @database_sync_to_async
-    def get_presence_payload(self):
-        avatar = self.user.avatar.url if self.user.avatar else None
-        return {
-            'id': self.user.id,
-            'username': self.user.username,
-            'avatar': avatar,
-            'last_active': timezone.now().isoformat()
-        }
-
-    async def broadcast_online_status(self, event_type: str):
-        payload = await self.get_presence_payload()
-        await self.channel_layer.group_send(
-            "online_users",
-            {
-                'type': event_type,
-                'user': payload,
-                'user_id': payload['id']
-            }
-        )
+        """Release this socket; announce the user offline once the last tab is gone."""
+        frame = await presence.adisconnect(self.user.id, self.channel_name)
+        if frame:
+            await broadcast_offline(frame)
 
     @database_sync_to_async
     def get_or_create_room(self, room_id):
@@ -309,33 +320,56 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     async def resolve_room(self, room_id):
         """Resolve various room identifiers to actual ChatRoom instances."""
-        if not room_id or room_id == 'global':
-            return await self.get_or_create_room('global')
-        return await self.get_room(room_id)
+        key = 'global' if not room_id or room_id == 'global' else str(room_id)
+        entry = self.rooms.get(key)
+        if entry is not None and entry[1] == room_cache.generation(entry[0].id):
+            return entry[0]
+
+        room = room_cache.get_room(key)
+        if room is None:
+            if key == 'global':
+                room = await self.get_or_create_room('global')
+            else:
+                room = await self.get_room(room_id)
+            if room is None:
+                return None
+            room_cache.set_room(key, room)
+
+        self.rooms[key] = (room, room_cache.generation(room.id))
+        return room
 
     @database_sync_to_async
     def get_room(self, room_id):
         """Get chat room."""
         return ChatRoom.objects.filter(id=room_id).first()
 
-    @database_sync_to_async
-    def is_room_member(self, room, user):
+    async def is_room_member(self, room, user):
         """Check if user is room member."""
-        return ChatRoomMember.objects.filter(room=room, user=user).exists()
+        generation = room_cache.generation(room.id)
+        if user.id == self.user.id and self.memberships.get(room.id) == generation:
+            return True
+
+        members = room_cache.get_members(room.id)
+        if members is None:
+            members = await self.get_room_member_ids(room)
+            room_cache.set_members(room.id, members, generation)
+
+        if user.id not in members:
+            return False
+        if user.id == self.user.id:
+            self.memberships[room.id] = generation
+        return True
+
+    @database_sync_to_async
+    def get_room_member_ids(self, room):
+        """Load the ids of every member of a room."""
+        return frozenset(ChatRoomMember.objects.filter(room=room).values_list('user_id', flat=True))
 
     @database_sync_to_async
     def add_to_room(self, room, user):
-        """Add user to room."""
-        member, created = ChatRoomMember.objects.get_or_create(
-            room=room,
-            user=user,
-            defaults={
-                'is_online': True
-            }
-        )
-        if not created:
-            member.is_online = True
-            member.save(update_fields=['is_online'])
+        """Add user to room; returns True when the membership was created."""
+        _, created = ChatRoomMember.objects.get_or_create(room=room, user=user)
+        return created
 
     @database_sync_to_async
     def remove_from_room(self, room, user):
@@ -344,15 +378,12 @@ class ChatConsumer(AsyncWebsocketConsumer):
             is_online=False
         )
 
-    @database_sync_to_async
     def save_message(self, room, user, content, message_type):
-        """Save chat message."""
-        return ChatMessage.objects.create(
-            room=room,
-            user=user,
-            content=content,
-            message_type=message_type
-        )
+        """Build chat message and queue it on the write-behind pipeline."""
+        pipeline = get_message_pipeline()
+        message = pipeline.build(room, user, content, message_type)
+        pipeline.submit(message)
+        return message
 
     def get_room_group_name(self, room):
         return f"room_{room.id}"
@@ -368,7 +399,7 @@ class OnlineUsersConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
-        self.group_name = "online_users"
+        self.group_name = ONLINE_USERS_GROUP
 
         # Join online users group
         await self.channel_layer.group_add(
@@ -378,49 +409,60 @@ class OnlineUsersConsumer(AsyncWebsocketConsumer):
 
         await self.accept()
 
-        # Send current online users list
-        await self.send_online_users()
+        # Send current online users list, or only what changed since the client's last version
+        await self.send_online_users(self.get_since_version())
 
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection."""
+        if not hasattr(self, 'group_name'):
+            return
+        presence.forget(self.channel_name)
         await self.channel_layer.group_discard(
             self.group_name,
             self.channel_name
         )
 
+    async def receive(self, text_data):
+        """Answer heartbeats and resync requests; the online list is otherwise push-only."""
+        try:
+            message = json.loads(text_data)
+        except json.JSONDecodeError:
+            return
+        if not isinstance(message, dict):
+            return
+        if message.get('type') == 'ping':
+            presence.touch(self.channel_name)
+            await self.send(text_data=PONG_FRAME)
+        elif message.get('type') == 'resync':
+            # Sent by a client that missed a version: replay from its last one.
+            since = message.get('since')
+            valid = isinstance(since, int) and not isinstance(since, bool) and since >= 0
+            await self.send_online_users(since if valid else None)
+
+    async def heartbeat_timeout(self, event):
+        """Close a socket that stopped pinging."""
+        await self.close(code=HEARTBEAT_TIMEOUT_CODE)
+
     async def user_online(self, event):
         """Handle user online event."""
-        await self.send(text_data=json.dumps({
-            'type': 'user_online',
-            'user': event['user']
-        }))
+        await self.send(text_data=event['frame'])
 
     async def user_offline(self, event):
         """Handle user offline event."""
-        await self.send(text_data=json.dumps({
-            'type': 'user_offline',
-            'user_id': event['user_id']
-        }))
+        await self.send(text_data=event['frame'])
 
-    @database_sync_to_async
-    def get_online_users(self):
-        """Get list of online users."""
-        records = OnlineUser.objects.select_related('user').order_by('-last_seen')
-        return [
-            {
-                'id': record.user.id,
-                'username': record.user.username,
-                'avatar': record.user.avatar.url if record.user.avatar else None,
-                'last_active': record.last_seen.isoformat(),
-                'status': 'online'
-            }
-            for record in records
-        ]
-
-    async def send_online_users(self):
-        """Send online users list."""
-        users = await self.get_online_users()
-        await self.send(text_data=json.dumps({
-            'type': 'online_users',
-            'users': users
-        }))
+    async def presence_batch(self, event):
+        """Forward several offline transitions released together."""
+        await self.send(text_data=event['frame'])
+
+    def get_since_version(self):
+        """Presence version passed by a reconnecting client as ?since=N."""
+        params = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            return max(int(params['since'][0]), 0)
+        except (KeyError, ValueError):
+            return None
+
+    async def send_online_users(self, since=None):
+        """Send the cached online_users snapshot or an online_users_delta frame."""
+        await self.send(text_data=await presence.aconnect_frame(since))
@@ -0,0 +1,43 @@
+import json
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+def _json_dumps(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+
+
+def _orjson_dumps(payload):
+    return orjson.dumps(payload).decode()
+
+
+def get_encoder(name):
+    """Return a ``payload -> str`` JSON encoder: 'json', 'orjson' or 'auto'."""
+    if name == 'json':
+        return _json_dumps
+    if name == 'orjson':
+        if orjson is None:
+            raise ImproperlyConfigured("CHAT_JSON_ENCODER='orjson' but orjson is not installed")
+        return _orjson_dumps
+    if name == 'auto':
+        return _orjson_dumps if orjson is not None else _json_dumps
+    raise ImproperlyConfigured(f"Unknown CHAT_JSON_ENCODER '{name}'")
+
+
+dumps = get_encoder(settings.CHAT_JSON_ENCODER)
+
+
+def build_event(frame):
+    """
+    Wrap an outbound WebSocket frame as a channel layer event.
+
+    The frame is encoded once by the sender; receiving consumers forward the
+    ``frame`` text as-is instead of re-encoding it per socket.
+    """
+    return {'type': frame['type'], 'frame': dumps(frame)}
@@ -0,0 +1,53 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.chat.frames import get_encoder, orjson
+
+
+def sample_frame(index):
+    return {
+        'type': 'chat_message',
+        'message': {
+            'id': 722927959039236 + index,
+            'room_id': 1,
+            'user': {'id': 42, 'username': '小明', 'avatar': '/media/avatars/42.png'},
+            'content': '今天喝水了吗？记得每小时起来走动一下 ' * 3,
+            'message_type': 'text',
+            'created_at': '2025-11-12T07:07:00.000000+00:00',
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare per-recipient frame encoding with encode-once broadcasts for several room sizes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,1000', help='Comma separated room sizes')
+        parser.add_argument('--messages', type=int, default=200, help='Broadcasts per measurement')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        messages = options['messages']
+        frames = [sample_frame(index) for index in range(messages)]
+
+        strategies = [('per-recipient json.dumps', json.dumps, True)]
+        for name in ('json', 'orjson'):
+            if name == 'orjson' and orjson is None:
+                self.stdout.write('orjson not installed, skipping it')
+                continue
+            strategies.append((f'encode-once {name}', get_encoder(name), False))
+
+        self.stdout.write(f"{'strategy':<28}{'room size':>10}{'us/broadcast':>16}{'encodes':>10}")
+        for size in sizes:
+            for label, encode, per_recipient in strategies:
+                encodes = size if per_recipient else 1
+                started = time.perf_counter()
+                for frame in frames:
+                    for _ in range(encodes):
+                        encode(frame)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{label:<28}{size:>10}{elapsed / messages * 1e6:>16.1f}{encodes:>10}'
+                )
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -41,7 +42,8 @@ class ChatMessage(models.Model):
     )
     reply_to = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='replies')
     is_deleted = models.BooleanField(default=False, verbose_name="是否已删除")
-    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    # Not auto_now_add: the write-behind pipeline assigns the timestamp before the insert.
+    created_at = models.DateTimeField(default=timezone.now, editable=False, verbose_name="创建时间")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
 
     class Meta:
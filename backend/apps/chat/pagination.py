@@ -0,0 +1,116 @@
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from wellness_hub.cache import cache_service
+
+NEWEST_FIRST = ('-created_at', '-id')
+OLDEST_FIRST = ('created_at', 'id')
+
+
+def older_than(anchor):
+    return Q(created_at__lt=anchor['created_at']) | Q(created_at=anchor['created_at'], id__lt=anchor['id'])
+
+
+def newer_than(anchor):
+    return Q(created_at__gt=anchor['created_at']) | Q(created_at=anchor['created_at'], id__gt=anchor['id'])
+
+
+class MessageKeysetPagination(BasePagination):
+    """
+    Keyset pagination for room history on ``(created_at, id)``, newest first.
+
+    Without parameters the newest page is returned. ``before=<id>`` scrolls back,
+    ``after=<id>`` pages forward and ``around=<id>`` centres a page on a message
+    for jump-to-message. Every page is a range scan on the ``(room, -created_at)``
+    index, so deep scrollback costs the same as the first page. ``count`` is cached
+    for CHAT_MESSAGE_COUNT_TTL seconds and may lag slightly behind.
+    """
+
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    anchor_params = ('before', 'after', 'around')
+
+    def __init__(self, room_id, page_size=20):
+        self.room_id = room_id
+        self.page_size = page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.queryset = queryset
+        self.page_size = self.get_page_size(request)
+        self.anchor_param = next((name for name in self.anchor_params if request.query_params.get(name)), None)
+
+        size = self.page_size
+        if self.anchor_param is None:
+            page = list(queryset.order_by(*NEWEST_FIRST)[:size + 1])
+            self.has_older, self.has_newer = len(page) > size, False
+            page = page[:size]
+        elif self.anchor_param == 'before':
+            anchor = self.get_anchor('before')
+            page = list(queryset.filter(older_than(anchor)).order_by(*NEWEST_FIRST)[:size + 1])
+            self.has_older, self.has_newer = len(page) > size, True
+            page = page[:size]
+        elif self.anchor_param == 'after':
+            anchor = self.get_anchor('after')
+            page = list(queryset.filter(newer_than(anchor)).order_by(*OLDEST_FIRST)[:size + 1])
+            self.has_older, self.has_newer = True, len(page) > size
+            page = page[:size][::-1]
+        else:
+            anchor = self.get_anchor('around')
+            newer_size = size // 2
+            older_size = size - newer_size
+            newer = list(queryset.filter(newer_than(anchor)).order_by(*OLDEST_FIRST)[:newer_size + 1])
+            older = list(
+                queryset.filter(Q(id=anchor['id']) | older_than(anchor)).order_by(*NEWEST_FIRST)[:older_size + 1]
+            )
+            self.has_newer = len(newer) > newer_size
+            self.has_older = len(older) > older_size
+            page = newer[:newer_size][::-1] + older[:older_size]
+
+        self.page = page
+        return page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            raise ParseError('page_size 必须是整数')
+        return max(1, min(size, self.max_page_size))
+
+    def get_anchor(self, name):
+        try:
+            message_id = int(self.request.query_params[name])
+        except ValueError:
+            raise ParseError(f'{name} 必须是消息ID')
+        anchor = self.queryset.filter(id=message_id).values('id', 'created_at').first()
+        if anchor is None:
+            raise NotFound('消息不存在')
+        return anchor
+
+    def get_count(self):
+        return cache_service.get_or_set(
+            f'chat:room:{self.room_id}',
+            'message_count',
+            self.queryset.count,
+            settings.CHAT_MESSAGE_COUNT_TTL,
+        )
+
+    def get_next_link(self):
+        if not self.has_older or not self.page:
+            return None
+        return f'?before={self.page[-1].id}&page_size={self.page_size}'
+
+    def get_previous_link(self):
+        if not self.has_newer or not self.page:
+            return None
+        return f'?after={self.page[0].id}&page_size={self.page_size}'
+
+    def get_paginated_response(self, data):
+        return Response({
+            'results': data,
+            'count': self.get_count(),
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        })
@@ -0,0 +1,410 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+
+import redis
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, IntegrityError, InterfaceError, OperationalError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from wellness_hub.db import database_sync_to_async
+from wellness_hub.redis_client import get_redis
+
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+# Message ids are laid out as <ms since ID_EPOCH_MS><worker><sequence> and kept
+# below 2**53 so they survive JSON number parsing in the browser.
+ID_EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+WORKER_BITS = 5
+SEQUENCE_BITS = 8
+WORKER_MASK = (1 << WORKER_BITS) - 1
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+WORKER_SLOTS = 1 << WORKER_BITS
+
+# Errors that say the database is unreachable rather than that a row is bad; the
+# batch is spooled and retried instead of dead-lettered.
+TRANSIENT_DB_ERRORS = (OperationalError, InterfaceError)
+
+# Extend the lease only while this process still holds it.
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class WorkerSlotLease:
+    """
+    Lease on one of the WORKER_SLOTS message id worker slots, held in Redis.
+
+    A process either claims the slot named by CHAT_WORKER_ID, and refuses to
+    start when another process holds it, or takes the first free one. The lease
+    expires after ``ttl`` seconds unless renewed by a background thread, so a
+    crashed worker frees its slot; a process that loses its lease stops
+    handing out ids until it holds a slot again.
+    """
+
+    def __init__(self, ttl, prefix='chat:worker:'):
+        self.ttl = ttl
+        self.prefix = prefix
+        self.holder = f'{socket.gethostname()}:{os.getpid()}:{id(self)}'
+        self.worker_id = None
+        self._lost = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def redis(self):
+        return get_redis()
+
+    def _key(self, worker_id):
+        return f'{self.prefix}{worker_id}'
+
+    def acquire(self, worker_id=None):
+        """Claim ``worker_id`` (or any free slot) and start renewing it. Returns the slot."""
+        if worker_id is not None:
+            if not 0 <= worker_id < WORKER_SLOTS:
+                raise ImproperlyConfigured(f'CHAT_WORKER_ID must be between 0 and {WORKER_SLOTS - 1}')
+            if not self.redis.set(self._key(worker_id), self.holder, nx=True, ex=self.ttl):
+                raise ImproperlyConfigured(
+                    f'CHAT_WORKER_ID={worker_id} is in use by {self.redis.get(self._key(worker_id))}'
+                )
+            slot = worker_id
+        else:
+            slot = next(
+                (candidate for candidate in range(WORKER_SLOTS)
+                 if self.redis.set(self._key(candidate), self.holder, nx=True, ex=self.ttl)),
+                None,
+            )
+            if slot is None:
+                raise ImproperlyConfigured(f'All {WORKER_SLOTS} chat worker slots are leased')
+        self.worker_id = slot
+        self._lost.clear()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._renew_forever, name='chat-worker-lease', daemon=True)
+            self._thread.start()
+        return slot
+
+    @property
+    def held(self):
+        return self.worker_id is not None and not self._lost.is_set()
+
+    def renew(self):
+        """Extend the lease; returns False once another process holds the slot."""
+        if self.worker_id is None:
+            return False
+        renewed = self.redis.eval(RENEW_SCRIPT, 1, self._key(self.worker_id), self.holder, self.ttl)
+        if not renewed:
+            logger.error('Lost the lease on chat worker slot %s', self.worker_id)
+            self._lost.set()
+        return bool(renewed)
+
+    def release(self):
+        self._stopped.set()
+        if self.worker_id is None:
+            return
+        try:
+            self.redis.eval(RELEASE_SCRIPT, 1, self._key(self.worker_id), self.holder)
+        except redis.RedisError:
+            pass
+
+    def _renew_forever(self):
+        while not self._stopped.wait(self.ttl / 3):
+            try:
+                if not self.renew():
+                    self.acquire()
+                    logger.warning('Chat worker moved to slot %s', self.worker_id)
+            except (redis.RedisError, ImproperlyConfigured):
+                logger.exception('Could not renew the chat worker slot lease')
+
+
+class MessageIdGenerator:
+    """Time-ordered id generator so messages have a primary key before they hit the DB."""
+
+    def __init__(self, worker_id):
+        self.worker_id = worker_id & WORKER_MASK
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def next_id(self):
+        with self._lock:
+            now_ms = max(int(time.time() * 1000) - ID_EPOCH_MS, self._last_ms)
+            if now_ms == self._last_ms:
+                self._sequence = (self._sequence + 1) & SEQUENCE_MASK
+                if self._sequence == 0:
+                    # Sequence exhausted for this millisecond, borrow the next one.
+                    now_ms += 1
+            else:
+                self._sequence = 0
+            self._last_ms = now_ms
+            return (
+                (now_ms << (WORKER_BITS + SEQUENCE_BITS))
+                | (self.worker_id << SEQUENCE_BITS)
+                | self._sequence
+            )
+
+
+class MessageWriteBehind:
+    """
+    Write-behind buffer for chat messages.
+
+    Messages are built with a server-assigned id and timestamp, handed back to the
+    caller for immediate broadcast and persisted later with ``bulk_create`` once
+    ``batch_size`` messages are pending or ``flush_interval`` seconds have passed.
+    Batches that cannot be written are spooled to JSON lines under ``spool_dir``
+    and replayed by the next successful flush of any worker. A row the database
+    rejects on its own (bad data, a deleted room) is moved to ``spool_dir/dead``
+    instead, so it cannot block the rows behind it.
+    """
+
+    def __init__(self, batch_size, flush_interval, spool_dir, lease):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_dir = Path(spool_dir)
+        self.lease = lease
+        self.ids = MessageIdGenerator(lease.worker_id)
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._dead_lock = threading.Lock()
+        self._timer = None
+        self._tasks = set()
+        self._replay_pending = True
+        atexit.register(self.close)
+
+    def build(self, room, user, content, message_type='text', reply_to_id=None):
+        """Create an unsaved message carrying its final id and created_at."""
+        if not self.lease.held:
+            raise RuntimeError('消息服务暂不可用，请稍后再试')
+        self.ids.worker_id = self.lease.worker_id
+        return ChatMessage(
+            id=self.ids.next_id(),
+            room=room,
+            user=user,
+            content=content,
+            message_type=message_type,
+            reply_to_id=reply_to_id,
+            created_at=timezone.now(),
+        )
+
+    def submit(self, message):
+        """Queue a message for persistence. Must be called from the event loop."""
+        with self._lock:
+            self._buffer.append(message)
+            pending = len(self._buffer)
+
+        loop = asyncio.get_running_loop()
+        if pending >= self.batch_size:
+            self._cancel_timer()
+            self._schedule_flush(loop)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, self._on_timer, loop)
+
+    async def flush(self):
+        """Persist everything currently buffered."""
+        batch = self._drain()
+        if batch:
+            await database_sync_to_async(self._persist)(batch)
+
+    def close(self):
+        """Synchronously flush the buffer; registered to run at interpreter exit."""
+        self._cancel_timer()
+        batch = self._drain()
+        if batch:
+            self._persist(batch)
+
+    def _on_timer(self, loop):
+        self._timer = None
+        self._schedule_flush(loop)
+
+    def _schedule_flush(self, loop):
+        task = loop.create_task(self._safe_flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _safe_flush(self):
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception('Chat write-behind flush crashed')
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _drain(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        return batch
+
+    def _persist(self, batch):
+        try:
+            if self._replay_pending:
+                self._replay_spool()
+            self._bulk_insert(batch)
+        except TRANSIENT_DB_ERRORS:
+            logger.exception('Chat write-behind flush failed, spooling %d messages', len(batch))
+            self._spool(batch)
+
+    def _bulk_insert(self, messages):
+        try:
+            ChatMessage.objects.bulk_create(messages, batch_size=self.batch_size)
+        except TRANSIENT_DB_ERRORS:
+            raise
+        except DatabaseError:
+            # A single bad row (e.g. its room was deleted) must not poison the batch.
+            for message in messages:
+                try:
+                    ChatMessage.objects.bulk_create([message])
+                except TRANSIENT_DB_ERRORS:
+                    raise
+                except IntegrityError as exc:
+                    if ChatMessage.objects.filter(id=message.id).exists():
+                        logger.error('Chat message id collision on %s, message dropped', message.id)
+                    else:
+                        self._dead_letter([self._to_record(message)], exc)
+                except DatabaseError as exc:
+                    self._dead_letter([self._to_record(message)], exc)
+
+    def _insert_replayed(self, messages):
+        # A spooled batch may have been partially written before it failed; skip
+        # the rows that made it, but report ids taken by a different message.
+        existing = {
+            row['id']: row for row in ChatMessage.objects.filter(
+                id__in=[message.id for message in messages]
+            ).values('id', 'user_id', 'created_at')
+        }
+        pending = []
+        for message in messages:
+            row = existing.get(message.id)
+            if row is None:
+                pending.append(message)
+            elif row['user_id'] != message.user_id or row['created_at'] != message.created_at:
+                logger.error('Chat message id collision on %s, spooled message dropped', message.id)
+        if pending:
+            self._bulk_insert(pending)
+
+    def _spool(self, batch):
+        lines = ''.join(json.dumps(self._to_record(message)) + '\n' for message in batch)
+        with self._spool_lock:
+            try:
+                self._append(self.spool_dir, lines)
+            except OSError:
+                logger.exception('Could not spool %d chat messages, they are lost', len(batch))
+                return
+            self._replay_pending = True
+
+    def _dead_letter(self, records, error):
+        """Set aside messages the database will never accept, with the reason, for manual review."""
+        lines = ''.join(json.dumps({'record': record, 'error': str(error)}) + '\n' for record in records)
+        logger.error('Moving %d unpersistable chat messages to the dead-letter spool: %s', len(records), error)
+        try:
+            with self._dead_lock:
+                self._append(self.spool_dir / 'dead', lines)
+        except OSError:
+            logger.exception('Could not dead-letter %d chat messages, they are lost', len(records))
+
+    def _append(self, directory, lines):
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory / f'{os.getpid()}-{self.ids.worker_id}.jsonl', 'a', encoding='utf-8') as handle:
+            handle.write(lines)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def _replay_spool(self):
+        with self._spool_lock:
+            paths = sorted(self.spool_dir.glob('*.jsonl')) if self.spool_dir.is_dir() else []
+            for path in paths:
+                claimed = path.with_suffix('.replaying')
+                try:
+                    # Renaming claims the file so concurrent workers do not replay it twice.
+                    os.replace(path, claimed)
+                except FileNotFoundError:
+                    continue
+                try:
+                    messages = self._read_spool(claimed)
+                    self._insert_replayed(messages)
+                except TRANSIENT_DB_ERRORS:
+                    os.replace(claimed, path)
+                    raise
+                except Exception:
+                    # Retrying a file that fails for any other reason would block every later flush.
+                    logger.exception('Could not replay %s, moving it to the dead-letter spool', path.name)
+                    dead_dir = self.spool_dir / 'dead'
+                    dead_dir.mkdir(parents=True, exist_ok=True)
+                    os.replace(claimed, dead_dir / f'{path.stem}-{int(time.time())}.jsonl')
+                    continue
+                claimed.unlink()
+                logger.info('Replayed %d spooled chat messages from %s', len(messages), path.name)
+            self._replay_pending = False
+
+    def _read_spool(self, path):
+        messages = []
+        with open(path, encoding='utf-8') as handle:
+            for line in handle:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    messages.append(self._from_record(dict(record)))
+                except (ValueError, TypeError, KeyError) as exc:
+                    self._dead_letter([line.rstrip('\n')], exc)
+        return messages
+
+    @staticmethod
+    def _to_record(message):
+        return {
+            'id': message.id,
+            'room_id': message.room_id,
+            'user_id': message.user_id,
+            'content': message.content,
+            'message_type': message.message_type,
+            'reply_to_id': message.reply_to_id,
+            'created_at': message.created_at.isoformat(),
+        }
+
+    @staticmethod
+    def _from_record(record):
+        record['created_at'] = parse_datetime(record['created_at'])
+        return ChatMessage(**record)
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_message_pipeline():
+    """Return the process-wide write-behind pipeline."""
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                lease = WorkerSlotLease(ttl=settings.CHAT_WORKER_LEASE_TTL)
+                lease.acquire(settings.CHAT_WORKER_ID)
+                atexit.register(lease.release)
+                _pipeline = MessageWriteBehind(
+                    batch_size=settings.CHAT_MESSAGE_BATCH_SIZE,
+                    flush_interval=settings.CHAT_MESSAGE_FLUSH_INTERVAL,
+                    spool_dir=settings.CHAT_MESSAGE_SPOOL_DIR,
+                    lease=lease,
+                )
+    return _pipeline
@@ -0,0 +1,449 @@
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from wellness_hub.db import database_sync_to_async
+from wellness_hub.redis_client import get_redis
+from .frames import dumps
+from .models import ChatRoomMember, OnlineUser
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+ONLINE_USERS_GROUP = 'online_users'
+
+# Every online/offline transition bumps ``version`` and is stored in ``deltas`` as the
+# exact JSON frame that gets broadcast, so reconnecting clients can replay them.
+
+# Shared by both scripts: forget the room of every socket no longer in ``conns`` and
+# take the user out of each such room none of their remaining sockets is in.
+PRUNE_ROOMS = """
+local function prune_rooms(conns, socket_rooms, prefix, user_id)
+  local entries = redis.call('HGETALL', socket_rooms)
+  local dropped, kept = {}, {}
+  for i = 1, #entries, 2 do
+    if redis.call('ZSCORE', conns, entries[i]) then
+      kept[entries[i + 1]] = true
+    else
+      redis.call('HDEL', socket_rooms, entries[i])
+      dropped[entries[i + 1]] = true
+    end
+  end
+  for room_id in pairs(dropped) do
+    if not kept[room_id] then redis.call('SREM', prefix .. 'room:' .. room_id, user_id) end
+  end
+end
+"""
+
+# KEYS: conns, online, card, socket rooms, room members, room index, version, deltas
+# ARGV: channel, expires_at, now, user_id, card json, conns key ttl, room_id,
+#       frame user json, deltas kept, key prefix
+CONNECT_SCRIPT = PRUNE_ROOMS + """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[3])
+local live = redis.call('ZCARD', KEYS[1])
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[4])
+redis.call('SET', KEYS[3], ARGV[5])
+if ARGV[7] ~= '' then
+  redis.call('HSET', KEYS[4], ARGV[1], ARGV[7])
+end
+prune_rooms(KEYS[1], KEYS[4], ARGV[10], ARGV[4])
+if ARGV[7] ~= '' then
+  redis.call('SADD', KEYS[5], ARGV[4])
+  redis.call('SADD', KEYS[6], ARGV[7])
+end
+if live > 0 then return false end
+local version = redis.call('INCR', KEYS[7])
+local frame = '{"type":"user_online","version":' .. version .. ',"user":' .. ARGV[8] .. '}'
+redis.call('ZADD', KEYS[8], version, frame)
+redis.call('ZREMRANGEBYRANK', KEYS[8], 0, -tonumber(ARGV[9]) - 1)
+return frame
+"""
+
+# KEYS: conns, online, socket rooms, version, deltas
+# ARGV: channel ('' when reaping), now, user_id, key prefix, deltas kept
+DISCONNECT_SCRIPT = PRUNE_ROOMS + """
+if ARGV[1] ~= '' then redis.call('ZREM', KEYS[1], ARGV[1]) end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+prune_rooms(KEYS[1], KEYS[3], ARGV[4], ARGV[3])
+if redis.call('ZCARD', KEYS[1]) > 0 then return false end
+local removed = redis.call('ZREM', KEYS[2], ARGV[3])
+if removed == 0 then return false end
+local version = redis.call('INCR', KEYS[4])
+local frame = '{"type":"user_offline","version":' .. version .. ',"user_id":' .. ARGV[3] .. '}'
+redis.call('ZADD', KEYS[5], version, frame)
+redis.call('ZREMRANGEBYRANK', KEYS[5], 0, -tonumber(ARGV[5]) - 1)
+return frame
+"""
+
+
+class PresenceRegistry:
+    """
+    Redis-backed registry of online users.
+
+    Every socket is a member of ``conns:<user_id>`` scored by its expiry, so a user
+    with several tabs stays online until the last one goes away. The owning worker
+    re-arms its sockets every ``ttl / 3`` seconds; when a worker dies its entries
+    simply expire and the next ``expire_stale`` pass on any worker reports those
+    users offline. ``online`` is scored by the last refresh and backs listings,
+    ``room:<room_id>`` holds the online user ids per chat room. Rooms are tracked
+    per socket in ``socket_rooms:<user_id>`` (channel -> room id), so a user with
+    tabs in two rooms leaves one as soon as its last tab there closes.
+
+    Transitions are versioned: clients get a snapshot tagged with ``version`` and
+    can later resume with only the deltas after it (see ``resume_frame``). The
+    encoded snapshot is cached per worker until the version moves.
+
+    The User / ChatRoomMember ``is_online`` flags and OnlineUser rows are no longer
+    written on connect; ``snapshot_to_db`` mirrors the registry into them every
+    PRESENCE_SNAPSHOT_INTERVAL seconds for code that still reads the tables, and
+    ``reap_stale_rows`` clears rows no snapshot has refreshed (every worker gone).
+
+    Clients send ``ping`` frames (see ``touch``). Pings only update memory; the
+    periodic refresh writes them out in one batch. Once a socket has pinged, its
+    lease is only re-armed while pings keep coming, so abandoned connections
+    expire and are closed even though the worker holding them is alive.
+    """
+
+    def __init__(self, ttl, snapshot_interval, deltas_kept, prefix='presence:'):
+        self.ttl = ttl
+        self.snapshot_interval = snapshot_interval
+        self.deltas_kept = deltas_kept
+        self.prefix = prefix
+        self._snapshot_frame = (None, None)  # (version, encoded online_users frame)
+        self._local = {}  # channel_name -> user_id for sockets owned by this worker
+        self._pings = {}  # channel_name -> monotonic time of the socket's last ping
+        self._task = None
+        self._connect_script = None
+        self._disconnect_script = None
+
+    @property
+    def redis(self):
+        return get_redis()
+
+    def _key(self, *parts):
+        return self.prefix + ':'.join(str(part) for part in parts)
+
+    def _scripts(self):
+        if self._connect_script is None:
+            self._connect_script = self.redis.register_script(CONNECT_SCRIPT)
+            self._disconnect_script = self.redis.register_script(DISCONNECT_SCRIPT)
+        return self._connect_script, self._disconnect_script
+
+    @staticmethod
+    def user_card(user):
+        return {
+            'id': user.id,
+            'username': user.username,
+            'avatar': user.avatar.url if user.avatar else None,
+        }
+
+    def connect(self, user, channel_name, room_id=None):
+        """Register a socket; returns the user_online frame if this is the user's first live socket."""
+        connect_script, _ = self._scripts()
+        now = time.time()
+        card = self.user_card(user)
+        frame_user = dict(card, last_active=_isoformat(now), status='online')
+        frame = connect_script(
+            keys=[
+                self._key('conns', user.id),
+                self._key('online'),
+                self._key('card', user.id),
+                self._key('socket_rooms', user.id),
+                self._key('room', room_id or ''),
+                self._key('room_index'),
+                self._key('version'),
+                self._key('deltas'),
+            ],
+            args=[
+                channel_name, now + self.ttl, now, user.id,
+                json.dumps(card), int(self.ttl * 2),
+                room_id or '', dumps(frame_user), self.deltas_kept, self.prefix,
+            ],
+        )
+        self._local[channel_name] = user.id
+        return frame
+
+    def disconnect(self, user_id, channel_name):
+        """Drop a socket; returns the user_offline frame once the user has no live sockets left."""
+        self._local.pop(channel_name, None)
+        self._pings.pop(channel_name, None)
+        return self._release(user_id, channel_name, time.time())
+
+    def _release(self, user_id, channel_name, now):
+        _, disconnect_script = self._scripts()
+        return disconnect_script(
+            keys=[
+                self._key('conns', user_id),
+                self._key('online'),
+                self._key('socket_rooms', user_id),
+                self._key('version'),
+                self._key('deltas'),
+            ],
+            args=[channel_name, now, user_id, self.prefix, self.deltas_kept],
+        )
+
+    def heartbeat(self, user_id, channel_name):
+        """Extend a single socket's lease."""
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zadd(self._key('conns', user_id), {channel_name: now + self.ttl}, xx=True)
+        pipe.zadd(self._key('online'), {user_id: now}, xx=True)
+        pipe.execute()
+
+    def touch(self, channel_name):
+        """Record a ping from a socket on this worker. Call from the event loop."""
+        self._pings[channel_name] = time.monotonic()
+        self._ensure_running()
+
+    def forget(self, channel_name):
+        """Stop tracking pings of a socket that is not in the registry (online list watchers)."""
+        self._pings.pop(channel_name, None)
+
+    def silent_channels(self):
+        """Sockets that pinged before but not within ``ttl`` seconds."""
+        cutoff = time.monotonic() - self.ttl
+        return {channel_name for channel_name, last_ping in self._pings.items() if last_ping < cutoff}
+
+    def refresh_local(self, skip=()):
+        """Extend the lease of every socket owned by this worker, except ``skip``, in one round trip."""
+        sockets = [(channel_name, user_id) for channel_name, user_id in self._local.items() if channel_name not in skip]
+        if not sockets:
+            return
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        for channel_name, user_id in sockets:
+            pipe.zadd(self._key('conns', user_id), {channel_name: now + self.ttl}, xx=True)
+            pipe.zadd(self._key('online'), {user_id: now}, xx=True)
+        pipe.execute()
+
+    def expire_stale(self):
+        """Release users whose sockets all expired (crashed workers); returns their user_offline frames."""
+        now = time.time()
+        candidates = self.redis.zrangebyscore(self._key('online'), '-inf', now - self.ttl)
+        frames = (self._release(user_id, '', now) for user_id in candidates)
+        return [frame for frame in frames if frame]
+
+    def online_users(self):
+        """Cards of everyone online, most recently active first."""
+        return self.snapshot()[1]
+
+    def snapshot(self):
+        """Return ``(version, users)`` read atomically."""
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.get(self._key('version'))
+        pipe.zrevrangebyscore(self._key('online'), '+inf', time.time() - self.ttl, withscores=True)
+        version, entries = pipe.execute()
+        if not entries:
+            return int(version or 0), []
+        cards = self.redis.mget([self._key('card', user_id) for user_id, _ in entries])
+        users = []
+        for (user_id, last_seen), card in zip(entries, cards):
+            if card is None:
+                continue
+            data = json.loads(card)
+            data['last_active'] = _isoformat(last_seen)
+            data['status'] = 'online'
+            users.append(data)
+        return int(version or 0), users
+
+    def current_version(self):
+        return int(self.redis.get(self._key('version')) or 0)
+
+    def snapshot_frame(self):
+        """Encoded ``online_users`` frame, rebuilt only when the version changed."""
+        version = self.current_version()
+        cached_version, frame = self._snapshot_frame
+        if cached_version == version:
+            return frame
+        version, users = self.snapshot()
+        frame = dumps({'type': 'online_users', 'version': version, 'users': users})
+        self._snapshot_frame = (version, frame)
+        return frame
+
+    def resume_frame(self, since):
+        """
+        Encoded ``online_users_delta`` frame with every transition after ``since``,
+        or None when those deltas were already trimmed and a full snapshot is needed.
+        """
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.get(self._key('version'))
+        pipe.zrange(self._key('deltas'), 0, 0, withscores=True)
+        pipe.zrangebyscore(self._key('deltas'), f'({since}', '+inf')
+        version, oldest, deltas = pipe.execute()
+        version = int(version or 0)
+        if since > version:
+            return None
+        if since < version and (not oldest or oldest[0][1] > since + 1):
+            return None
+        return (
+            f'{{"type":"online_users_delta","version":{version},"since":{since},'
+            f'"deltas":[{",".join(deltas)}]}}'
+        )
+
+    def is_online(self, user_id):
+        score = self.redis.zscore(self._key('online'), user_id)
+        return score is not None and score > time.time() - self.ttl
+
+    def room_online_counts(self, room_ids):
+        """Map room id -> number of online users in it."""
+        pipe = self.redis.pipeline(transaction=False)
+        for room_id in room_ids:
+            pipe.scard(self._key('room', room_id))
+        return dict(zip(room_ids, pipe.execute()))
+
+    def snapshot_to_db(self):
+        """Mirror the registry into OnlineUser rows and the is_online flags."""
+        users = self.online_users()
+        online_ids = [user['id'] for user in users]
+        room_ids = [int(room_id) for room_id in self.redis.smembers(self._key('room_index'))]
+        pipe = self.redis.pipeline(transaction=False)
+        for room_id in room_ids:
+            pipe.smembers(self._key('room', room_id))
+        room_members = dict(zip(room_ids, pipe.execute()))
+
+        with transaction.atomic():
+            OnlineUser.objects.exclude(user_id__in=online_ids).delete()
+            OnlineUser.objects.bulk_create(
+                [OnlineUser(user_id=user_id, channel_name=f'presence:{user_id}') for user_id in online_ids],
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['last_seen'],
+            )
+            User.objects.filter(is_online=True).exclude(id__in=online_ids).update(is_online=False)
+            User.objects.filter(id__in=online_ids, is_online=False).update(is_online=True)
+            ChatRoomMember.objects.filter(is_online=True).exclude(user_id__in=online_ids).update(is_online=False)
+            for room_id, members in room_members.items():
+                ChatRoomMember.objects.filter(room_id=room_id, is_online=True).exclude(
+                    user_id__in=members
+                ).update(is_online=False)
+                ChatRoomMember.objects.filter(room_id=room_id, user_id__in=members, is_online=False).update(
+                    is_online=True
+                )
+
+    def reap_stale_rows(self):
+        """
+        Remove OnlineUser rows no snapshot refreshed for ``snapshot_interval + ttl`` seconds.
+
+        Finds them through the ``last_seen`` index, skips users the registry still
+        has online, and clears the is_online flags of the rest, all in bulk (the
+        delete sends no per-row signals). Returns the ids of the users reaped.
+        """
+        cutoff = timezone.now() - timedelta(seconds=self.snapshot_interval + self.ttl)
+        user_ids = list(OnlineUser.objects.filter(last_seen__lt=cutoff).values_list('user_id', flat=True))
+        if not user_ids:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.zscore(self._key('online'), user_id)
+        online_since = time.time() - self.ttl
+        gone = [
+            user_id for user_id, score in zip(user_ids, pipe.execute())
+            if score is None or score <= online_since
+        ]
+        if gone:
+            with transaction.atomic():
+                OnlineUser.objects.filter(user_id__in=gone, last_seen__lt=cutoff).delete()
+                User.objects.filter(id__in=gone, is_online=True).update(is_online=False)
+                ChatRoomMember.objects.filter(user_id__in=gone, is_online=True).update(is_online=False)
+        return gone
+
+    async def aconnect(self, user, channel_name, room_id=None):
+        came_online = await sync_to_async(self.connect, thread_sensitive=False)(user, channel_name, room_id)
+        self._ensure_running()
+        return came_online
+
+    async def adisconnect(self, user_id, channel_name):
+        return await sync_to_async(self.disconnect, thread_sensitive=False)(user_id, channel_name)
+
+    async def aconnect_frame(self, since=None):
+        """Frame for a new OnlineUsersConsumer: deltas after ``since`` when possible, else a snapshot."""
+        if since is not None:
+            frame = await sync_to_async(self.resume_frame, thread_sensitive=False)(since)
+            if frame is not None:
+                return frame
+        return await sync_to_async(self.snapshot_frame, thread_sensitive=False)()
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        last_snapshot = 0.0
+        while self._local or self._pings:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                silent = self.silent_channels()
+                await sync_to_async(self.refresh_local, thread_sensitive=False)(silent)
+                await close_silent(silent)
+                for channel_name in silent:
+                    self._pings.pop(channel_name, None)
+                expired = await sync_to_async(self.expire_stale, thread_sensitive=False)()
+                await broadcast_offline_batch(expired)
+                if self.snapshot_interval and time.monotonic() - last_snapshot >= self.snapshot_interval:
+                    last_snapshot = time.monotonic()
+                    if await sync_to_async(self.claim_snapshot, thread_sensitive=False)():
+                        await database_sync_to_async(self.snapshot_to_db)()
+            except Exception:
+                logger.exception('Presence maintenance failed')
+
+    def claim_snapshot(self):
+        # Only one worker per interval writes the snapshot.
+        return bool(self.redis.set(
+            self._key('snapshot_lock'), 1, nx=True, ex=max(int(self.snapshot_interval), 1)
+        ))
+
+
+def _isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc).isoformat()
+
+
+presence = PresenceRegistry(
+    ttl=settings.PRESENCE_TTL,
+    snapshot_interval=settings.PRESENCE_SNAPSHOT_INTERVAL,
+    deltas_kept=settings.PRESENCE_DELTAS_KEPT,
+)
+
+
+async def broadcast_online(frame):
+    """Fan out a user_online frame produced by the registry."""
+    await get_channel_layer().group_send(ONLINE_USERS_GROUP, {'type': 'user_online', 'frame': frame})
+
+
+async def broadcast_offline(frame):
+    """Fan out a user_offline frame produced by the registry."""
+    await get_channel_layer().group_send(ONLINE_USERS_GROUP, {'type': 'user_offline', 'frame': frame})
+
+
+async def broadcast_offline_batch(frames):
+    """
+    Fan out several user_offline frames as one ``online_users_batch`` frame.
+
+    The batched versions need not be consecutive (other workers' transitions may
+    fall between them), so each delta keeps its own version and clients that
+    find a gap ask for a resync instead of assuming a contiguous range.
+    """
+    if len(frames) <= 1:
+        for frame in frames:
+            await broadcast_offline(frame)
+        return
+    frame = f'{{"type":"online_users_batch","deltas":[{",".join(frames)}]}}'
+    await get_channel_layer().group_send(ONLINE_USERS_GROUP, {'type': 'presence_batch', 'frame': frame})
+
+
+async def close_silent(channel_names):
+    """Ask the consumers of sockets that stopped pinging to close them."""
+    layer = get_channel_layer()
+    for channel_name in channel_names:
+        await layer.send(channel_name, {'type': 'heartbeat_timeout'})
@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone as dt_timezone
+from functools import reduce
+from operator import or_
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import Case, DateTimeField, F, Q, Value, When
+
+from wellness_hub.db import database_sync_to_async
+from wellness_hub.redis_client import get_redis
+from .frames import build_event
+from .models import ChatMessage, ChatRoomMember
+
+logger = logging.getLogger(__name__)
+
+# Read cursors and message positions are microseconds since the epoch, i.e. the
+# same instant as ChatMessage.created_at / ChatRoomMember.last_read_at.
+
+# KEYS: room messages, sender's cursors
+# ARGV: message id, created_at us, messages kept, room id
+RECORD_SCRIPT = """
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -tonumber(ARGV[3]) - 1)
+local current = redis.call('HGET', KEYS[2], ARGV[4])
+if current and tonumber(current) >= tonumber(ARGV[2]) then return 0 end
+redis.call('HSET', KEYS[2], ARGV[4], ARGV[2])
+return 1
+"""
+
+# KEYS: room messages, user's cursors
+# ARGV: room id, cursor us
+# Returns {cursor, unread, advanced}; cursors never move backwards.
+MARK_READ_SCRIPT = """
+local cursor = tonumber(ARGV[2])
+local current = redis.call('HGET', KEYS[2], ARGV[1])
+local advanced = 0
+if current and tonumber(current) >= cursor then
+  cursor = tonumber(current)
+else
+  redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+  advanced = 1
+end
+local unread = redis.call('ZCOUNT', KEYS[1], '(' .. string.format('%d', cursor), '+inf')
+return {string.format('%d', cursor), unread, advanced}
+"""
+
+
+def user_group_name(user_id):
+    """Channel layer group holding every chat socket of one user."""
+    return f'chat_user_{user_id}'
+
+
+def to_micros(value):
+    return int(value.timestamp() * 1_000_000)
+
+
+def from_micros(value):
+    return datetime.fromtimestamp(int(value) / 1_000_000, tz=dt_timezone.utc)
+
+
+class ReadCursors:
+    """
+    Per-user read cursors and per-room unread counters kept in Redis.
+
+    ``messages:<room_id>`` is a sorted set of the newest ``messages_kept`` message
+    ids scored by ``created_at``, and ``cursors:<user_id>`` maps room id to the
+    ``created_at`` of the last message the user has read. Unread counts are a
+    ``ZCOUNT`` above the cursor, so they are capped at ``messages_kept``. Rooms
+    without a Redis cursor fall back to ``ChatRoomMember.last_read_at``.
+
+    Cursor moves are mirrored into ``last_read_at`` at most once per
+    ``flush_interval`` seconds per worker, in a single UPDATE.
+    """
+
+    def __init__(self, messages_kept, flush_interval, prefix='chat:read:'):
+        self.messages_kept = messages_kept
+        self.flush_interval = flush_interval
+        self.prefix = prefix
+        self._pending = {}  # (user_id, room_id) -> last_read_at waiting to be written
+        self._lock = threading.Lock()
+        self._task = None
+        self._record_script = None
+        self._mark_read_script = None
+
+    @property
+    def redis(self):
+        return get_redis()
+
+    def _key(self, *parts):
+        return self.prefix + ':'.join(str(part) for part in parts)
+
+    def _scripts(self):
+        if self._record_script is None:
+            self._record_script = self.redis.register_script(RECORD_SCRIPT)
+            self._mark_read_script = self.redis.register_script(MARK_READ_SCRIPT)
+        return self._record_script, self._mark_read_script
+
+    def record_message(self, message, defer=False):
+        """
+        Count a new message as unread for everyone but its author.
+
+        With ``defer`` the author's ``last_read_at`` is left for the next flush
+        instead of being written right away.
+        """
+        record_script, _ = self._scripts()
+        advanced = record_script(
+            keys=[self._key('messages', message.room_id), self._key('cursors', message.user_id)],
+            args=[message.id, to_micros(message.created_at), self.messages_kept, message.room_id],
+        )
+        if advanced:
+            self._queue(message.user_id, message.room_id, message.created_at, defer)
+
+    def mark_read(self, user_id, room_id, read_at, defer=False):
+        """
+        Advance the user's cursor in a room to ``read_at``.
+
+        Returns ``(last_read_at, unread, advanced)`` as seen after the update.
+        """
+        _, mark_read_script = self._scripts()
+        cursor, unread, advanced = mark_read_script(
+            keys=[self._key('messages', room_id), self._key('cursors', user_id)],
+            args=[room_id, to_micros(read_at)],
+        )
+        last_read_at = from_micros(cursor)
+        if advanced:
+            self._queue(user_id, room_id, last_read_at, defer)
+        return last_read_at, int(unread), bool(advanced)
+
+    def message_time(self, room_id, message_id):
+        """``created_at`` of a message, from the room's tracked set when possible."""
+        score = self.redis.zscore(self._key('messages', room_id), message_id)
+        if score is not None:
+            return from_micros(score)
+        return ChatMessage.objects.filter(room_id=room_id, id=message_id).values_list(
+            'created_at', flat=True
+        ).first()
+
+    def unread_counts(self, user_id):
+        """Unread count and read cursor for every room the user belongs to."""
+        members = list(
+            ChatRoomMember.objects.filter(user_id=user_id).values_list('room_id', 'last_read_at')
+        )
+        if not members:
+            return []
+        cursors = self.redis.hgetall(self._key('cursors', user_id))
+
+        rooms = []
+        pipe = self.redis.pipeline(transaction=False)
+        for room_id, last_read_at in members:
+            cursor = cursors.get(str(room_id))
+            if cursor is not None:
+                last_read_at = from_micros(cursor)
+            rooms.append({'room_id': room_id, 'last_read_at': last_read_at})
+            low = f'({to_micros(last_read_at)}' if last_read_at else '-inf'
+            pipe.zcount(self._key('messages', room_id), low, '+inf')
+        for room, unread in zip(rooms, pipe.execute()):
+            room['unread'] = unread
+        return rooms
+
+    def forget(self, user_id, room_id):
+        """Drop a user's cursor after they leave a room."""
+        self.redis.hdel(self._key('cursors', user_id), room_id)
+
+    def _queue(self, user_id, room_id, last_read_at, defer):
+        with self._lock:
+            self._pending[(user_id, room_id)] = last_read_at
+        if not defer:
+            self.flush()
+
+    def flush(self):
+        """Write pending cursors to ``ChatRoomMember.last_read_at`` in one UPDATE."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        # Only ever move last_read_at forward, whichever worker flushes first.
+        conditions = [
+            Q(user_id=user_id, room_id=room_id) & (Q(last_read_at__isnull=True) | Q(last_read_at__lt=read_at))
+            for (user_id, room_id), read_at in pending.items()
+        ]
+        ChatRoomMember.objects.filter(reduce(or_, conditions)).update(last_read_at=Case(
+            *[
+                When(user_id=user_id, room_id=room_id, then=Value(read_at))
+                for (user_id, room_id), read_at in pending.items()
+            ],
+            default=F('last_read_at'),
+            output_field=DateTimeField(),
+        ))
+
+    async def _run(self):
+        while self._pending:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await database_sync_to_async(self.flush)()
+            except Exception:
+                logger.exception('Failed to write chat read cursors')
+
+    def _ensure_running(self):
+        if self._pending and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def arecord_message(self, message):
+        await sync_to_async(self.record_message, thread_sensitive=False)(message, defer=True)
+        self._ensure_running()
+
+    async def amark_read(self, user_id, room_id, read_at):
+        result = await sync_to_async(self.mark_read, thread_sensitive=False)(
+            user_id, room_id, read_at, defer=True
+        )
+        self._ensure_running()
+        return result
+
+    async def amessage_time(self, room_id, message_id):
+        return await database_sync_to_async(self.message_time)(room_id, message_id)
+
+    async def aunread_counts(self, user_id):
+        return await database_sync_to_async(self.unread_counts)(user_id)
+
+
+read_cursors = ReadCursors(
+    messages_kept=settings.CHAT_UNREAD_TRACKED,
+    flush_interval=settings.CHAT_READ_FLUSH_INTERVAL,
+)
+
+
+def read_cursor_frame(room_id, last_read_at, unread):
+    return {
+        'type': 'read_cursor',
+        'room_id': room_id,
+        'last_read_at': last_read_at.isoformat() if last_read_at else None,
+        'unread': unread,
+    }
+
+
+def unread_counts_frame(rooms):
+    return {
+        'type': 'unread_counts',
+        'rooms': [
+            dict(room, last_read_at=room['last_read_at'].isoformat() if room['last_read_at'] else None)
+            for room in rooms
+        ],
+    }
+
+
+async def abroadcast_read_cursor(user_id, frame):
+    """Tell every chat socket of a user that one of their cursors moved."""
+    await get_channel_layer().group_send(user_group_name(user_id), build_event(frame))
+
+
+def broadcast_read_cursor(user_id, frame):
+    async_to_sync(abroadcast_read_cursor)(user_id, frame)
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import threading
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from wellness_hub.cache import GROUP_REFRESH
+
+logger = logging.getLogger(__name__)
+
+# One listener channel per chat worker process joins this group (see RoomCache.listen).
+ROOM_CACHE_GROUP = 'chat_room_cache'
+
+
+class RoomCache:
+    """
+    Process-wide cache of resolved ChatRoom objects and room member id sets.
+
+    Entries expire after ``ttl`` seconds as a safety net for writes that bypass
+    the invalidation helpers below (admin, shell). Member sets are stored with the
+    generation they were loaded under so a load racing an invalidation is dropped;
+    consumers tag their per-connection copies the same way.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rooms = {}
+        self._members = {}
+        self._generations = {}
+        self._task = None
+
+    def get_room(self, key):
+        with self._lock:
+            entry = self._rooms.get(key)
+            if entry and entry[1] > time.monotonic():
+                return entry[0]
+            return None
+
+    def set_room(self, key, room):
+        with self._lock:
+            self._rooms[key] = (room, time.monotonic() + self.ttl)
+
+    def generation(self, room_id):
+        with self._lock:
+            return self._generations.get(room_id, 0)
+
+    def get_members(self, room_id):
+        with self._lock:
+            entry = self._members.get(room_id)
+            if entry and entry[1] > time.monotonic():
+                return entry[0]
+            return None
+
+    def set_members(self, room_id, user_ids, generation):
+        with self._lock:
+            if self._generations.get(room_id, 0) != generation:
+                return
+            self._members[room_id] = (frozenset(user_ids), time.monotonic() + self.ttl)
+
+    def invalidate(self, room_id, members_only=True):
+        with self._lock:
+            self._generations[room_id] = self._generations.get(room_id, 0) + 1
+            self._members.pop(room_id, None)
+            if not members_only:
+                for key in [k for k, (room, _) in self._rooms.items() if room.id == room_id]:
+                    del self._rooms[key]
+
+    def listen(self):
+        """Start receiving invalidations on the running event loop (once per process)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self):
+        layer = get_channel_layer()
+        channel = await layer.new_channel()
+        joined_at = None
+        while True:
+            try:
+                if joined_at is None or time.monotonic() - joined_at >= GROUP_REFRESH:
+                    await layer.group_add(ROOM_CACHE_GROUP, channel)
+                    joined_at = time.monotonic()
+                try:
+                    event = await asyncio.wait_for(layer.receive(channel), GROUP_REFRESH)
+                except asyncio.TimeoutError:
+                    continue
+                if event.get('type') == 'room_cache.invalidate':
+                    self.invalidate(event['room_id'], event['members_only'])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Room cache invalidation listener failed')
+                await asyncio.sleep(1)
+
+
+room_cache = RoomCache(ttl=settings.CHAT_ROOM_CACHE_TTL)
+
+
+def _invalidation_event(room_id, members_only):
+    return {
+        'type': 'room_cache.invalidate',
+        'room_id': room_id,
+        'members_only': members_only,
+    }
+
+
+def invalidate_room(room_id, members_only=True):
+    """Drop cached room state locally and on every chat worker."""
+    room_cache.invalidate(room_id, members_only)
+    async_to_sync(get_channel_layer().group_send)(
+        ROOM_CACHE_GROUP, _invalidation_event(room_id, members_only)
+    )
+
+
+async def ainvalidate_room(room_id, members_only=True):
+    """Async variant of invalidate_room for consumers."""
+    room_cache.invalidate(room_id, members_only)
+    await get_channel_layer().group_send(
+        ROOM_CACHE_GROUP, _invalidation_event(room_id, members_only)
+    )
@@ -1,12 +1,19 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from apps.users.cards import build_author_card, get_author_cards
 from .models import ChatRoom, ChatMessage, ChatRoomMember
 
 User = get_user_model()
 
 
 class ChatRoomSerializer(serializers.ModelSerializer):
-    """Chat room serializer."""
+    """
+    Chat room serializer.
+
+    Listings avoid per-room queries by passing ``online_counts`` ({room_id: n}) and
+    ``member_room_ids`` in the context and by annotating ``created_by_username``
+    (ChatRoomViewSet.get_queryset also annotates ``is_member``).
+    """
     member_count = serializers.SerializerMethodField()
     is_member = serializers.SerializerMethodField()
     created_by_username = serializers.SerializerMethodField()
@@ -18,10 +25,18 @@ class ChatRoomSerializer(serializers.ModelSerializer):
 
     def get_member_count(self, obj):
         """Get member count."""
+        online_counts = self.context.get('online_counts')
+        if online_counts is not None:
+            return online_counts.get(obj.id, 0)
         return obj.members.filter(is_online=True).count()
 
     def get_is_member(self, obj):
         """Check if current user is member."""
+        member_room_ids = self.context.get('member_room_ids')
+        if member_room_ids is not None:
+            return obj.id in member_room_ids
+        if hasattr(obj, 'is_member'):
+            return obj.is_member
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return ChatRoomMember.objects.filter(
@@ -32,11 +47,42 @@ class ChatRoomSerializer(serializers.ModelSerializer):
 
     def get_created_by_username(self, obj):
         """Get created by username."""
+        if hasattr(obj, 'created_by_username'):
+            return obj.created_by_username
         return obj.created_by.username if obj.created_by else None
 
 
+def build_message_context(messages, request=None):
+    """
+    Serializer context that hydrates a page of messages in bulk.
+
+    Replied-to messages are loaded in one query and every author card (message and
+    reply authors) comes from the author card cache, so serializing a page costs at
+    most two queries regardless of its size.
+    """
+    reply_ids = {message.reply_to_id for message in messages if message.reply_to_id}
+    replies = {}
+    if reply_ids:
+        replies = {
+            reply.id: reply
+            for reply in ChatMessage.objects.filter(id__in=reply_ids).only('id', 'content', 'user_id')
+        }
+    author_ids = {message.user_id for message in messages}
+    author_ids.update(reply.user_id for reply in replies.values())
+    return {
+        'request': request,
+        'author_cards': get_author_cards(author_ids),
+        'replies': replies,
+    }
+
+
 class ChatMessageSerializer(serializers.ModelSerializer):
-    """Chat message serializer."""
+    """
+    Chat message serializer.
+
+    List views should pass ``build_message_context(page)`` as context; without it
+    authors and replies are loaded per message.
+    """
     user_info = serializers.SerializerMethodField()
     reply_to_info = serializers.SerializerMethodField()
 
@@ -47,21 +93,29 @@ class ChatMessageSerializer(serializers.ModelSerializer):
 
     def get_user_info(self, obj):
         """Get user info."""
-        return {
-            'id': obj.user.id,
-            'username': obj.user.username,
-            'avatar': obj.user.avatar.url if obj.user.avatar else None
-        }
+        cards = self.context.get('author_cards')
+        if cards is not None and obj.user_id in cards:
+            return cards[obj.user_id]
+        return build_author_card(obj.user)
 
     def get_reply_to_info(self, obj):
         """Get reply message info."""
-        if obj.reply_to:
-            return {
-                'id': obj.reply_to.id,
-                'content': obj.reply_to.content[:50] + '...' if len(obj.reply_to.content) > 50 else obj.reply_to.content,
-                'user': obj.reply_to.user.username
-            }
-        return None
+        if not obj.reply_to_id:
+            return None
+        replies = self.context.get('replies')
+        if replies is None:
+            reply = obj.reply_to
+            username = reply.user.username
+        else:
+            reply = replies.get(obj.reply_to_id)
+            if reply is None:
+                return None
+            username = self.context['author_cards'][reply.user_id]['username']
+        return {
+            'id': reply.id,
+            'content': reply.content[:50] + '...' if len(reply.content) > 50 else reply.content,
+            'user': username
+        }
 
 
 class ChatRoomMemberSerializer(serializers.ModelSerializer):
@@ -0,0 +1,19 @@
+from asgiref.sync import async_to_sync
+from celery import shared_task
+
+from .presence import broadcast_offline_batch, presence
+
+
+@shared_task(idempotency_key='expire', idempotency_ttl=10)
+def expire_presence():
+    """
+    Release users whose sockets all expired and reap OnlineUser rows left behind.
+
+    ASGI workers expire and snapshot presence while they hold sockets; this
+    covers the time no worker does. The users released are announced in one
+    batched offline delta. Returns the number of users released.
+    """
+    frames = presence.expire_stale()
+    async_to_sync(broadcast_offline_batch)(frames)
+    presence.reap_stale_rows()
+    return len(frames)
@@ -0,0 +1,615 @@
+import asyncio
+import json
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+import redis
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DataError, OperationalError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from apps.users.cards import author_cards
+from wellness_hub.cache import cache_service
+from wellness_hub.redis_client import get_redis
+from .models import ChatMessage, ChatRoom, ChatRoomMember, OnlineUser
+from .consumers import ChatConsumer, OnlineUsersConsumer
+from .pipeline import MessageWriteBehind, WorkerSlotLease, SEQUENCE_BITS, WORKER_MASK
+from .room_cache import ROOM_CACHE_GROUP, _invalidation_event, room_cache
+from .presence import ONLINE_USERS_GROUP, broadcast_offline_batch, broadcast_online, presence
+from .read_state import read_cursors
+from .tasks import expire_presence
+from .typing_state import TypingAggregator
+from .views import DEFAULT_ROOM_NAME, ChatRoomViewSet
+
+User = get_user_model()
+
+
+class MessageListQueryCountTests(TestCase):
+    """A page of messages is hydrated in a fixed number of queries, replies included."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [User.objects.create_user(username=f'author{n}', password='x') for n in range(3)]
+        cls.user = cls.authors[0]
+        cls.room = ChatRoom.objects.create(name='测试房间', created_by=cls.user)
+        cls.lounge = ChatRoom.objects.create(name=DEFAULT_ROOM_NAME, created_by=cls.user)
+        for room in (cls.room, cls.lounge):
+            ChatRoomMember.objects.create(room=room, user=cls.user)
+            cls.add_messages(room, 12)
+
+    @classmethod
+    def add_messages(cls, room, count):
+        previous = None
+        for n in range(count):
+            # Every other message replies to the one before it, by a different author.
+            previous = ChatMessage.objects.create(
+                room=room,
+                user=cls.authors[n % len(cls.authors)],
+                content=f'消息 {n}',
+                reply_to=previous if n % 2 else None,
+            )
+
+    def setUp(self):
+        cache.clear()
+        cache_service._local.clear()
+        cache_service._versions.clear()
+        author_cards.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_page_hydrated(self, data, size):
+        self.assertEqual(len(data['results']), size)
+        replies = [message for message in data['results'] if message['reply_to']]
+        self.assertTrue(replies)
+        for message in replies:
+            self.assertIsNotNone(message['reply_to_info'])
+        for message in data['results']:
+            self.assertEqual(message['user_info']['id'], message['user'])
+
+    def test_room_viewset_messages(self):
+        view = ChatRoomViewSet.as_view({'get': 'messages'})
+        request = APIRequestFactory().get(f'/api/chat/rooms/{self.room.id}/messages/', {'page_size': 10})
+        force_authenticate(request, self.user)
+        # room, membership, page, replied-to messages, author cards, count
+        with self.assertNumQueries(6):
+            response = view(request, pk=self.room.id)
+            response.render()
+        self.assertEqual(response.status_code, 200)
+        self.assert_page_hydrated(response.data, 10)
+
+    def test_message_list_view(self):
+        # room, membership, page, replied-to messages, author cards, count
+        with self.assertNumQueries(6):
+            response = self.client.get(f'/api/chat/rooms/{self.room.id}/messages/', {'page_size': 10})
+        self.assertEqual(response.status_code, 200)
+        self.assert_page_hydrated(response.data, 10)
+
+    def test_default_room_messages(self):
+        # default room, membership, page, replied-to messages, author cards, count
+        with self.assertNumQueries(6):
+            response = self.client.get('/api/chat/rooms/default/messages/')
+        self.assertEqual(response.status_code, 200)
+        self.assert_page_hydrated(response.data, 12)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.add_messages(self.room, 40)
+        with self.assertNumQueries(6):
+            response = self.client.get(f'/api/chat/rooms/{self.room.id}/messages/', {'page_size': 50})
+        self.assert_page_hydrated(response.data, 50)
+
+    def test_cached_author_cards_and_count_skip_queries(self):
+        url = f'/api/chat/rooms/{self.room.id}/messages/'
+        self.client.get(url, {'page_size': 10})
+        # room, membership, page, replied-to messages
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {'page_size': 10})
+        self.assert_page_hydrated(response.data, 10)
+
+
+class ExpirePresenceTaskTests(TestCase):
+    """expire_presence under eager Celery: batched release, reaping, retries and idempotency keys."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(username=f'ghost{n}', password='x', is_online=True) for n in range(2)]
+
+    def setUp(self):
+        get_redis().flushall()
+
+    def connect_expired(self, user):
+        # Registered long enough ago for every lease to have run out.
+        with mock.patch('apps.chat.presence.time.time', return_value=time.time() - 3 * presence.ttl):
+            presence.connect(user, f'channel-{user.id}')
+
+    def test_releases_expired_users_in_one_broadcast(self):
+        for user in self.users:
+            self.connect_expired(user)
+        layer = mock.Mock(group_send=mock.AsyncMock())
+        with mock.patch('apps.chat.presence.get_channel_layer', return_value=layer):
+            self.assertEqual(expire_presence.delay().get(), 2)
+        layer.group_send.assert_called_once()
+        group, event = layer.group_send.call_args.args
+        self.assertEqual(group, ONLINE_USERS_GROUP)
+        self.assertEqual(event['type'], 'presence_batch')
+        frame = json.loads(event['frame'])
+        self.assertEqual(frame['type'], 'online_users_batch')
+        self.assertEqual({delta['user_id'] for delta in frame['deltas']}, {user.id for user in self.users})
+        self.assertEqual(len({delta['version'] for delta in frame['deltas']}), 2)
+        self.assertFalse(any(presence.is_online(user.id) for user in self.users))
+
+    def test_reaps_stale_rows(self):
+        for user in self.users:
+            OnlineUser.objects.create(user=user, channel_name=f'channel-{user.id}')
+        OnlineUser.objects.update(last_seen=timezone.now() - timedelta(hours=1))
+        expire_presence.delay().get()
+        self.assertFalse(OnlineUser.objects.exists())
+        self.assertFalse(User.objects.filter(id__in=[user.id for user in self.users], is_online=True).exists())
+
+    def test_retries_redis_errors(self):
+        with mock.patch.object(presence, 'expire_stale', side_effect=[redis.ConnectionError('down'), []]) as expire:
+            self.assertEqual(expire_presence.delay().get(), 0)
+        self.assertEqual(expire.call_count, 2)
+
+    def test_duplicate_runs_are_skipped(self):
+        with mock.patch.object(presence, 'expire_stale', return_value=[]) as expire:
+            self.assertEqual(expire_presence.delay().get(), 0)
+            self.assertIsNone(expire_presence.delay().get())
+        expire.assert_called_once()
+
+
+class OnlineUsersConsumerTests(SimpleTestCase):
+    """Versioned presence frames: broadcasts, batches, resync requests and ?since= resumes."""
+
+    def setUp(self):
+        get_redis().flushall()
+        self.watcher = User(id=900, username='watcher')
+        self.users = [User(id=901 + n, username=f'member{n}') for n in range(2)]
+
+    async def connect(self, path='/ws/online/'):
+        communicator = WebsocketCommunicator(OnlineUsersConsumer.as_asgi(), path)
+        communicator.scope['user'] = self.watcher
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_resync_and_resume_replay_missed_transitions(self):
+        communicator = await self.connect()
+        snapshot = await communicator.receive_json_from()
+        self.assertEqual(snapshot['type'], 'online_users')
+        since = snapshot['version']
+
+        for user in self.users:
+            await broadcast_online(await sync_to_async(presence.connect)(user, f'channel-{user.id}'))
+        online = [await communicator.receive_json_from() for _ in self.users]
+        self.assertEqual([frame['version'] for frame in online], [since + 1, since + 2])
+
+        await communicator.send_json_to({'type': 'resync', 'since': since})
+        delta = await communicator.receive_json_from()
+        self.assertEqual(delta['type'], 'online_users_delta')
+        self.assertEqual((delta['since'], delta['version']), (since, since + 2))
+        self.assertEqual([frame['user']['id'] for frame in delta['deltas']], [user.id for user in self.users])
+        await communicator.disconnect()
+
+        resumed = await self.connect(f'/ws/online/?since={since + 1}')
+        delta = await resumed.receive_json_from()
+        self.assertEqual(delta['type'], 'online_users_delta')
+        self.assertEqual([frame['version'] for frame in delta['deltas']], [since + 2])
+        await resumed.disconnect()
+
+    async def test_offline_batch_keeps_each_version(self):
+        communicator = await self.connect()
+        await communicator.receive_json_from()
+        frames = []
+        for user in self.users:
+            await sync_to_async(presence.connect)(user, f'channel-{user.id}')
+        for user in self.users:
+            frames.append(await sync_to_async(presence.disconnect)(user.id, f'channel-{user.id}'))
+        await broadcast_offline_batch(frames)
+        batch = await communicator.receive_json_from()
+        self.assertEqual(batch['type'], 'online_users_batch')
+        versions = [json.loads(frame)['version'] for frame in frames]
+        self.assertEqual([frame['version'] for frame in batch['deltas']], versions)
+        await communicator.disconnect()
+
+
+class MessagePipelineTests(TransactionTestCase):
+    """Write-behind batching, spooling through outages, dead-lettering bad rows and the worker lease."""
+
+    def setUp(self):
+        get_redis().flushall()
+        self.user = User.objects.create_user(username='writer', password='x')
+        self.room = ChatRoom.objects.create(name='写入测试', created_by=self.user)
+        self.spool_dir = tempfile.mkdtemp(prefix='chat-spool-')
+        self.addCleanup(shutil.rmtree, self.spool_dir, True)
+        self.lease = WorkerSlotLease(ttl=30)
+        self.lease.acquire()
+        self.addCleanup(self.lease.release)
+        self.pipeline = MessageWriteBehind(
+            batch_size=3, flush_interval=0.05, spool_dir=self.spool_dir, lease=self.lease
+        )
+
+    def build(self, count, **kwargs):
+        return [self.pipeline.build(self.room, self.user, f'消息 {n}', **kwargs) for n in range(count)]
+
+    def spooled(self, subdir=''):
+        directory = self.pipeline.spool_dir / subdir
+        return [line for path in directory.glob('*.jsonl') for line in path.read_text().splitlines()]
+
+    def test_ids_are_ordered_and_carry_the_leased_slot(self):
+        ids = [message.id for message in self.build(5)]
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertTrue(all((value >> SEQUENCE_BITS) & WORKER_MASK == self.lease.worker_id for value in ids))
+
+    async def test_full_batch_flushes_at_once(self):
+        with mock.patch.object(self.pipeline, '_persist') as persist:
+            for message in self.build(3):
+                self.pipeline.submit(message)
+            await asyncio.gather(*self.pipeline._tasks)
+        persist.assert_called_once()
+        self.assertEqual(len(persist.call_args.args[0]), 3)
+        self.assertIsNone(self.pipeline._timer)
+
+    async def test_timer_flushes_partial_batch(self):
+        with mock.patch.object(self.pipeline, '_persist') as persist:
+            self.pipeline.submit(self.build(1)[0])
+            persist.assert_not_called()
+            await asyncio.sleep(self.pipeline.flush_interval * 3)
+            await asyncio.gather(*self.pipeline._tasks)
+        persist.assert_called_once()
+        self.assertEqual(len(persist.call_args.args[0]), 1)
+
+    def test_outage_spools_and_next_flush_replays(self):
+        with mock.patch.object(ChatMessage.objects, 'bulk_create', side_effect=OperationalError('down')):
+            self.pipeline._persist(self.build(3))
+        self.assertEqual(len(self.spooled()), 3)
+        self.assertFalse(ChatMessage.objects.exists())
+
+        self.pipeline._persist(self.build(2))
+        self.assertEqual(ChatMessage.objects.count(), 5)
+        self.assertEqual(self.spooled(), [])
+
+    def test_replay_skips_rows_already_written(self):
+        batch = self.build(3)
+        ChatMessage.objects.bulk_create(batch[:1])
+        self.pipeline._spool(batch)
+        self.pipeline._persist([])
+        self.assertEqual(ChatMessage.objects.count(), 3)
+
+    def test_bad_rows_are_dead_lettered_without_blocking_the_batch(self):
+        bulk_create = ChatMessage.objects.bulk_create
+
+        def strict(messages, **kwargs):
+            # What PostgreSQL does with a value longer than the column allows.
+            if any(len(message.message_type) > 20 for message in messages):
+                raise DataError('value too long for type character varying(20)')
+            return bulk_create(messages, **kwargs)
+
+        batch = self.build(2) + self.build(1, message_type='x' * 30)
+        with mock.patch.object(ChatMessage.objects, 'bulk_create', side_effect=strict):
+            self.pipeline._persist(batch)
+            self.pipeline._persist(self.build(1))
+        self.assertEqual(ChatMessage.objects.count(), 3)
+        self.assertEqual(self.spooled(), [])
+        dead = [json.loads(line) for line in self.spooled('dead')]
+        self.assertEqual([entry['record']['id'] for entry in dead], [batch[-1].id])
+
+    def test_unreadable_spool_lines_are_dead_lettered(self):
+        self.pipeline._spool(self.build(1))
+        with open(self.pipeline.spool_dir / 'broken.jsonl', 'w') as handle:
+            handle.write('{"id": 1, "room_id"\n')
+        self.pipeline._persist(self.build(1))
+        self.assertEqual(ChatMessage.objects.count(), 2)
+        self.assertEqual(self.spooled(), [])
+        self.assertEqual(len(self.spooled('dead')), 1)
+
+    def test_lost_lease_stops_new_messages(self):
+        get_redis().delete(self.lease._key(self.lease.worker_id))
+        self.assertFalse(self.lease.renew())
+        self.assertFalse(self.lease.held)
+        with self.assertRaises(RuntimeError):
+            self.build(1)
+        self.lease.acquire()
+        self.assertTrue(self.lease.held)
+        self.assertEqual(len(self.build(1)), 1)
+
+    def test_configured_worker_id_in_use_is_refused(self):
+        other = WorkerSlotLease(ttl=30)
+        with self.assertRaises(ImproperlyConfigured):
+            other.acquire(self.lease.worker_id)
+
+
+class ChatMessageValidationTests(SimpleTestCase):
+    """Malformed chat frames are rejected before they reach the write-behind pipeline."""
+
+    async def rejects(self, frame, error):
+        consumer = ChatConsumer()
+        consumer.user = User(id=1, username='sender')
+        consumer.send_error = mock.AsyncMock()
+        with mock.patch('apps.chat.consumers.get_message_pipeline') as pipeline:
+            await consumer.handle_chat_message(frame)
+        consumer.send_error.assert_called_once_with(error)
+        pipeline.assert_not_called()
+
+    async def test_unknown_message_type(self):
+        await self.rejects({'content': 'hi', 'message_type': 'x' * 30}, 'Invalid message type')
+        await self.rejects({'content': 'hi', 'message_type': ['text']}, 'Invalid message type')
+        await self.rejects({'content': 'hi', 'message_type': 'system'}, 'Invalid message type')
+
+    async def test_non_string_content(self):
+        await self.rejects({'content': {'text': 'hi'}}, 'Content must be a string')
+
+
+class RoomCacheListenerTests(SimpleTestCase):
+    """Room cache invalidations reach each process through a single listener channel."""
+
+    async def test_listener_applies_remote_invalidations(self):
+        room_id = 4242
+        room_cache.set_members(room_id, {1, 2}, room_cache.generation(room_id))
+        room_cache.listen()
+        self.addCleanup(setattr, room_cache, '_task', None)
+        task = room_cache._task
+        room_cache.listen()
+        self.assertIs(room_cache._task, task)
+        try:
+            layer = get_channel_layer()
+            while not layer.groups.get(ROOM_CACHE_GROUP):
+                await asyncio.sleep(0.01)
+            self.assertEqual(len(layer.groups[ROOM_CACHE_GROUP]), 1)
+            generation = room_cache.generation(room_id)
+            # Sent by another process: nothing invalidated locally beforehand.
+            await layer.group_send(ROOM_CACHE_GROUP, _invalidation_event(room_id, True))
+            for _ in range(100):
+                if room_cache.generation(room_id) != generation:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertIsNone(room_cache.get_members(room_id))
+            self.assertEqual(room_cache.generation(room_id), generation + 1)
+        finally:
+            task.cancel()
+
+
+class PresenceRoomTests(SimpleTestCase):
+    """Room online counts follow each socket, not just the user's last one."""
+
+    def setUp(self):
+        get_redis().flushall()
+        self.user = User(id=950, username='tabs')
+
+    def counts(self):
+        return presence.room_online_counts([1, 2])
+
+    def test_closing_one_tab_leaves_only_its_room(self):
+        presence.connect(self.user, 'tab-a', 1)
+        presence.connect(self.user, 'tab-b', 2)
+        self.assertEqual(self.counts(), {1: 1, 2: 1})
+        self.assertIsNone(presence.disconnect(self.user.id, 'tab-a'))
+        self.assertEqual(self.counts(), {1: 0, 2: 1})
+        self.assertTrue(presence.is_online(self.user.id))
+        self.assertIsNotNone(presence.disconnect(self.user.id, 'tab-b'))
+        self.assertEqual(self.counts(), {1: 0, 2: 0})
+
+    def test_room_kept_while_another_tab_is_in_it(self):
+        presence.connect(self.user, 'tab-a', 1)
+        presence.connect(self.user, 'tab-b', 1)
+        presence.disconnect(self.user.id, 'tab-a')
+        self.assertEqual(self.counts(), {1: 1, 2: 0})
+
+    def test_expired_tab_leaves_its_room(self):
+        with mock.patch('apps.chat.presence.time.time', return_value=time.time() - 3 * presence.ttl):
+            presence.connect(self.user, 'tab-a', 1)
+        presence.connect(self.user, 'tab-b', 2)
+        self.assertEqual(self.counts(), {1: 0, 2: 1})
+
+
+class MessageKeysetPaginationTests(TestCase):
+    """Keyset pages over ``(created_at, id)``: newest, before, after, around and bad cursors."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='scroller', password='x')
+        cls.room = ChatRoom.objects.create(name='分页测试', created_by=cls.user)
+        ChatRoomMember.objects.create(room=cls.room, user=cls.user)
+        # Shared timestamps so ordering falls through to the id tiebreak.
+        stamp = timezone.now() - timedelta(minutes=5)
+        messages = [ChatMessage.objects.create(room=cls.room, user=cls.user, content=f'消息 {n}') for n in range(10)]
+        for message in messages:
+            message.created_at = stamp
+        ChatMessage.objects.bulk_update(messages, ['created_at'])
+        cls.ids = [message.id for message in reversed(messages)]
+
+    def setUp(self):
+        cache.clear()
+        cache_service._local.clear()
+        cache_service._versions.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/chat/rooms/{self.room.id}/messages/'
+
+    def page(self, **params):
+        response = self.client.get(self.url, {'page_size': 4, **params})
+        self.assertEqual(response.status_code, 200)
+        return [message['id'] for message in response.data['results']], response.data
+
+    def test_newest_page(self):
+        ids, data = self.page()
+        self.assertEqual(ids, self.ids[:4])
+        self.assertEqual(data['count'], 10)
+        self.assertEqual(data['next'], f'?before={self.ids[3]}&page_size=4')
+        self.assertIsNone(data['previous'])
+
+    def test_before_scrolls_back_to_the_oldest(self):
+        ids, data = self.page(before=self.ids[3])
+        self.assertEqual(ids, self.ids[4:8])
+        ids, data = self.page(before=self.ids[7])
+        self.assertEqual(ids, self.ids[8:])
+        self.assertIsNone(data['next'])
+        self.assertEqual(data['previous'], f'?after={self.ids[8]}&page_size=4')
+
+    def test_after_pages_forward_newest_first(self):
+        ids, data = self.page(after=self.ids[8])
+        self.assertEqual(ids, self.ids[4:8])
+        self.assertIsNotNone(data['previous'])
+        ids, data = self.page(after=self.ids[2])
+        self.assertEqual(ids, self.ids[:2])
+        self.assertIsNone(data['previous'])
+
+    def test_around_centres_on_the_anchor(self):
+        ids, data = self.page(around=self.ids[5])
+        self.assertEqual(ids, self.ids[3:7])
+        self.assertIsNotNone(data['next'])
+        self.assertIsNotNone(data['previous'])
+        ids, data = self.page(around=self.ids[0])
+        self.assertEqual(ids, self.ids[:2])
+        self.assertIsNone(data['previous'])
+
+    def test_invalid_cursors(self):
+        response = self.client.get(self.url, {'before': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.url, {'page_size': 'many'})
+        self.assertEqual(response.status_code, 400)
+        other = ChatRoom.objects.create(name='别的房间', created_by=self.user)
+        foreign = ChatMessage.objects.create(room=other, user=self.user, content='不在这里')
+        response = self.client.get(self.url, {'around': foreign.id})
+        self.assertEqual(response.status_code, 404)
+
+
+class ReadCursorTests(TestCase):
+    """Read cursors: unread counts, monotonic moves, the coalesced flush and the mark-read endpoint."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader = [User.objects.create_user(username=f'reader{n}', password='x') for n in range(2)]
+        cls.room = ChatRoom.objects.create(name='已读测试', created_by=cls.author)
+        for user in (cls.author, cls.reader):
+            ChatRoomMember.objects.create(room=cls.room, user=user)
+        start = timezone.now() - timedelta(minutes=10)
+        cls.messages = [
+            ChatMessage.objects.create(room=cls.room, user=cls.author, content=f'消息 {n}')
+            for n in range(3)
+        ]
+        for n, message in enumerate(cls.messages):
+            message.created_at = start + timedelta(minutes=n)
+        ChatMessage.objects.bulk_update(cls.messages, ['created_at'])
+
+    def setUp(self):
+        get_redis().flushall()
+        read_cursors._pending.clear()
+        for message in self.messages:
+            read_cursors.record_message(message)
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def unread(self, user):
+        return {room['room_id']: room['unread'] for room in read_cursors.unread_counts(user.id)}[self.room.id]
+
+    def last_read_at(self, user):
+        return ChatRoomMember.objects.get(room=self.room, user=user).last_read_at
+
+    def test_new_messages_are_unread_for_everyone_but_the_author(self):
+        self.assertEqual(self.unread(self.reader), 3)
+        self.assertEqual(self.unread(self.author), 0)
+        self.assertEqual(self.last_read_at(self.author), self.messages[-1].created_at)
+
+    def test_cursor_never_moves_backwards(self):
+        read_cursors.mark_read(self.reader.id, self.room.id, self.messages[1].created_at)
+        result = read_cursors.mark_read(self.reader.id, self.room.id, self.messages[0].created_at)
+        self.assertEqual(result, (self.messages[1].created_at, 1, False))
+        self.assertEqual(self.last_read_at(self.reader), self.messages[1].created_at)
+
+    def test_deferred_moves_flush_in_one_update(self):
+        for message in self.messages:
+            read_cursors.mark_read(self.reader.id, self.room.id, message.created_at, defer=True)
+        self.assertIsNone(self.last_read_at(self.reader))
+        with self.assertNumQueries(1):
+            read_cursors.flush()
+        self.assertEqual(self.last_read_at(self.reader), self.messages[-1].created_at)
+        # A flush carrying an older cursor (from another worker) leaves it in place.
+        read_cursors._pending[(self.reader.id, self.room.id)] = self.messages[0].created_at
+        read_cursors.flush()
+        self.assertEqual(self.last_read_at(self.reader), self.messages[-1].created_at)
+
+    def test_mark_read_endpoint(self):
+        url = f'/api/chat/rooms/{self.room.id}/read/'
+        response = self.client.post(url, {'message_id': self.messages[1].id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['unread'], 1)
+        self.assertEqual(self.client.post(url, {'message_id': 10 ** 15}, format='json').status_code, 404)
+        response = self.client.post(url, {}, format='json')
+        self.assertEqual(response.data['unread'], 0)
+
+    def test_mark_read_rejects_non_integer_ids(self):
+        url = f'/api/chat/rooms/{self.room.id}/read/'
+        for message_id in ('abc', [1], {'id': 1}):
+            response = self.client.post(url, {'message_id': message_id}, format='json')
+            self.assertEqual(response.status_code, 400)
+
+
+class TypingAggregatorTests(SimpleTestCase):
+    """Typing updates coalesce into one frame per room per tick; stops and expiries are announced."""
+
+    def setUp(self):
+        self.aggregator = TypingAggregator(tick=0.01, ttl=6.0)
+        self.users = [User(id=960 + n, username=f'typist{n}') for n in range(2)]
+        self.now = 1000.0
+
+    def update(self, user, is_typing, at):
+        with mock.patch('apps.chat.typing_state.time.monotonic', return_value=at), \
+                mock.patch.object(self.aggregator, '_ensure_running'):
+            self.aggregator.update('room_1', 1, user, is_typing)
+
+    def collect(self, at):
+        return [frame for _, frame, _ in self.aggregator._collect(at)]
+
+    def test_updates_within_a_tick_share_one_frame(self):
+        for user in self.users:
+            self.update(user, True, self.now)
+        self.update(self.users[0], True, self.now + 0.1)
+        frames = self.collect(self.now + 0.5)
+        self.assertEqual(len(frames), 1)
+        self.assertEqual([user['id'] for user in frames[0]['users']], [user.id for user in self.users])
+        self.assertEqual((frames[0]['stopped'], frames[0]['ttl']), ([], 6.0))
+
+    def test_repeated_updates_only_reannounce_every_half_ttl(self):
+        self.update(self.users[0], True, self.now)
+        self.collect(self.now + 0.5)
+        self.update(self.users[0], True, self.now + 1)
+        self.assertEqual(self.collect(self.now + 1.5), [])
+        self.update(self.users[0], True, self.now + 3)
+        self.assertEqual(len(self.collect(self.now + 3.5)), 1)
+
+    def test_stop_is_announced_and_room_dropped(self):
+        self.update(self.users[0], True, self.now)
+        self.collect(self.now + 0.5)
+        self.update(self.users[0], False, self.now + 1)
+        [frame] = self.collect(self.now + 1.5)
+        self.assertEqual((frame['users'], frame['stopped']), ([], [self.users[0].id]))
+        self.assertEqual(self.aggregator._rooms, {})
+
+    def test_silent_typists_expire_after_ttl(self):
+        for user in self.users:
+            self.update(user, True, self.now)
+        self.collect(self.now + 0.5)
+        self.update(self.users[1], True, self.now + 4)
+        [frame] = self.collect(self.now + 6.5)
+        self.assertEqual([user['id'] for user in frame['users']], [self.users[1].id])
+        self.assertEqual(frame['stopped'], [self.users[0].id])
+
+    async def test_ticks_broadcast_to_the_room_group(self):
+        layer = mock.Mock(group_send=mock.AsyncMock())
+        with mock.patch('apps.chat.typing_state.get_channel_layer', return_value=layer):
+            self.aggregator.update('room_1', 1, self.users[0], True)
+            self.aggregator.update('room_1', 1, self.users[0], False)
+            await self.aggregator._task
+        group, event = layer.group_send.call_args.args
+        self.assertEqual(group, 'room_1')
+        self.assertEqual(json.loads(event['frame'])['stopped'], [self.users[0].id])
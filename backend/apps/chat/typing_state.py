@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import time
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .frames import build_event
+
+logger = logging.getLogger(__name__)
+
+
+class RoomTypingState:
+    """Users typing in one room on this worker."""
+
+    def __init__(self, group):
+        self.group = group
+        self.users = {}  # user_id -> (username, expires_at)
+        self.stopped = set()
+        self.dirty = False
+        self.announced_at = 0.0
+
+
+class TypingAggregator:
+    """
+    Coalesces typing indicators into at most one frame per room per tick.
+
+    Repeated ``is_typing=true`` updates only refresh the user's expiry; a frame is
+    emitted when someone starts or stops typing, when an entry expires, and every
+    ``ttl / 2`` seconds while anyone is still typing so clients can expire users
+    that stop being re-announced. Each frame lists the users typing on this worker
+    plus the ids that stopped since the previous frame.
+    """
+
+    def __init__(self, tick, ttl):
+        self.tick = tick
+        self.ttl = ttl
+        self._rooms = {}
+        self._task = None
+
+    def update(self, group, room_id, user, is_typing):
+        now = time.monotonic()
+        state = self._rooms.get(room_id)
+        if state is None:
+            if not is_typing:
+                return
+            state = self._rooms[room_id] = RoomTypingState(group)
+
+        if is_typing:
+            if user.id not in state.users:
+                state.dirty = True
+                state.stopped.discard(user.id)
+            state.users[user.id] = (user.username, now + self.ttl)
+        elif state.users.pop(user.id, None) is not None:
+            state.stopped.add(user.id)
+            state.dirty = True
+
+        self._ensure_running()
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        channel_layer = get_channel_layer()
+        while self._rooms:
+            await asyncio.sleep(self.tick)
+            for room_id, frame, group in self._collect(time.monotonic()):
+                try:
+                    await channel_layer.group_send(group, build_event(frame))
+                except Exception:
+                    logger.exception('Failed to broadcast typing state for room %s', room_id)
+
+    def _collect(self, now):
+        frames = []
+        for room_id, state in list(self._rooms.items()):
+            for user_id, (_, expires_at) in list(state.users.items()):
+                if expires_at <= now:
+                    del state.users[user_id]
+                    state.stopped.add(user_id)
+                    state.dirty = True
+
+            refresh_due = state.users and now - state.announced_at >= self.ttl / 2
+            if state.dirty or refresh_due:
+                frames.append((room_id, {
+                    'type': 'typing',
+                    'room_id': room_id,
+                    'users': [
+                        {'id': user_id, 'username': username}
+                        for user_id, (username, _) in state.users.items()
+                    ],
+                    'stopped': sorted(state.stopped),
+                    'ttl': self.ttl,
+                }, state.group))
+                state.stopped = set()
+                state.dirty = False
+                state.announced_at = now
+
+            if not state.users and not state.stopped:
+                del self._rooms[room_id]
+        return frames
+
+
+typing_aggregator = TypingAggregator(
+    tick=settings.CHAT_TYPING_TICK,
+    ttl=settings.CHAT_TYPING_TTL,
+)
@@ -2,22 +2,52 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Q, Count
-from .models import ChatRoom, ChatMessage, ChatRoomMember, OnlineUser
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from wellness_hub.cache import cache_service, cached_view
+from .models import ChatRoom, ChatMessage, ChatRoomMember
+from .pagination import MessageKeysetPagination
+from .presence import presence
+from .read_state import read_cursors, read_cursor_frame, broadcast_read_cursor
+from .room_cache import invalidate_room
 from .serializers import (
     ChatRoomSerializer,
     ChatMessageSerializer,
-    ChatRoomMemberSerializer
+    ChatRoomMemberSerializer,
+    build_message_context
 )
 
 User = get_user_model()
 DEFAULT_ROOM_NAME = 'Wellness Hub Lounge'
+PUBLIC_ROOMS_CACHE_NAMESPACE = 'chat:public_rooms'
+# Seconds the online user list may be served from cache; clients follow live changes over WebSocket.
+ONLINE_USERS_CACHE_TTL = 2
+
+
+def get_public_rooms():
+    """Public rooms with their creator's username, cached until a room changes."""
+    return cache_service.get_or_set(
+        PUBLIC_ROOMS_CACHE_NAMESPACE,
+        'all',
+        lambda: list(
+            ChatRoom.objects.filter(is_public=True)
+            .annotate(created_by_username=F('created_by__username'))
+            .order_by('id')
+        ),
+        settings.CHAT_PUBLIC_ROOMS_CACHE_TTL,
+    )
+
+
+def invalidate_public_rooms():
+    cache_service.invalidate(PUBLIC_ROOMS_CACHE_NAMESPACE)
 
 
 def ensure_default_room(user):
     """Ensure the global lounge room exists and the user is a member."""
-    room, _ = ChatRoom.objects.get_or_create(
+    room, room_created = ChatRoom.objects.get_or_create(
         name=DEFAULT_ROOM_NAME,
         defaults={
             'description': '全站公共聊天室',
@@ -26,11 +56,15 @@ def ensure_default_room(user):
             'max_members': 1000
         }
     )
-    ChatRoomMember.objects.get_or_create(
+    if room_created:
+        invalidate_public_rooms()
+    _, created = ChatRoomMember.objects.get_or_create(
         room=room,
         user=user,
         defaults={'role': 'member'}
     )
+    if created:
+        invalidate_room(room.id)
     return room
 
 
@@ -42,13 +76,54 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Get queryset based on user."""
         user = self.request.user
-        return ChatRoom.objects.filter(
-            Q(is_public=True) | Q(members__user=user)
-        ).distinct()
+        membership = ChatRoomMember.objects.filter(room=OuterRef('pk'), user=user)
+        return ChatRoom.objects.filter(Q(is_public=True) | Exists(membership)).annotate(
+            is_member=Exists(membership),
+            created_by_username=F('created_by__username'),
+        )
+
+    def list(self, request, *args, **kwargs):
+        """
+        List public rooms plus the private rooms the user belongs to.
+
+        Public rooms come from the cached directory and the user's rooms from one
+        query; online counts are read from the presence registry.
+        """
+        member_rooms = list(
+            ChatRoom.objects.filter(members__user=request.user)
+            .annotate(created_by_username=F('created_by__username'))
+            .order_by('id')
+        )
+        member_room_ids = {room.id for room in member_rooms}
+        rooms = get_public_rooms() + [room for room in member_rooms if not room.is_public]
+
+        page = self.paginate_queryset(rooms)
+        shown = rooms if page is None else page
+        context = self.get_serializer_context()
+        context['member_room_ids'] = member_room_ids
+        context['online_counts'] = presence.room_online_counts([room.id for room in shown])
+        serializer = ChatRoomSerializer(shown, many=True, context=context)
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
 
     def perform_create(self, serializer):
         """Create new chat room."""
         serializer.save(created_by=self.request.user)
+        invalidate_public_rooms()
+
+    def perform_update(self, serializer):
+        """Update chat room and drop cached copies."""
+        room = serializer.save()
+        invalidate_room(room.id, members_only=False)
+        invalidate_public_rooms()
+
+    def perform_destroy(self, instance):
+        """Delete chat room and drop cached copies."""
+        room_id = instance.id
+        instance.delete()
+        invalidate_room(room_id, members_only=False)
+        invalidate_public_rooms()
 
     @action(detail=True, methods=['post'])
     def join(self, request, pk=None):
@@ -61,6 +136,7 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
         )
 
         if created:
+            invalidate_room(room.id)
             return Response({'message': '成功加入聊天室'})
         else:
             return Response({'message': '您已在聊天室中'})
@@ -69,7 +145,10 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
     def leave(self, request, pk=None):
         """Leave chat room."""
         room = self.get_object()
-        ChatRoomMember.objects.filter(room=room, user=request.user).delete()
+        deleted, _ = ChatRoomMember.objects.filter(room=room, user=request.user).delete()
+        if deleted:
+            invalidate_room(room.id)
+            read_cursors.forget(request.user.id, room.id)
         return Response({'message': '已离开聊天室'})
 
     @action(detail=True, methods=['get'])
@@ -81,10 +160,10 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
         if not ChatRoomMember.objects.filter(room=room, user=request.user).exists():
             return Response({'error': '不是聊天室成员'}, status=403)
 
-        messages = room.messages.filter(is_deleted=False).order_by('-created_at')
-        page = self.paginate_queryset(messages)
-        serializer = ChatMessageSerializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
+        paginator = MessageKeysetPagination(room.id)
+        page = paginator.paginate_queryset(room.messages.filter(is_deleted=False), request, view=self)
+        serializer = ChatMessageSerializer(page, many=True, context=build_message_context(page, request))
+        return paginator.get_paginated_response(serializer.data)
 
 
 class ChatRoomDetailView(APIView):
@@ -94,8 +173,11 @@ class ChatRoomDetailView(APIView):
     def get(self, request, pk):
         """Get room details."""
         try:
-            room = ChatRoom.objects.get(pk=pk)
-            serializer = ChatRoomSerializer(room)
+            room = ChatRoom.objects.annotate(created_by_username=F('created_by__username')).get(pk=pk)
+            serializer = ChatRoomSerializer(room, context={
+                'request': request,
+                'online_counts': presence.room_online_counts([room.id]),
+            })
             return Response(serializer.data)
         except ChatRoom.DoesNotExist:
             return Response({'error': '聊天室不存在'}, status=404)
@@ -114,21 +196,11 @@ class ChatMessageListView(APIView):
             if not ChatRoomMember.objects.filter(room=room, user=request.user).exists():
                 return Response({'error': '不是聊天室成员'}, status=403)
 
-            messages = room.messages.filter(is_deleted=False).order_by('-created_at')
-
-            # Pagination
-            page_size = int(request.GET.get('page_size', 20))
-            page = int(request.GET.get('page', 1))
-            start = (page - 1) * page_size
-            end = start + page_size
-
-            serializer = ChatMessageSerializer(messages[start:end], many=True)
-            return Response({
-                'results': serializer.data,
-                'count': messages.count(),
-                'next': f'?page={page + 1}&page_size={page_size}' if end < messages.count() else None,
-                'previous': f'?page={page - 1}&page_size={page_size}' if page > 1 else None
-            })
+            # Keyset pagination: ?before= / ?after= / ?around=<message id>
+            paginator = MessageKeysetPagination(room.id)
+            page = paginator.paginate_queryset(room.messages.filter(is_deleted=False), request, view=self)
+            serializer = ChatMessageSerializer(page, many=True, context=build_message_context(page, request))
+            return paginator.get_paginated_response(serializer.data)
 
         except ChatRoom.DoesNotExist:
             return Response({'error': '聊天室不存在'}, status=404)
@@ -154,6 +226,7 @@ class ChatMessageListView(APIView):
                 content=content,
                 message_type=message_type
             )
+            read_cursors.record_message(message)
 
             serializer = ChatMessageSerializer(message)
             return Response(serializer.data, status=201)
@@ -168,7 +241,11 @@ class DefaultChatRoomView(APIView):
 
     def get(self, request):
         room = ensure_default_room(request.user)
-        serializer = ChatRoomSerializer(room, context={'request': request})
+        serializer = ChatRoomSerializer(room, context={
+            'request': request,
+            'member_room_ids': {room.id},
+            'online_counts': presence.room_online_counts([room.id]),
+        })
         return Response(serializer.data)
 
 
@@ -178,20 +255,10 @@ class DefaultChatMessagesView(APIView):
 
     def get(self, request):
         room = ensure_default_room(request.user)
-        messages_qs = room.messages.filter(is_deleted=False).order_by('-created_at')
-
-        page_size = int(request.GET.get('page_size', 50))
-        page = int(request.GET.get('page', 1))
-        start = (page - 1) * page_size
-        end = start + page_size
-
-        serializer = ChatMessageSerializer(messages_qs[start:end], many=True, context={'request': request})
-        return Response({
-            'results': serializer.data,
-            'count': messages_qs.count(),
-            'next': page + 1 if end < messages_qs.count() else None,
-            'previous': page - 1 if page > 1 else None
-        })
+        paginator = MessageKeysetPagination(room.id, page_size=50)
+        page = paginator.paginate_queryset(room.messages.filter(is_deleted=False), request, view=self)
+        serializer = ChatMessageSerializer(page, many=True, context=build_message_context(page, request))
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request):
         room = ensure_default_room(request.user)
@@ -207,32 +274,64 @@ class DefaultChatMessagesView(APIView):
             content=content,
             message_type=message_type
         )
+        read_cursors.record_message(message)
         serializer = ChatMessageSerializer(message, context={'request': request})
         return Response(serializer.data, status=201)
 
 
+class MarkReadView(APIView):
+    """Advance the caller's read cursor in a room."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, room_id):
+        """Mark messages read up to ``message_id``, or everything so far when omitted."""
+        if not ChatRoomMember.objects.filter(room_id=room_id, user=request.user).exists():
+            return Response({'error': '不是聊天室成员'}, status=403)
+
+        message_id = request.data.get('message_id')
+        if message_id:
+            try:
+                message_id = int(message_id)
+            except (TypeError, ValueError):
+                return Response({'error': 'message_id 必须是整数'}, status=400)
+            read_at = read_cursors.message_time(room_id, message_id)
+            if read_at is None:
+                return Response({'error': '消息不存在'}, status=404)
+        else:
+            read_at = timezone.now()
+
+        last_read_at, unread, advanced = read_cursors.mark_read(request.user.id, room_id, read_at)
+        frame = read_cursor_frame(room_id, last_read_at, unread)
+        if advanced:
+            broadcast_read_cursor(request.user.id, frame)
+        return Response(frame)
+
+
+class UnreadCountsView(APIView):
+    """Unread counts for all of the caller's rooms."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        rooms = read_cursors.unread_counts(request.user.id)
+        return Response({
+            'rooms': rooms,
+            'total_unread': sum(room['unread'] for room in rooms),
+        })
+
+
+@method_decorator(cached_view('chat:online', ONLINE_USERS_CACHE_TTL, per_user=False), name='get')
 class OnlineUsersView(APIView):
     """Online users view."""
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
         """Get online users list."""
-        online_records = OnlineUser.objects.select_related('user').order_by('-last_seen')
-
-        def serialize(record):
-            avatar_url = None
-            if record.user.avatar:
-                avatar_url = request.build_absolute_uri(record.user.avatar.url)
-            return {
-                'id': record.user.id,
-                'username': record.user.username,
-                'avatar': avatar_url,
-                'last_active': record.last_seen.isoformat(),
-                'status': 'online'
-            }
-
-        data = [serialize(item) for item in online_records]
+        version, data = presence.snapshot()
+        for user in data:
+            if user['avatar']:
+                user['avatar'] = request.build_absolute_uri(user['avatar'])
         return Response({
             'users': data,
-            'total_count': len(data)
+            'total_count': len(data),
+            'version': version
         })
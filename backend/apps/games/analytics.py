@@ -0,0 +1,163 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import FloatField
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+from .leaderboard import record_variant
+from .models import GameHistogram, GameRecord, PersonalBest
+
+# Detail relation and field holding each game's completion time (seconds; ms for reaction time).
+TIME_FIELDS = {
+    'schulte': ('schulte_record', 'completion_time'),
+    'memory_flip': ('memory_flip_record', 'completion_time'),
+    'sudoku': ('sudoku_record', 'completion_time'),
+    'reaction_time': ('reaction_record', 'average_time'),
+}
+
+
+def completion_time(game_type, detail):
+    """Completion time of a detail record, as a float."""
+    if game_type not in TIME_FIELDS or detail is None:
+        return None
+    value = getattr(detail, TIME_FIELDS[game_type][1])
+    return None if value is None else float(value)
+
+
+def percentile(values, q):
+    """Linearly interpolated ``q`` percentile (0-100) of sorted ``values``."""
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(values, best):
+    if not values:
+        return None
+    values = sorted(values)
+    return {
+        'best': best(values),
+        'mean': sum(values) / len(values),
+        'p50': percentile(values, 50),
+        'p90': percentile(values, 90),
+    }
+
+
+def user_game_stats(user_id):
+    """
+    Per game and variant: count, and best / mean / p50 / p90 of score and completion time.
+
+    Reads the user's records once, with the detail tables joined for completion times.
+    """
+    completion = Coalesce(*(
+        Cast(f'{relation}__{field}', FloatField()) for relation, field in TIME_FIELDS.values()
+    ))
+    rows = GameRecord.objects.filter(user_id=user_id) \
+        .annotate(completion=completion) \
+        .values_list('game_type', 'details', 'score', 'completion')
+
+    groups = defaultdict(lambda: ([], []))
+    for game_type, details, score, completion_value in rows.iterator():
+        scores, times = groups[game_type, record_variant(game_type, details)]
+        scores.append(score)
+        if completion_value is not None:
+            times.append(completion_value)
+
+    return [
+        {
+            'game_type': game_type,
+            'variant': variant,
+            'count': len(scores),
+            'score': summarize(scores, max),
+            'completion_time': summarize(times, min),
+        }
+        for (game_type, variant), (scores, times) in sorted(groups.items())
+    ]
+
+
+def build_histogram(values, buckets):
+    low, high = min(values), max(values)
+    width = (high - low) / buckets or 1.0
+    counts = [0] * buckets
+    for value in values:
+        counts[min(int((value - low) / width), buckets - 1)] += 1
+    return low, width, counts
+
+
+def rebuild_histograms(buckets=None):
+    """Recompute every GameHistogram from PersonalBest (one row per player). Returns the count written."""
+    buckets = buckets or settings.GAME_HISTOGRAM_BUCKETS
+    samples = defaultdict(list)
+    for game_type, variant, best_score, best_time in PersonalBest.objects.values_list(
+        'game_type', 'variant', 'best_score', 'best_time'
+    ).iterator():
+        samples[game_type, variant, 'score'].append(best_score)
+        if best_time is not None:
+            samples[game_type, variant, 'time'].append(best_time)
+
+    now = timezone.now()
+    histograms = []
+    for (game_type, variant, metric), values in samples.items():
+        low, width, counts = build_histogram(values, buckets)
+        histograms.append(GameHistogram(
+            game_type=game_type,
+            variant=variant,
+            metric=metric,
+            low=low,
+            width=width,
+            counts=counts,
+            total=len(values),
+            built_at=now,
+        ))
+    with transaction.atomic():
+        GameHistogram.objects.all().delete()
+        GameHistogram.objects.bulk_create(histograms)
+    return len(histograms)
+
+
+def share_below(histogram, value):
+    """Estimated share (0-100) of the other players whose value is below ``value``."""
+    others = histogram.total - 1
+    if others <= 0:
+        return None
+    position = (value - histogram.low) / histogram.width
+    full = max(min(int(position), len(histogram.counts)), 0)
+    below = sum(histogram.counts[:full])
+    if full < len(histogram.counts):
+        below += histogram.counts[full] * (position - full)
+    # The histogram includes the player, whose own value is never below itself.
+    return round(min(below, others) / others * 100, 1)
+
+
+def placements(user_id):
+    """
+    Where the user's personal bests fall among all players, per game and variant.
+
+    ``score_percentile`` is the share of other players with a lower best score
+    and ``time_percentile`` the share with a slower best time, both estimated
+    from the latest histograms (None while the user is the only player).
+    """
+    bests = list(PersonalBest.objects.filter(user_id=user_id))
+    histograms = {
+        (histogram.game_type, histogram.variant, histogram.metric): histogram
+        for histogram in GameHistogram.objects.filter(game_type__in={best.game_type for best in bests})
+    }
+    result = {}
+    for best in bests:
+        score = histograms.get((best.game_type, best.variant, 'score'))
+        time = histograms.get((best.game_type, best.variant, 'time'))
+        faster = share_below(time, best.best_time) if time and best.best_time is not None else None
+        result[best.game_type, best.variant] = {
+            'best_score': best.best_score,
+            'best_time': best.best_time,
+            'score_percentile': share_below(score, best.best_score) if score else None,
+            'time_percentile': None if faster is None else round(100 - faster, 1),
+            'players': score.total if score else None,
+            'built_at': score.built_at.isoformat() if score else None,
+        }
+    return result
@@ -0,0 +1,183 @@
+import logging
+from collections import defaultdict
+
+import redis
+from django.utils import timezone
+
+from apps.users.cards import get_author_cards
+from wellness_hub.cache import cache_service
+from wellness_hub.redis_client import get_redis
+from .models import GameRecord
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = ('all', 'week', 'day')
+DEFAULT_VARIANT = 'default'
+
+# Where a game's variant (grid size, difficulty) is found in GameRecord.details.
+VARIANT_KEYS = {
+    'schulte': ('grid_size', 'gridSize'),
+    'memory_flip': ('grid_size', 'gridSize'),
+    'sudoku': ('difficulty',),
+}
+
+# Day and week boards outlive their window a little so late reads still work.
+WINDOW_TTL = {
+    'day': 60 * 60 * 24 * 2,
+    'week': 60 * 60 * 24 * 8,
+}
+
+
+def record_variant(game_type, details):
+    for key in VARIANT_KEYS.get(game_type, ()):
+        value = (details or {}).get(key)
+        if value not in (None, ''):
+            return str(value).replace(':', '_')[:20]
+    return DEFAULT_VARIANT
+
+
+def window_period(window, moment=None):
+    """Identify the day or ISO week (in TIME_ZONE) ``moment`` falls in; '' for all-time."""
+    if window == 'all':
+        return ''
+    day = timezone.localtime(moment).date() if moment else timezone.localdate()
+    if window == 'day':
+        return day.strftime('%Y%m%d')
+    year, week, _ = day.isocalendar()
+    return f'{year}W{week:02d}'
+
+
+def leaderboard_cache_namespace(game_type, variant, window):
+    """Cached responses of one board; bumped only when that board changes."""
+    return f'games:leaderboards:{game_type}:{variant}:{window}'
+
+
+class Leaderboards:
+    """
+    Best score per user for every game and variant, kept in Redis sorted sets.
+
+    Each (game, variant) has an all-time board plus one board for the current
+    day and ISO week; members are user ids scored by their best score (higher
+    is better). ``record`` is called for every new game record and only ever
+    raises a member's score, so boards can be rebuilt from GameRecord at any
+    time with ``rebuild``.
+    """
+
+    def __init__(self, prefix='games:lb:'):
+        self.prefix = prefix
+
+    @property
+    def redis(self):
+        return get_redis()
+
+    def key(self, game_type, variant, window, period=None):
+        if period is None:
+            period = window_period(window)
+        return f'{self.prefix}{game_type}:{variant}:{window}' + (f':{period}' if period else '')
+
+    def record(self, record):
+        """Fold a saved GameRecord into its boards."""
+        variant = record_variant(record.game_type, record.details)
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for window in WINDOWS:
+                key = self.key(record.game_type, variant, window, window_period(window, record.played_at))
+                pipe.zadd(key, {record.user_id: record.score}, gt=True)
+                if window in WINDOW_TTL:
+                    pipe.expire(key, WINDOW_TTL[window])
+            pipe.execute()
+        except redis.RedisError:
+            logger.exception('Could not update leaderboards for game record %s', record.pk)
+            return
+        cache_service.invalidate(*(
+            leaderboard_cache_namespace(record.game_type, variant, window) for window in WINDOWS
+        ))
+
+    def _entries(self, rows, first_rank):
+        cards = get_author_cards(int(user_id) for user_id, _ in rows)
+        entries = []
+        for offset, (user_id, score) in enumerate(rows):
+            card = cards.get(int(user_id))
+            if card is None:
+                continue
+            entries.append({
+                'rank': first_rank + offset,
+                'user_id': card['id'],
+                'username': card['username'],
+                'avatar': card['avatar'],
+                'score': int(score),
+            })
+        return entries
+
+    def top(self, game_type, variant, window, limit):
+        key = self.key(game_type, variant, window)
+        return self._entries(self.redis.zrevrange(key, 0, limit - 1, withscores=True), 1)
+
+    def around(self, game_type, variant, window, user_id, radius):
+        """Return ``(me, neighbors)``: the user's entry and up to ``radius`` entries either side."""
+        key = self.key(game_type, variant, window)
+        rank = self.redis.zrevrank(key, user_id)
+        if rank is None:
+            return None, []
+        start = max(rank - radius, 0)
+        neighbors = self._entries(self.redis.zrevrange(key, start, rank + radius, withscores=True), start + 1)
+        me = next((entry for entry in neighbors if entry['user_id'] == user_id), None)
+        return me, neighbors
+
+    def rebuild(self, records):
+        """
+        Replace the boards with ones computed from ``records``.
+
+        ``records`` is an iterable of dicts with ``user_id``, ``game_type``,
+        ``score``, ``details`` and ``played_at``. Only the current day and week
+        boards are rebuilt and boards of past days and weeks are dropped.
+        Returns the number of boards written.
+        """
+        current = {window: window_period(window) for window in WINDOWS}
+        boards = defaultdict(dict)
+        for row in records:
+            variant = record_variant(row['game_type'], row['details'])
+            for window in WINDOWS:
+                if window_period(window, row['played_at']) != current[window]:
+                    continue
+                board = boards[row['game_type'], variant, window]
+                if row['score'] > board.get(row['user_id'], float('-inf')):
+                    board[row['user_id']] = row['score']
+
+        keys = {
+            (game_type, variant, window): self.key(game_type, variant, window, current[window])
+            for game_type, variant, window in boards
+        }
+        stale = set(self.redis.scan_iter(f'{self.prefix}*')) - set(keys.values())
+        for board, scores in boards.items():
+            # Build aside and swap in so readers never see a half-built board.
+            key = keys[board]
+            staging = f'{key}:rebuild'
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.delete(staging)
+            pipe.zadd(staging, scores)
+            pipe.rename(staging, key)
+            window = board[2]
+            if window in WINDOW_TTL:
+                pipe.expire(key, WINDOW_TTL[window])
+            pipe.execute()
+        if stale:
+            self.redis.delete(*stale)
+        # Boards that were rebuilt or dropped; keys read <game>:<variant>:<window>[:<period>].
+        changed = set(boards) | {
+            tuple(key[len(self.prefix):].split(':')[:3]) for key in stale
+        }
+        cache_service.invalidate(*(
+            leaderboard_cache_namespace(*board) for board in changed if len(board) == 3
+        ))
+        return len(boards)
+
+
+leaderboards = Leaderboards()
+
+
+def rebuild_from_records():
+    """Rebuild every board from GameRecord; returns the number of boards written."""
+    records = GameRecord.objects.values('user_id', 'game_type', 'score', 'details', 'played_at') \
+        .iterator(chunk_size=2000)
+    return leaderboards.rebuild(records)
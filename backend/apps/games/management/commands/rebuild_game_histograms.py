@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.games.analytics import rebuild_histograms
+
+
+class Command(BaseCommand):
+    help = "Recompute the score / time histograms used for players' percentile placement."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buckets', type=int, help='Buckets per histogram (default GAME_HISTOGRAM_BUCKETS)')
+
+    def handle(self, *args, **options):
+        written = rebuild_histograms(options['buckets'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} histograms'))
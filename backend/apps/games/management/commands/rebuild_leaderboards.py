@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.games.leaderboard import rebuild_from_records
+
+
+class Command(BaseCommand):
+    help = 'Recompute the Redis leaderboards from GameRecord.'
+
+    def handle(self, *args, **options):
+        boards = rebuild_from_records()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {boards} leaderboards'))
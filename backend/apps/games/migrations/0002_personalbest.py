@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('games', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonalBest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('game_type', models.CharField(max_length=20, verbose_name='游戏类型')),
+                ('variant', models.CharField(max_length=20, verbose_name='变体')),
+                ('best_score', models.IntegerField(verbose_name='最佳分数')),
+                ('games_played', models.IntegerField(default=0, verbose_name='游戏次数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('record', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='games.gamerecord', verbose_name='最佳记录')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='personal_bests', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': '个人最佳',
+                'verbose_name_plural': '个人最佳',
+                'db_table': 'game_personal_bests',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='personalbest',
+            constraint=models.UniqueConstraint(fields=('user', 'game_type', 'variant'), name='game_personal_bests_user_variant'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0002_personalbest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameHistogram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('game_type', models.CharField(max_length=20, verbose_name='游戏类型')),
+                ('variant', models.CharField(max_length=20, verbose_name='变体')),
+                ('metric', models.CharField(choices=[('score', '分数'), ('time', '用时')], max_length=10, verbose_name='指标')),
+                ('low', models.FloatField(verbose_name='下界')),
+                ('width', models.FloatField(verbose_name='桶宽')),
+                ('counts', models.JSONField(default=list, verbose_name='各桶人数')),
+                ('total', models.IntegerField(default=0, verbose_name='总人数')),
+                ('built_at', models.DateTimeField(verbose_name='生成时间')),
+            ],
+            options={
+                'verbose_name': '成绩分布',
+                'verbose_name_plural': '成绩分布',
+                'db_table': 'game_histograms',
+            },
+        ),
+        migrations.AddField(
+            model_name='personalbest',
+            name='best_time',
+            field=models.FloatField(blank=True, null=True, verbose_name='最短用时'),
+        ),
+        migrations.AddConstraint(
+            model_name='gamehistogram',
+            constraint=models.UniqueConstraint(fields=('game_type', 'variant', 'metric'), name='game_histograms_variant_metric'),
+        ),
+    ]
@@ -106,4 +106,62 @@ class SudokuRecord(models.Model):
         verbose_name_plural = "数独记录"
 
     def __str__(self):
-        return f"{self.base_record.user.username} - {self.get_difficulty_display()}"
\ No newline at end of file
+        return f"{self.base_record.user.username} - {self.get_difficulty_display()}"
+
+
+class PersonalBest(models.Model):
+    """A user's best score for one game variant, maintained by apps.games.results."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='personal_bests')
+    game_type = models.CharField(max_length=20, verbose_name="游戏类型")
+    variant = models.CharField(max_length=20, verbose_name="变体")
+    best_score = models.IntegerField(verbose_name="最佳分数")
+    record = models.ForeignKey(
+        GameRecord,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name="最佳记录"
+    )
+    best_time = models.FloatField(null=True, blank=True, verbose_name="最短用时")
+    games_played = models.IntegerField(default=0, verbose_name="游戏次数")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        db_table = 'game_personal_bests'
+        verbose_name = "个人最佳"
+        verbose_name_plural = "个人最佳"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'game_type', 'variant'], name='game_personal_bests_user_variant'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.game_type}/{self.variant}: {self.best_score}"
+
+
+class GameHistogram(models.Model):
+    """Distribution of players' personal bests for one game variant, rebuilt periodically."""
+    METRIC_CHOICES = [
+        ('score', '分数'),
+        ('time', '用时'),
+    ]
+
+    game_type = models.CharField(max_length=20, verbose_name="游戏类型")
+    variant = models.CharField(max_length=20, verbose_name="变体")
+    metric = models.CharField(max_length=10, choices=METRIC_CHOICES, verbose_name="指标")
+    low = models.FloatField(verbose_name="下界")
+    width = models.FloatField(verbose_name="桶宽")
+    counts = models.JSONField(default=list, verbose_name="各桶人数")
+    total = models.IntegerField(default=0, verbose_name="总人数")
+    built_at = models.DateTimeField(verbose_name="生成时间")
+
+    class Meta:
+        db_table = 'game_histograms'
+        verbose_name = "成绩分布"
+        verbose_name_plural = "成绩分布"
+        constraints = [
+            models.UniqueConstraint(fields=['game_type', 'variant', 'metric'], name='game_histograms_variant_metric'),
+        ]
+
+    def __str__(self):
+        return f"{self.game_type}/{self.variant} {self.metric}"
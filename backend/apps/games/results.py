@@ -0,0 +1,61 @@
+from django.db import IntegrityError, transaction
+
+from wellness_hub.cache import cache_service
+
+from .leaderboard import leaderboards, record_variant
+from .models import PersonalBest
+
+
+def update_personal_best(record, time=None):
+    """
+    Count ``record`` towards the user's personal best; returns True when it set a new best score.
+
+    ``time`` is the completion time of the game, kept as the best (lowest) time separately.
+    """
+    variant = record_variant(record.game_type, record.details)
+    with transaction.atomic():
+        best = PersonalBest.objects.select_for_update().filter(
+            user_id=record.user_id,
+            game_type=record.game_type,
+            variant=variant
+        ).first()
+        if best is None:
+            try:
+                with transaction.atomic():
+                    PersonalBest.objects.create(
+                        user_id=record.user_id,
+                        game_type=record.game_type,
+                        variant=variant,
+                        best_score=record.score,
+                        record=record,
+                        best_time=time,
+                        games_played=1,
+                    )
+            except IntegrityError:
+                # A concurrent submission created the row first.
+                return update_personal_best(record, time)
+            return True
+
+        best.games_played += 1
+        is_best = record.score > best.best_score
+        if is_best:
+            best.best_score = record.score
+            best.record = record
+        if time is not None and (best.best_time is None or time < best.best_time):
+            best.best_time = time
+        best.save(update_fields=['games_played', 'best_score', 'record', 'best_time', 'updated_at'])
+        return is_best
+
+
+def record_result(record, time=None):
+    """
+    Apply a saved GameRecord to the personal bests and, on commit, the leaderboards
+    and the user's cached statistics.
+
+    Call inside the transaction that saved the record.
+    """
+    is_best = update_personal_best(record, time)
+    namespace = f'games:user:{record.user_id}'
+    transaction.on_commit(lambda: leaderboards.record(record))
+    transaction.on_commit(lambda: cache_service.invalidate(namespace))
+    return is_best
@@ -85,4 +85,69 @@ class SudokuRecordSerializer(serializers.ModelSerializer):
         read_only_fields = ['base_record']
 
     def get_user_name(self, obj):
-        return obj.base_record.user.username
\ No newline at end of file
+        return obj.base_record.user.username
+
+
+class GameSubmissionSerializer(serializers.ModelSerializer):
+    """
+    One game result: the GameRecord fields plus the game's detail fields.
+
+    ``save(user=...)`` creates the base record and the detail row; call it
+    inside a transaction so both are written or neither.
+    """
+    score = serializers.IntegerField()
+    duration = serializers.IntegerField(required=False, allow_null=True)
+    details = serializers.JSONField(required=False)
+
+    game_type = None
+    # Detail field copied into GameRecord.details so leaderboards can tell variants apart.
+    variant_field = None
+
+    def create(self, validated_data):
+        user = validated_data.pop('user')
+        details = dict(validated_data.pop('details', None) or {})
+        if self.variant_field:
+            details[self.variant_field] = validated_data[self.variant_field]
+        base_record = GameRecord.objects.create(
+            user=user,
+            game_type=self.game_type,
+            score=validated_data.pop('score'),
+            duration=validated_data.pop('duration', None),
+            details=details
+        )
+        return self.Meta.model.objects.create(base_record=base_record, **validated_data)
+
+
+class SchulteSubmissionSerializer(GameSubmissionSerializer):
+    game_type = 'schulte'
+    variant_field = 'grid_size'
+
+    class Meta:
+        model = SchulteRecord
+        fields = ['score', 'duration', 'details', 'grid_size', 'completion_time']
+
+
+class ReactionTimeSubmissionSerializer(GameSubmissionSerializer):
+    game_type = 'reaction_time'
+
+    class Meta:
+        model = ReactionTimeRecord
+        fields = ['score', 'duration', 'details', 'average_time', 'best_time', 'attempts']
+
+
+class MemoryFlipSubmissionSerializer(GameSubmissionSerializer):
+    game_type = 'memory_flip'
+    variant_field = 'grid_size'
+
+    class Meta:
+        model = MemoryFlipRecord
+        fields = ['score', 'duration', 'details', 'grid_size', 'moves', 'completion_time']
+
+
+class SudokuSubmissionSerializer(GameSubmissionSerializer):
+    game_type = 'sudoku'
+    variant_field = 'difficulty'
+
+    class Meta:
+        model = SudokuRecord
+        fields = ['score', 'duration', 'details', 'difficulty', 'completion_time', 'hints_used', 'mistakes']
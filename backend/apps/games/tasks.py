@@ -0,0 +1,16 @@
+from celery import shared_task
+
+from .analytics import rebuild_histograms
+from .leaderboard import rebuild_from_records
+
+
+@shared_task(idempotency_key='all', idempotency_ttl=5 * 60)
+def rebuild_leaderboards():
+    """Recompute the Redis leaderboards from GameRecord; returns the number of boards."""
+    return rebuild_from_records()
+
+
+@shared_task(idempotency_key='{buckets}', idempotency_ttl=5 * 60)
+def rebuild_game_histograms(buckets=None):
+    """Recompute the percentile histograms; returns the number written."""
+    return rebuild_histograms(buckets)
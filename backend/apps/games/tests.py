@@ -0,0 +1,100 @@
+from unittest import mock
+
+import redis
+from django.contrib.auth import get_user_model
+from django.db import OperationalError
+from django.test import TestCase
+
+from apps.users.cards import author_cards
+from wellness_hub.redis_client import get_redis
+from wellness_hub.cache import cache_service
+from .leaderboard import WINDOWS, leaderboard_cache_namespace, leaderboards
+from .models import GameHistogram, GameRecord, PersonalBest
+from .tasks import rebuild_game_histograms, rebuild_leaderboards
+
+User = get_user_model()
+
+
+class RebuildLeaderboardsTaskTests(TestCase):
+    """rebuild_leaderboards under eager Celery: retries and idempotency keys."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.players = [User.objects.create_user(username=f'player{n}', password='x') for n in range(2)]
+        for player, score in zip(cls.players, (70, 90)):
+            GameRecord.objects.create(user=player, game_type='reaction_time', score=score)
+
+    def setUp(self):
+        get_redis().flushall()
+        # Rolled-back tests reuse user ids; cards cached by another test would leak in.
+        author_cards.clear()
+
+    def test_rebuilds_boards_from_records(self):
+        self.assertEqual(rebuild_leaderboards.delay().get(), 3)
+        top = leaderboards.top('reaction_time', 'default', 'all', 10)
+        self.assertEqual([(entry['username'], entry['score']) for entry in top], [('player1', 90), ('player0', 70)])
+
+    def versions(self, game_type, variant):
+        return [cache_service.version(leaderboard_cache_namespace(game_type, variant, window)) for window in WINDOWS]
+
+    def test_result_invalidates_only_its_boards(self):
+        touched, untouched = self.versions('sudoku', 'easy'), self.versions('reaction_time', 'default')
+        record = GameRecord.objects.create(
+            user=self.players[0], game_type='sudoku', score=50, details={'difficulty': 'easy'}
+        )
+        leaderboards.record(record)
+        self.assertEqual(self.versions('sudoku', 'easy'), [version + 1 for version in touched])
+        self.assertEqual(self.versions('reaction_time', 'default'), untouched)
+
+    def test_rebuild_invalidates_dropped_boards(self):
+        stale = leaderboards.key('schulte', '5', 'day', '20000101')
+        get_redis().zadd(stale, {self.players[0].id: 10})
+        before = cache_service.version(leaderboard_cache_namespace('schulte', '5', 'day'))
+        leaderboards.rebuild([])
+        self.assertFalse(get_redis().exists(stale))
+        self.assertEqual(cache_service.version(leaderboard_cache_namespace('schulte', '5', 'day')), before + 1)
+
+    def test_retries_redis_errors(self):
+        with mock.patch(
+            'apps.games.tasks.rebuild_from_records', side_effect=[redis.ConnectionError('down'), 3]
+        ) as rebuild:
+            self.assertEqual(rebuild_leaderboards.delay().get(), 3)
+        self.assertEqual(rebuild.call_count, 2)
+
+    def test_duplicate_runs_are_skipped(self):
+        with mock.patch('apps.games.tasks.rebuild_from_records', return_value=3) as rebuild:
+            self.assertEqual(rebuild_leaderboards.delay().get(), 3)
+            self.assertIsNone(rebuild_leaderboards.delay().get())
+        rebuild.assert_called_once()
+
+
+class RebuildGameHistogramsTaskTests(TestCase):
+    """rebuild_game_histograms under eager Celery: retries and idempotency keys."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for n, score in enumerate((10, 20, 30)):
+            user = User.objects.create_user(username=f'best{n}', password='x')
+            PersonalBest.objects.create(user=user, game_type='sudoku', variant='easy', best_score=score, best_time=60.0)
+
+    def setUp(self):
+        get_redis().flushall()
+
+    def test_rebuilds_histograms(self):
+        self.assertEqual(rebuild_game_histograms.delay(buckets=5).get(), 2)
+        histogram = GameHistogram.objects.get(game_type='sudoku', variant='easy', metric='score')
+        self.assertEqual(sum(histogram.counts), 3)
+
+    def test_retries_database_errors(self):
+        with mock.patch(
+            'apps.games.tasks.rebuild_histograms', side_effect=[OperationalError('locked'), 2]
+        ) as rebuild:
+            self.assertEqual(rebuild_game_histograms.delay().get(), 2)
+        self.assertEqual(rebuild.call_count, 2)
+
+    def test_duplicate_runs_are_skipped(self):
+        with mock.patch('apps.games.tasks.rebuild_histograms', return_value=2) as rebuild:
+            self.assertEqual(rebuild_game_histograms.delay(buckets=5).get(), 2)
+            self.assertIsNone(rebuild_game_histograms.delay(buckets=5).get())
+            self.assertEqual(rebuild_game_histograms.delay(buckets=10).get(), 2)
+        self.assertEqual(rebuild.call_count, 2)
@@ -9,9 +9,13 @@ urlpatterns = [
 
     # Specific game records
     path('schulte/', views.schulte_records, name='schulte-records'),
+    path('schulte/submit/', views.submit_schulte, name='submit-schulte'),
     path('reaction-time/', views.reaction_time_records, name='reaction-time-records'),
+    path('reaction-time/submit/', views.submit_reaction_time, name='submit-reaction-time'),
     path('memory-flip/', views.memory_flip_records, name='memory-flip-records'),
+    path('memory-flip/submit/', views.submit_memory_flip, name='submit-memory-flip'),
     path('sudoku/', views.sudoku_records, name='sudoku-records'),
+    path('sudoku/submit/', views.submit_sudoku, name='submit-sudoku'),
 
     # Statistics
     path('statistics/', views.statistics, name='game-statistics'),
@@ -1,16 +1,44 @@
+from collections import defaultdict
+
 from django.shortcuts import render
 from django.http import JsonResponse
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import transaction
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
+from wellness_hub.cache import cached_view
 from .serializers import (
     GameRecordSerializer, SchulteRecordSerializer,
     ReactionTimeRecordSerializer, MemoryFlipRecordSerializer,
-    SudokuRecordSerializer
+    SudokuRecordSerializer, SchulteSubmissionSerializer,
+    ReactionTimeSubmissionSerializer, MemoryFlipSubmissionSerializer,
+    SudokuSubmissionSerializer
 )
 from .models import GameRecord, SchulteRecord, ReactionTimeRecord, MemoryFlipRecord, SudokuRecord
+from .leaderboard import DEFAULT_VARIANT, WINDOWS, leaderboard_cache_namespace, leaderboards
+from .analytics import completion_time, placements, user_game_stats
+from .results import record_result
+
+# Detail model, submission serializer and read serializer of each game.
+GAMES = {
+    'schulte': (SchulteRecord, SchulteSubmissionSerializer, SchulteRecordSerializer),
+    'reaction_time': (ReactionTimeRecord, ReactionTimeSubmissionSerializer, ReactionTimeRecordSerializer),
+    'memory_flip': (MemoryFlipRecord, MemoryFlipSubmissionSerializer, MemoryFlipRecordSerializer),
+    'sudoku': (SudokuRecord, SudokuSubmissionSerializer, SudokuRecordSerializer),
+}
+
+# Game history page sizes.
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+# Largest page of a leaderboard, and entries shown either side of the caller.
+LEADERBOARD_MAX_LIMIT = 100
+LEADERBOARD_RADIUS = 2
+
+# Seconds cached leaderboard and statistics responses live; new records invalidate them sooner.
+LEADERBOARD_CACHE_TTL = 30
+STATISTICS_CACHE_TTL = 300
 
 User = get_user_model()
 
@@ -20,7 +48,7 @@ User = get_user_model()
 def game_record_list(request):
     """Get user game records."""
     game_type = request.GET.get('game_type')
-    records = GameRecord.objects.filter(user=request.user).order_by('-played_at')
+    records = GameRecord.objects.filter(user=request.user).select_related('user').order_by('-played_at')
 
     if game_type:
         records = records.filter(game_type=game_type)
@@ -35,96 +63,179 @@ def create_game_record(request):
     """Create a new game record."""
     serializer = GameRecordSerializer(data=request.data)
     if serializer.is_valid():
-        serializer.save(user=request.user)
+        with transaction.atomic():
+            record = serializer.save(user=request.user)
+            record_result(record)
         return JsonResponse(serializer.data, status=status.HTTP_201_CREATED)
     return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def leaderboard_board(request):
+    """The ``(game_type, variant, window)`` a leaderboard request asks for."""
+    return (
+        request.GET.get('game_type', 'schulte'),
+        request.GET.get('variant') or DEFAULT_VARIANT,
+        request.GET.get('window', 'all'),
+    )
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_view(lambda request: leaderboard_cache_namespace(*leaderboard_board(request)), LEADERBOARD_CACHE_TTL)
 def game_leaderboard(request):
-    """Get game leaderboard."""
-    game_type = request.GET.get('game_type', 'schulte')
-
-    records = GameRecord.objects.filter(
-        game_type=game_type
-    ).order_by('-score')[:10]
-
-    serializer = GameRecordSerializer(records, many=True)
-    return JsonResponse(serializer.data, safe=False)
+    """
+    Get a game leaderboard: best score per user, plus the caller's rank and neighbours.
+
+    Query params: ``game_type``, ``variant`` (grid size or difficulty),
+    ``window`` (all / week / day) and ``limit``.
+    """
+    game_type, variant, window = leaderboard_board(request)
+    if game_type not in dict(GameRecord._meta.get_field('game_type').choices):
+        return JsonResponse({'detail': '不支持的游戏类型'}, status=status.HTTP_400_BAD_REQUEST)
+    if window not in WINDOWS:
+        return JsonResponse({'detail': 'window 参数应为 all、week 或 day'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), LEADERBOARD_MAX_LIMIT))
+    except ValueError:
+        return JsonResponse({'detail': 'limit 必须是整数'}, status=status.HTTP_400_BAD_REQUEST)
+
+    entries = leaderboards.top(game_type, variant, window, limit)
+    me, neighbors = leaderboards.around(game_type, variant, window, request.user.id, LEADERBOARD_RADIUS)
+    return JsonResponse({
+        'game_type': game_type,
+        'variant': variant,
+        'window': window,
+        'entries': entries,
+        'me': me,
+        'neighbors': neighbors,
+    })
+
+
+def game_history(request, game_type):
+    """
+    Page through the user's detail records of one game, newest first.
+
+    One query per page (detail row joined with its GameRecord and user).
+    ``?limit=`` sets the page size and ``?before=<id>`` continues from the
+    ``next`` value of the previous page.
+    """
+    model, _, serializer_class = GAMES[game_type]
+    records = model.objects.filter(base_record__user_id=request.user.id) \
+        .select_related('base_record__user') \
+        .order_by('-id')
+    try:
+        limit = max(1, min(int(request.GET.get('limit', HISTORY_PAGE_SIZE)), HISTORY_MAX_PAGE_SIZE))
+        before = request.GET.get('before')
+        if before:
+            records = records.filter(id__lt=int(before))
+    except ValueError:
+        return JsonResponse({'detail': 'limit 和 before 必须是整数'}, status=status.HTTP_400_BAD_REQUEST)
+
+    page = list(records[:limit + 1])
+    next_before = page[limit - 1].id if len(page) > limit else None
+    serializer = serializer_class(page[:limit], many=True)
+    return JsonResponse({'results': serializer.data, 'next': next_before})
+
+
+def submit_game(request, game_type):
+    """Write a game result (base and detail rows) and update personal bests in one transaction."""
+    _, submission_class, serializer_class = GAMES[game_type]
+    submission = submission_class(data=request.data)
+    if not submission.is_valid():
+        return JsonResponse(submission.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    with transaction.atomic():
+        detail = submission.save(user=request.user)
+        is_best = record_result(detail.base_record, completion_time(game_type, detail))
+
+    data = serializer_class(detail).data
+    data['personal_best'] = is_best
+    return JsonResponse(data, status=status.HTTP_201_CREATED)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def schulte_records(request):
     """Get Schulte grid records."""
-    records = SchulteRecord.objects.filter(
-        base_record__user=request.user
-    ).order_by('-base_record__played_at')
+    return game_history(request, 'schulte')
 
-    serializer = SchulteRecordSerializer(records, many=True)
-    return JsonResponse(serializer.data, safe=False)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def submit_schulte(request):
+    """Submit a Schulte grid result."""
+    return submit_game(request, 'schulte')
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def reaction_time_records(request):
     """Get reaction time records."""
-    records = ReactionTimeRecord.objects.filter(
-        base_record__user=request.user
-    ).order_by('-base_record__played_at')
+    return game_history(request, 'reaction_time')
 
-    serializer = ReactionTimeRecordSerializer(records, many=True)
-    return JsonResponse(serializer.data, safe=False)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def submit_reaction_time(request):
+    """Submit a reaction time result."""
+    return submit_game(request, 'reaction_time')
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def memory_flip_records(request):
     """Get memory flip records."""
-    records = MemoryFlipRecord.objects.filter(
-        base_record__user=request.user
-    ).order_by('-base_record__played_at')
+    return game_history(request, 'memory_flip')
 
-    serializer = MemoryFlipRecordSerializer(records, many=True)
-    return JsonResponse(serializer.data, safe=False)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def submit_memory_flip(request):
+    """Submit a memory flip result."""
+    return submit_game(request, 'memory_flip')
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def sudoku_records(request):
     """Get Sudoku records."""
-    records = SudokuRecord.objects.filter(
-        base_record__user=request.user
-    ).order_by('-base_record__played_at')
+    return game_history(request, 'sudoku')
 
-    serializer = SudokuRecordSerializer(records, many=True)
-    return JsonResponse(serializer.data, safe=False)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def submit_sudoku(request):
+    """Submit a Sudoku result."""
+    return submit_game(request, 'sudoku')
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_view('games:user:{user}', STATISTICS_CACHE_TTL)
 def statistics(request):
-    """Get game statistics for the user."""
-    user = request.user
-
-    # Total games played
-    total_games = GameRecord.objects.filter(user=user).count()
-
-    # Games by type
-    games_by_type = GameRecord.objects.filter(user=user).values('game_type').annotate(
-        count=models.Count('id')
-    )
-
-    # Best scores by game type
-    best_scores = GameRecord.objects.filter(user=user).values('game_type').annotate(
-        best_score=models.Max('score')
-    )
+    """
+    Get game statistics for the user.
+
+    ``games`` has per game and variant count, best / mean / p50 / p90 of score
+    and completion time, and where the user's bests place among all players
+    (from the histograms rebuilt by ``rebuild_game_histograms``).
+    """
+    games = user_game_stats(request.user.id)
+    placement = placements(request.user.id)
+
+    games_by_type = defaultdict(int)
+    best_scores = {}
+    for game in games:
+        game_type, best = game['game_type'], game['score']['best']
+        game['placement'] = placement.get((game_type, game['variant']))
+        games_by_type[game_type] += game['count']
+        best_scores[game_type] = max(best_scores.get(game_type, best), best)
 
     data = {
-        'total_games': total_games,
-        'games_by_type': list(games_by_type),
-        'best_scores': list(best_scores),
+        'total_games': sum(games_by_type.values()),
+        'games_by_type': [{'game_type': game_type, 'count': count} for game_type, count in games_by_type.items()],
+        'best_scores': [{'game_type': game_type, 'best_score': best} for game_type, best in best_scores.items()],
+        'games': games,
     }
 
-    return JsonResponse(data)
\ No newline at end of file
+    return JsonResponse(data)
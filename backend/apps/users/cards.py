@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from wellness_hub.cache import cache_service
+from wellness_hub.lru import TTLCache
+
+User = get_user_model()
+
+# Process-level cache of the small author card (id, username, avatar) shown next to
+# chat messages, keyed by user id and the version of the user's cache_service
+# namespace. apps.users.signals bumps that version when the user is saved, and the
+# bump reaches every worker through the cache invalidation broadcast.
+author_cards = TTLCache(maxsize=settings.AUTHOR_CARD_CACHE_SIZE, ttl=settings.AUTHOR_CARD_CACHE_TTL)
+
+
+def profile_cache_namespace(user_id):
+    return f'users:{user_id}'
+
+
+def build_author_card(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'avatar': user.avatar.url if user.avatar else None
+    }
+
+
+def get_author_cards(user_ids):
+    """Return ``{user_id: card}``, loading cache misses in a single query."""
+    user_ids = set(user_ids)
+    namespaces = {user_id: profile_cache_namespace(user_id) for user_id in user_ids}
+    versions = cache_service.versions(list(namespaces.values()))
+    # Without a version (cache unavailable) a card cannot be checked for freshness.
+    keys = {
+        user_id: (user_id, versions[namespace])
+        for user_id, namespace in namespaces.items() if versions[namespace] is not None
+    }
+    cached = author_cards.get_many(keys.values())
+    cards = {user_id: cached[key] for user_id, key in keys.items() if key in cached}
+    missing = user_ids - cards.keys()
+    if missing:
+        for user in User.objects.filter(id__in=missing).only('id', 'username', 'avatar'):
+            card = build_author_card(user)
+            if user.id in keys:
+                author_cards.set(keys[user.id], card)
+            cards[user.id] = card
+    return cards
@@ -1,4 +1,5 @@
 from django.db import models
+from django.contrib.auth.hashers import check_password, make_password
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 
@@ -11,6 +12,7 @@ class User(AbstractUser):
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
     last_login_at = models.DateTimeField(null=True, blank=True, verbose_name="最后登录时间")
     is_online = models.BooleanField(default=False, verbose_name="是否在线")
+    token_version = models.PositiveIntegerField(default=0, verbose_name="令牌版本")
 
     class Meta:
         db_table = 'users'
@@ -20,6 +22,22 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+    def set_password(self, raw_password):
+        """Set the password and revoke tokens issued under the old one."""
+        super().set_password(raw_password)
+        if self.pk:
+            self.token_version += 1
+
+    def check_password(self, raw_password):
+        """Check the password, upgrading the stored hash when the hasher settings changed."""
+        def setter(raw_password):
+            # A rehash is not a password change, so existing tokens stay valid.
+            self.password = make_password(raw_password)
+            self._password = None
+            self.save(update_fields=['password'])
+
+        return check_password(raw_password, self.password, setter)
+
 
 class UserSession(models.Model):
     """User session tracking for online status."""
@@ -0,0 +1,24 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.contrib.auth import get_user_model
+from wellness_hub.cache import cache_service
+from .cards import profile_cache_namespace
+from .models import UserProfile
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_author_card(sender, instance, **kwargs):
+    """Profile or avatar changes must not be served from a cached author card, on any worker."""
+    namespace = profile_cache_namespace(instance.id)
+    transaction.on_commit(lambda: cache_service.invalidate(namespace))
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def drop_cached_profile(sender, instance, **kwargs):
+    namespace = profile_cache_namespace(instance.user_id)
+    transaction.on_commit(lambda: cache_service.invalidate(namespace))
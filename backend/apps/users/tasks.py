@@ -0,0 +1,46 @@
+import uuid
+from io import BytesIO
+
+from celery import shared_task
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+User = get_user_model()
+
+
+def render_avatar(source, size):
+    """Square-crop an image file to ``size`` pixels (upright, per EXIF) and encode it as WebP."""
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        image = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+        output = BytesIO()
+        image.save(output, 'WEBP', quality=85, method=4)
+    return output.getvalue()
+
+
+@shared_task(idempotency_key='{user_id}:{name}')
+def process_avatar(user_id, name):
+    """
+    Replace a freshly uploaded avatar ``name`` with a small square WebP.
+
+    Skipped when the user has changed avatar again since. Returns the new name.
+    """
+    with default_storage.open(name, 'rb') as source:
+        content = render_avatar(source, settings.AVATAR_SIZE)
+    new_name = default_storage.save(f'avatars/{user_id}_{uuid.uuid4().hex[:12]}.webp', ContentFile(content))
+
+    with transaction.atomic():
+        user = User.objects.select_for_update().filter(id=user_id).first()
+        if user is None or user.avatar.name != name:
+            default_storage.delete(new_name)
+            return None
+        user.avatar = new_name
+        user.save(update_fields=['avatar', 'updated_at'])
+    default_storage.delete(name)
+    return new_name
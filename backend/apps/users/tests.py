@@ -0,0 +1,103 @@
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import OperationalError
+from django.test import TestCase
+from PIL import Image
+
+from wellness_hub.cache import cache_service
+from wellness_hub.redis_client import get_redis
+from .cards import author_cards, get_author_cards, profile_cache_namespace
+from .tasks import process_avatar, render_avatar
+
+User = get_user_model()
+
+
+def upload_avatar(user, size=(640, 480)):
+    image = BytesIO()
+    Image.new('RGB', size, 'teal').save(image, 'PNG')
+    user.avatar.save(f'upload_{user.id}.png', ContentFile(image.getvalue()))
+    return user.avatar.name
+
+
+class ProcessAvatarTaskTests(TestCase):
+    """process_avatar under eager Celery: output, retries and idempotency keys."""
+
+    def setUp(self):
+        get_redis().flushall()
+        self.user = User.objects.create_user(username='avatar', password='x')
+        self.upload = upload_avatar(self.user)
+
+    def test_replaces_upload_with_square_webp(self):
+        new_name = process_avatar.delay(self.user.id, self.upload).get()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar.name, new_name)
+        self.assertFalse(default_storage.exists(self.upload))
+        with default_storage.open(new_name) as handle, Image.open(handle) as image:
+            self.assertEqual(image.format, 'WEBP')
+            self.assertEqual(image.size, (settings.AVATAR_SIZE, settings.AVATAR_SIZE))
+
+    def test_skips_superseded_upload(self):
+        newer = upload_avatar(self.user)
+        self.assertIsNone(process_avatar.delay(self.user.id, self.upload).get())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar.name, newer)
+
+    def test_retries_transient_database_errors(self):
+        calls = []
+
+        def flaky(source, size):
+            calls.append(size)
+            if len(calls) == 1:
+                raise OperationalError('gone')
+            return render_avatar(source, size)
+
+        with mock.patch('apps.users.tasks.render_avatar', side_effect=flaky):
+            new_name = process_avatar.delay(self.user.id, self.upload).get()
+        self.assertEqual(len(calls), 2)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar.name, new_name)
+
+    def test_duplicate_runs_are_skipped(self):
+        new_name = process_avatar.delay(self.user.id, self.upload).get()
+        with mock.patch('apps.users.tasks.render_avatar') as render:
+            self.assertIsNone(process_avatar.delay(self.user.id, self.upload).get())
+        render.assert_not_called()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar.name, new_name)
+
+
+class AuthorCardTests(TestCase):
+    """Author cards are cached per process and dropped everywhere when the user changes."""
+
+    def setUp(self):
+        cache.clear()
+        cache_service._versions.clear()
+        author_cards.clear()
+        self.user = User.objects.create_user(username='card', password='x')
+
+    def test_cached_until_the_user_is_saved(self):
+        self.assertEqual(get_author_cards([self.user.id])[self.user.id]['username'], 'card')
+        with self.assertNumQueries(0):
+            get_author_cards([self.user.id])
+        self.user.username = 'renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(get_author_cards([self.user.id])[self.user.id]['username'], 'renamed')
+
+    def test_invalidation_from_another_worker(self):
+        get_author_cards([self.user.id])
+        # Another worker saved the user: the row changed and the namespace version moved
+        # in the shared cache, then its broadcast reached this process.
+        User.objects.filter(id=self.user.id).update(username='elsewhere')
+        namespace = profile_cache_namespace(self.user.id)
+        version = cache_service.version(namespace) + 1
+        cache.set(cache_service._version_key(namespace), version, None)
+        self.assertEqual(get_author_cards([self.user.id])[self.user.id]['username'], 'card')
+        cache_service.apply_version(namespace, version)
+        self.assertEqual(get_author_cards([self.user.id])[self.user.id]['username'], 'elsewhere')
@@ -1,15 +1,22 @@
 from django.shortcuts import render
 from django.http import JsonResponse
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
+from wellness_hub.cache import cached_view
 from .serializers import UserSerializer, UserProfileSerializer
+from .tasks import process_avatar
 
 User = get_user_model()
 
+# Seconds a profile response may be served from cache (is_online is mirrored in the background).
+PROFILE_CACHE_TTL = 60
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_view('users:{user}', PROFILE_CACHE_TTL)
 def profile(request):
     """Get current user profile."""
     user = request.user
@@ -34,6 +41,10 @@ def update_profile(request):
         user.avatar = request.data['avatar']
 
     user.save()
+    if 'avatar' in request.data and user.avatar:
+        # Cropping and scaling happen in the media queue.
+        user_id, name = user.id, user.avatar.name
+        transaction.on_commit(lambda: process_avatar.delay(user_id, name))
 
     # Update profile fields if they exist
     if hasattr(user, 'profile'):
@@ -70,6 +81,7 @@ def user_list(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_view('users:{user_id}', PROFILE_CACHE_TTL, per_user=False)
 def user_detail(request, user_id):
     """Get user details by ID."""
     try:
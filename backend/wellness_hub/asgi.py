@@ -8,13 +8,20 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wellness_hub.settings')
 import django
 django.setup()
 
+from django.conf import settings
+from wellness_hub import db
+
+if settings.DB_STARTUP_SELF_TEST:
+    db.self_test()
+
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
 import apps.chat.routing
 from apps.authentication.ws import JWTAuthMiddlewareStack
+from wellness_hub.cache import invalidation_listener
 
-application = ProtocolTypeRouter({
+application = invalidation_listener(ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": AllowedHostsOriginValidator(
         JWTAuthMiddlewareStack(
@@ -23,4 +30,4 @@ application = ProtocolTypeRouter({
             )
         )
     ),
-})
+}))
@@ -0,0 +1,305 @@
+"""
+Two-tier cache for application data.
+
+L1 is a per-process TTLCache and L2 the Django cache, which CACHES points at
+Redis. Keys live in namespaces such as ``activities:user:7``. Every namespace
+has a version kept in L2 and embedded in its keys, so ``invalidate`` retires a
+whole namespace at once by bumping the version. The new version is broadcast
+over the channel layer to every ASGI worker; a process that is not listening
+picks it up within CACHE_VERSION_TTL seconds.
+
+Misses are single-flight: within a process one thread computes a value while
+the others wait for it, and across processes a short lock in L2 lets one
+worker compute while the rest poll L2 for the result. A waiter gives up after
+CACHE_LOCK_TIMEOUT seconds and computes the value itself.
+
+Cached values are shared between requests and must be treated as read-only.
+"""
+
+import asyncio
+import functools
+import hashlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import redis
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache as django_cache
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+from wellness_hub.lru import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Every ASGI worker listens on this group for namespace version bumps.
+CACHE_GROUP = 'cache_invalidation'
+# Seconds between re-joins of the group, well inside the channel layer's group expiry.
+GROUP_REFRESH = 60 * 60
+LOCK_POLL_INTERVAL = 0.05
+
+_MISSING = object()
+
+
+class _Uncacheable(Exception):
+    """Raised by a view loader to hand back a response that must not be cached."""
+
+    def __init__(self, response):
+        self.response = response
+
+
+class TwoTierCache:
+    """Namespaced cache with a per-process L1 in front of the shared Django cache."""
+
+    def __init__(self, maxsize, version_ttl, lock_timeout, prefix='tc'):
+        self.prefix = prefix
+        self.lock_timeout = lock_timeout
+        self._local = TTLCache(maxsize=maxsize, ttl=300)
+        self._versions = TTLCache(maxsize=maxsize, ttl=version_ttl)
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self._task = None
+
+    @property
+    def backend(self):
+        return django_cache
+
+    def _version_key(self, namespace):
+        return f'{self.prefix}:version:{namespace}'
+
+    def version(self, namespace):
+        """Current version of ``namespace``, or None when L2 is unavailable."""
+        version = self._versions.get(namespace)
+        if version is None:
+            try:
+                version = self.backend.get(self._version_key(namespace), 0)
+            except redis.RedisError:
+                logger.exception('Could not read cache version of %s', namespace)
+                return None
+            self._versions.set(namespace, version)
+        return version
+
+    def versions(self, namespaces):
+        """Like ``version`` for many namespaces, reading the L1 misses from L2 in one call."""
+        found = self._versions.get_many(namespaces)
+        missing = [namespace for namespace in namespaces if namespace not in found]
+        if missing:
+            try:
+                stored = self.backend.get_many([self._version_key(namespace) for namespace in missing])
+            except redis.RedisError:
+                logger.exception('Could not read cache versions of %d namespaces', len(missing))
+                return dict(found, **dict.fromkeys(missing))
+            for namespace in missing:
+                version = stored.get(self._version_key(namespace), 0)
+                self._versions.set(namespace, version)
+                found[namespace] = version
+        return found
+
+    @contextmanager
+    def _single_flight(self, key):
+        with self._flights_lock:
+            flight = self._flights.setdefault(key, [threading.Lock(), 0])
+            flight[1] += 1
+        try:
+            with flight[0]:
+                yield
+        finally:
+            with self._flights_lock:
+                flight[1] -= 1
+                if not flight[1]:
+                    del self._flights[key]
+
+    def get_or_set(self, namespace, key, loader, ttl):
+        """Return the cached value of ``key`` in ``namespace``, calling ``loader()`` on a miss."""
+        version = self.version(namespace)
+        if version is None:
+            return loader()
+        full_key = f'{self.prefix}:{namespace}:{version}:{key}'
+        value = self._local.get(full_key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._single_flight(full_key):
+            value = self._local.get(full_key, _MISSING)
+            if value is _MISSING:
+                value = self._fetch(full_key, loader, ttl)
+                self._local.set(full_key, value, ttl)
+        return value
+
+    def _fetch(self, full_key, loader, ttl):
+        lock_key = f'{full_key}:lock'
+        try:
+            value = self.backend.get(full_key, _MISSING)
+            if value is not _MISSING:
+                return value
+            leader = self.backend.add(lock_key, 1, self.lock_timeout)
+        except redis.RedisError:
+            logger.exception('Could not read %s from the cache', full_key)
+            return loader()
+
+        if not leader:
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(LOCK_POLL_INTERVAL)
+                try:
+                    value = self.backend.get(full_key, _MISSING)
+                except redis.RedisError:
+                    break
+                if value is not _MISSING:
+                    return value
+
+        try:
+            value = loader()
+            self._store(full_key, value, ttl)
+        finally:
+            if leader:
+                try:
+                    self.backend.delete(lock_key)
+                except redis.RedisError:
+                    pass
+        return value
+
+    def _store(self, full_key, value, ttl):
+        try:
+            self.backend.set(full_key, value, ttl)
+        except redis.RedisError:
+            logger.exception('Could not write %s to the cache', full_key)
+
+    def _bump(self, namespace):
+        key = self._version_key(namespace)
+        try:
+            self.backend.add(key, 0, None)
+            version = self.backend.incr(key)
+        except (redis.RedisError, ValueError):
+            logger.exception('Could not bump cache version of %s', namespace)
+            self._versions.delete(namespace)
+            return None
+        self.apply_version(namespace, version)
+        return version
+
+    def apply_version(self, namespace, version):
+        current = self._versions.get(namespace)
+        if current is None or version > current:
+            self._versions.set(namespace, version)
+
+    def invalidate(self, *namespaces):
+        """Retire every key in ``namespaces`` here, in L2 and on every listening worker."""
+        for namespace in namespaces:
+            version = self._bump(namespace)
+            if version is None:
+                continue
+            try:
+                async_to_sync(get_channel_layer().group_send)(
+                    CACHE_GROUP, _invalidation_event(namespace, version)
+                )
+            except Exception:
+                logger.exception('Could not broadcast cache invalidation of %s', namespace)
+
+    async def ainvalidate(self, *namespaces):
+        """Async variant of invalidate for consumers."""
+        for namespace in namespaces:
+            version = await sync_to_async(self._bump, thread_sensitive=False)(namespace)
+            if version is not None:
+                await get_channel_layer().group_send(CACHE_GROUP, _invalidation_event(namespace, version))
+
+    def listen(self):
+        """Start receiving invalidations on the running event loop (once per process)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self):
+        layer = get_channel_layer()
+        channel = await layer.new_channel()
+        joined_at = None
+        while True:
+            try:
+                if joined_at is None or time.monotonic() - joined_at >= GROUP_REFRESH:
+                    await layer.group_add(CACHE_GROUP, channel)
+                    joined_at = time.monotonic()
+                try:
+                    event = await asyncio.wait_for(layer.receive(channel), GROUP_REFRESH)
+                except asyncio.TimeoutError:
+                    continue
+                if event.get('type') == 'cache.invalidate':
+                    self.apply_version(event['namespace'], event['version'])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Cache invalidation listener failed')
+                await asyncio.sleep(1)
+
+
+def _invalidation_event(namespace, version):
+    return {
+        'type': 'cache.invalidate',
+        'namespace': namespace,
+        'version': version,
+    }
+
+
+cache_service = TwoTierCache(
+    maxsize=settings.CACHE_L1_SIZE,
+    version_ttl=settings.CACHE_VERSION_TTL,
+    lock_timeout=settings.CACHE_LOCK_TIMEOUT,
+)
+
+
+def invalidation_listener(application):
+    """ASGI wrapper starting the cache invalidation listener with the first connection."""
+    async def app(scope, receive, send):
+        cache_service.listen()
+        return await application(scope, receive, send)
+    return app
+
+
+def cached_view(namespace, ttl, per_user=True, key=None):
+    """
+    Cache the successful GET responses of a view in ``cache_service``.
+
+    ``namespace`` is formatted with ``user`` (the caller's id) and the view's
+    URL kwargs, e.g. ``'activities:user:{user}'``, or is a callable
+    ``namespace(request, **kwargs)`` for namespaces that depend on the query
+    string; invalidating it drops every cached response of that namespace. Responses are keyed by the query string,
+    the caller when ``per_user`` is set and ``key(request)`` when given. Only
+    200 responses are cached: JsonResponse bodies as bytes and DRF Responses
+    by their data.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+
+            user_id = request.user.id
+            parts = [f'{view.__module__}.{view.__qualname__}', request.GET.urlencode()]
+            if per_user:
+                parts.append(str(user_id))
+            if key is not None:
+                parts.append(str(key(request)))
+            digest = hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+            def load():
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    raise _Uncacheable(response)
+                if isinstance(response, Response):
+                    return 'data', response.data
+                return 'body', (response.content, response['Content-Type'])
+
+            if callable(namespace):
+                resolved = namespace(request, **kwargs)
+            else:
+                resolved = namespace.format(user=user_id, **kwargs)
+            try:
+                kind, payload = cache_service.get_or_set(resolved, digest, load, ttl)
+            except _Uncacheable as uncacheable:
+                return uncacheable.response
+            if kind == 'data':
+                return Response(payload)
+            content, content_type = payload
+            return HttpResponse(content, content_type=content_type)
+        return wrapper
+    return decorator
@@ -0,0 +1,88 @@
+"""
+Celery application for deferred and periodic work.
+
+Tasks live in ``apps/<app>/tasks.py`` and use ``BaseTask``: transient
+failures (Redis, database connections) are retried with exponential backoff,
+and a task with an ``idempotency_key`` runs at most once per key within
+``idempotency_ttl`` seconds, however often it is queued. Queues are assigned
+by CELERY_TASK_ROUTES. With CELERY_TASK_ALWAYS_EAGER set, tasks run inline in
+the calling process and no broker is needed.
+"""
+
+import inspect
+import logging
+import os
+
+import redis
+from celery import Celery, Task
+from celery.exceptions import Retry
+from django.db import InterfaceError, OperationalError
+
+from wellness_hub.redis_client import get_redis
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wellness_hub.settings')
+
+logger = logging.getLogger(__name__)
+
+
+class BaseTask(Task):
+    """Task with retry/backoff on transient errors and optional idempotency keys."""
+
+    autoretry_for = (redis.RedisError, OperationalError, InterfaceError)
+    retry_backoff = True
+    retry_backoff_max = 600
+    retry_jitter = True
+    max_retries = 5
+
+    # Format string over the task's arguments, e.g. 'avatar:{user_id}:{name}'.
+    idempotency_key = None
+    idempotency_ttl = 60 * 60
+
+    def _idempotency_key(self, args, kwargs):
+        if not self.idempotency_key:
+            return None
+        arguments = inspect.signature(self.run).bind(*args, **kwargs)
+        arguments.apply_defaults()
+        return f'celery:once:{self.name}:' + self.idempotency_key.format(**arguments.arguments)
+
+    def __call__(self, *args, **kwargs):
+        key = self._idempotency_key(args, kwargs)
+        if key is None:
+            return super().__call__(*args, **kwargs)
+
+        client = get_redis()
+        task_id = self.request.id
+        try:
+            # Retries keep the task id, so a retry finds its own claim.
+            if not client.set(key, task_id, nx=True, ex=self.idempotency_ttl) and client.get(key) != task_id:
+                logger.info('Skipping %s: %s already ran or is running', self.name, key)
+                return None
+        except redis.RedisError:
+            logger.warning('Could not check idempotency key %s; running anyway', key, exc_info=True)
+
+        try:
+            return super().__call__(*args, **kwargs)
+        except Exception as exc:
+            # A queued retry keeps the claim. Anything else, including a retry
+            # under eager mode (which is not re-run), lets the work be queued again.
+            if not isinstance(exc, Retry) or self.request.is_eager:
+                try:
+                    client.delete(key)
+                except redis.RedisError:
+                    pass
+            raise
+
+    def apply(self, args=None, kwargs=None, **options):
+        # With task_eager_propagates, Celery raises a retry out of an eager run
+        # instead of running it; run it inline, as Celery does without propagation.
+        try:
+            return super().apply(args, kwargs, **options)
+        except Retry as retry:
+            if retry.sig is None:
+                raise
+            return retry.sig.apply()
+
+
+app = Celery('wellness_hub', task_cls=BaseTask)
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
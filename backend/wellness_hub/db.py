@@ -0,0 +1,140 @@
+"""
+Database connection handling for the ASGI workers.
+
+Django 4.2 has no connection pool of its own, and under ASGI every sync view
+runs on a thread created for that request. ``DB_POOL_MODE`` picks a strategy:
+
+``persistent``
+    Database work from async code (WebSocket consumers, background loops) goes
+    through ``database_sync_to_async`` below, which runs it on a fixed set of
+    DB_POOL_SIZE threads. Each keeps one connection open for DB_CONN_MAX_AGE
+    seconds, health-checked before reuse. Under load up to DB_POOL_OVERFLOW
+    extra threads join in and close their connection after every call. Sync
+    HTTP views close their connection when the request finishes, since their
+    thread does not outlive the request.
+``pgbouncer``
+    Connections are opened per unit of work against a pgbouncer in transaction
+    mode, which does the pooling; server-side cursors are disabled. The thread
+    pool still bounds how many connections async code opens at once.
+``none``
+    Django's defaults: a connection per request or call.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.db import DatabaseSyncToAsync
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished
+from django.db import connection, connections
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_executor = None
+_executor_lock = threading.Lock()
+_thread_count = 0
+
+
+def _register_thread():
+    global _thread_count
+    with _executor_lock:
+        _local.slot = _thread_count
+        _thread_count += 1
+
+
+def get_executor():
+    """The process-wide executor running database work for async code."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.DB_POOL_SIZE + settings.DB_POOL_OVERFLOW,
+                    thread_name_prefix='db',
+                    initializer=_register_thread,
+                )
+    return _executor
+
+
+def is_pool_thread():
+    """True on one of the first DB_POOL_SIZE executor threads, whose connections persist."""
+    return getattr(_local, 'slot', settings.DB_POOL_SIZE) < settings.DB_POOL_SIZE
+
+
+class PooledDatabaseSyncToAsync(DatabaseSyncToAsync):
+    """DatabaseSyncToAsync running on the bounded database executor."""
+
+    def __init__(self, func):
+        super().__init__(func, thread_sensitive=False, executor=get_executor())
+
+    def thread_handler(self, loop, *args, **kwargs):
+        try:
+            return super().thread_handler(loop, *args, **kwargs)
+        finally:
+            if not is_pool_thread():
+                connections.close_all()
+
+
+# Drop-in replacement for channels.db.database_sync_to_async.
+database_sync_to_async = PooledDatabaseSyncToAsync
+
+
+def close_request_connections(sender, **kwargs):
+    # The thread an ASGI request ran on is discarded, and its connection with it.
+    # Senders other than a handler class (the test client sends None) are not ASGI requests.
+    is_asgi = isinstance(sender, type) and issubclass(sender, ASGIHandler)
+    if settings.DB_POOL_MODE == 'persistent' and is_asgi and not is_pool_thread():
+        connections.close_all()
+
+
+request_finished.connect(close_request_connections, dispatch_uid='wellness_hub.db.close_request_connections')
+
+
+def connection_limits():
+    """Effective connection settings of this process."""
+    db = settings.DATABASES['default']
+    threads = settings.DB_POOL_SIZE + settings.DB_POOL_OVERFLOW
+    return {
+        'mode': settings.DB_POOL_MODE,
+        'engine': db['ENGINE'].rsplit('.', 1)[-1],
+        'pool_size': settings.DB_POOL_SIZE,
+        'pool_overflow': settings.DB_POOL_OVERFLOW,
+        'persistent_connections': settings.DB_POOL_SIZE if db['CONN_MAX_AGE'] else 0,
+        'conn_max_age': db['CONN_MAX_AGE'],
+        'health_checks': db['CONN_HEALTH_CHECKS'],
+        'server_side_cursors': not db['DISABLE_SERVER_SIDE_CURSORS'],
+        'max_async_connections': threads,
+    }
+
+
+def self_test():
+    """
+    Log the effective limits and check them against the database server.
+
+    Returns the limits, with ``server_max_connections`` added on PostgreSQL.
+    Failures are logged rather than raised so a worker still starts.
+    """
+    limits = connection_limits()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            if connection.vendor == 'postgresql':
+                cursor.execute('SHOW max_connections')
+                limits['server_max_connections'] = int(cursor.fetchone()[0])
+    except Exception:
+        logger.exception('Database self-test failed')
+        return limits
+    finally:
+        connection.close()
+
+    logger.info('Database connections: %s', ', '.join(f'{key}={value}' for key, value in limits.items()))
+    server_max = limits.get('server_max_connections')
+    if server_max is not None and limits['max_async_connections'] >= server_max:
+        logger.warning(
+            'DB_POOL_SIZE + DB_POOL_OVERFLOW (%s) leaves no room under max_connections (%s)',
+            limits['max_async_connections'], server_max
+        )
+    return limits
@@ -0,0 +1,243 @@
+"""
+Queued logging for the ASGI workers.
+
+Loggers only put records on a bounded in-memory queue; a background thread
+(``QueueListener``) formats them and does the console and file I/O, so a slow
+disk never blocks the event loop. When the queue is full, records are dropped
+and counted rather than waited on; the next record that fits is followed by a
+warning with the number dropped. Chatty loggers can be sampled below WARNING
+(LOG_SAMPLING) before they reach the queue.
+
+The file gets one JSON object per line and is rotated by size and by age.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+_handlers = []
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with any ``extra`` fields included."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Size-rotating file handler that also rolls over every ``interval`` seconds.
+
+    The file (and its directory) is created on the first write.
+    """
+
+    def __init__(self, filename, max_bytes, interval, backup_count, encoding='utf-8'):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding, delay=True)
+        self.interval = interval
+        self.rollover_at = time.time() + interval if interval else None
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and time.time() >= self.rollover_at and os.path.exists(self.baseFilename):
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        if self.interval:
+            self.rollover_at = time.time() + self.interval
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a share of the records below WARNING from the configured loggers."""
+
+    def __init__(self, rates):
+        super().__init__()
+        # Longest prefix first, so 'apps.chat.consumers' wins over 'apps.chat'.
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+        self.sampled_out = Counter()
+
+    def rate(self, name):
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + '.'):
+                return rate
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        if random.random() < self.rate(record.name):
+            return True
+        self.sampled_out[record.name] += 1
+        return False
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks: records that do not fit are dropped and counted.
+
+    Owns the QueueListener writing to ``handlers`` and restarts it in forked
+    children (Celery prefork workers), whose copy of the thread is gone.
+    """
+
+    def __init__(self, handlers, maxsize):
+        super().__init__(queue.Queue(maxsize))
+        self.maxsize = maxsize
+        self.handlers = handlers
+        self.dropped = Counter()
+        self._unreported = 0
+        self._lock = threading.Lock()
+        self.listener = None
+        self.start()
+
+    def start(self):
+        self.listener = logging.handlers.QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def close(self):
+        # dictConfig closes the handlers it replaces; take the listener thread with them.
+        self.stop()
+        if self in _handlers:
+            _handlers.remove(self)
+        super().close()
+
+    def restart_after_fork(self):
+        self._lock = threading.Lock()
+        self.queue = queue.Queue(self.maxsize)
+        self.dropped.clear()
+        self._unreported = 0
+        self.start()
+
+    def prepare(self, record):
+        # Render the message and traceback here, where the arguments are still
+        # valid, but keep them apart so the file formatter can structure them.
+        record = logging.makeLogRecord(vars(record))
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self.queue.put_nowait(record)
+
+    def emit(self, record):
+        try:
+            self.enqueue(self.prepare(record))
+        except queue.Full:
+            with self._lock:
+                self.dropped[record.levelname] += 1
+                self._unreported += 1
+            return
+        except Exception:
+            self.handleError(record)
+            return
+        if self._unreported:
+            self._report_drops()
+
+    def _report_drops(self):
+        with self._lock:
+            count, self._unreported = self._unreported, 0
+        notice = logging.makeLogRecord({
+            'name': __name__,
+            'levelno': logging.WARNING,
+            'levelname': 'WARNING',
+            'msg': f'Dropped {count} log records: the log queue was full',
+            'dropped': count,
+        })
+        try:
+            self.enqueue(notice)
+        except queue.Full:
+            with self._lock:
+                self._unreported += count
+
+
+def queued_handler(
+    filename, max_bytes, interval, backup_count, queue_size, sampling=None,
+    console_level=logging.INFO, file_level=logging.INFO, console_format=None,
+):
+    """
+    Handler factory for ``LOGGING`` (``'()': 'wellness_hub.log_pipeline.queued_handler'``).
+
+    Returns a QueueHandler feeding a console handler (plain text) and a
+    rotating JSON lines file handler.
+    """
+    console = logging.StreamHandler()
+    console.setLevel(console_level)
+    console.setFormatter(logging.Formatter(console_format, style='{') if console_format else logging.Formatter())
+    log_file = RotatingFileHandler(filename, max_bytes, interval, backup_count)
+    log_file.setLevel(file_level)
+    log_file.setFormatter(JsonFormatter())
+
+    handler = QueueHandler([console, log_file], queue_size)
+    if sampling:
+        handler.addFilter(SamplingFilter(sampling))
+    _handlers.append(handler)
+    return handler
+
+
+def stats():
+    """Dropped and sampled-out record counts of the queued handlers in this process."""
+    result = {'dropped': Counter(), 'sampled_out': Counter(), 'queued': 0}
+    for handler in _handlers:
+        result['dropped'].update(handler.dropped)
+        result['queued'] += handler.queue.qsize()
+        for log_filter in handler.filters:
+            if isinstance(log_filter, SamplingFilter):
+                result['sampled_out'].update(log_filter.sampled_out)
+    return result
+
+
+def _stop_all():
+    for handler in _handlers:
+        handler.stop()
+
+
+def _restart_all():
+    for handler in _handlers:
+        handler.restart_after_fork()
+
+
+# Registered after logging's own exit hook, so this runs first: the listeners
+# drain their queues before logging.shutdown closes the file handlers.
+atexit.register(_stop_all)
+os.register_at_fork(after_in_child=_restart_all)
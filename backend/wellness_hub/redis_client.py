@@ -0,0 +1,24 @@
+"""
+Shared Redis client for application data (presence, counters, rankings).
+
+The channel layer keeps its own connections; this module serves everything else
+from one connection pool per process.
+"""
+
+import threading
+
+import redis
+from django.conf import settings
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_redis():
+    """Return the process-wide Redis client (responses decoded to str)."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _client
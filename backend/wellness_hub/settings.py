@@ -2,9 +2,10 @@
 Django settings for wellness_hub project.
 """
 
-import os
 from pathlib import Path
+from celery.schedules import crontab
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 import dj_database_url
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -40,6 +41,7 @@ THIRD_PARTY_APPS = [
     'rest_framework',
     'corsheaders',
     'channels',
+    'django_celery_beat',
 ]
 
 LOCAL_APPS = [
@@ -88,8 +90,29 @@ ASGI_APPLICATION = 'wellness_hub.asgi.application'
 
 # Database
 DATABASE_URL = config('DATABASE_URL', default='sqlite:///db.sqlite3')
+
+# Connection handling, see wellness_hub/db.py: 'persistent', 'pgbouncer' or 'none'
+DB_POOL_MODE = config('DB_POOL_MODE', default='persistent')
+if DB_POOL_MODE not in ('persistent', 'pgbouncer', 'none'):
+    raise ImproperlyConfigured("DB_POOL_MODE must be 'persistent', 'pgbouncer' or 'none'")
+# Threads running database work for async code (database_sync_to_async); in persistent
+# mode each keeps its connection open, overflow threads close theirs after every call
+DB_POOL_SIZE = config('DB_POOL_SIZE', default=8, cast=int)
+DB_POOL_OVERFLOW = config('DB_POOL_OVERFLOW', default=4, cast=int)
+# Seconds a persistent connection is reused, and whether it is checked before reuse
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)
+DB_CONN_HEALTH_CHECKS = config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool)
+# Log the effective connection limits (and check them against the server) at startup
+DB_STARTUP_SELF_TEST = config('DB_STARTUP_SELF_TEST', default=True, cast=bool)
+
 DATABASES = {
-    'default': dj_database_url.parse(DATABASE_URL)
+    'default': dj_database_url.parse(
+        DATABASE_URL,
+        conn_max_age=DB_CONN_MAX_AGE if DB_POOL_MODE == 'persistent' else 0,
+        conn_health_checks=DB_CONN_HEALTH_CHECKS,
+        # pgbouncer in transaction mode cannot hold server-side cursors across statements
+        disable_server_side_cursors=DB_POOL_MODE == 'pgbouncer',
+    )
 }
 
 # Password validation
@@ -111,6 +134,20 @@ DATABASES = {
 # 不校验密码等规则
 AUTH_PASSWORD_VALIDATORS = []
 
+# bcrypt for new hashes; older hashes are upgraded on the next successful login
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# Password hashing pool used by login / registration: concurrent hashes, and how many
+# more may wait before requests are rejected with 429
+AUTH_HASH_WORKERS = config('AUTH_HASH_WORKERS', default=2, cast=int)
+AUTH_HASH_QUEUE_LIMIT = config('AUTH_HASH_QUEUE_LIMIT', default=16, cast=int)
+
 # Internationalization
 LANGUAGE_CODE = 'zh-hans'
 TIME_ZONE = 'Asia/Shanghai'
@@ -155,59 +192,193 @@ CORS_ALLOW_CREDENTIALS = True
 
 # JWT Settings
 JWT_SECRET_KEY = config('JWT_SECRET_KEY', default=SECRET_KEY)
-JWT_ACCESS_TOKEN_LIFETIME = 60 * 60 * 24 * 7  # 7 days
+JWT_ACCESS_TOKEN_LIFETIME = config('JWT_ACCESS_TOKEN_LIFETIME', default=60 * 15, cast=int)  # 15 minutes
+JWT_REFRESH_TOKEN_LIFETIME = config('JWT_REFRESH_TOKEN_LIFETIME', default=60 * 60 * 24 * 14, cast=int)  # 14 days
 JWT_ALGORITHM = 'HS256'
+# Revoked token ids: seconds between syncs of the in-process Bloom filter from Redis,
+# expected number of revoked ids and the filter's false positive rate
+JWT_DENYLIST_SYNC_INTERVAL = config('JWT_DENYLIST_SYNC_INTERVAL', default=5.0, cast=float)
+JWT_DENYLIST_CAPACITY = config('JWT_DENYLIST_CAPACITY', default=100000, cast=int)
+JWT_DENYLIST_ERROR_RATE = config('JWT_DENYLIST_ERROR_RATE', default=0.001, cast=float)
 
 # Channels/Redis Settings
+REDIS_HOST = config('REDIS_HOST', default='127.0.0.1')
+REDIS_PORT = config('REDIS_PORT', default=6379, cast=int)
+REDIS_DB = config('REDIS_DB', default=0, cast=int)
+# Application data (presence, counters); see wellness_hub.redis_client
+REDIS_URL = config('REDIS_URL', default=f'redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}')
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
             'hosts': [{
-                'host': config('REDIS_HOST', default='127.0.0.1'),
-                'port': config('REDIS_PORT', default=6379, cast=int),
-                'db': config('REDIS_DB', default=0, cast=int),
+                'host': REDIS_HOST,
+                'port': REDIS_PORT,
+                'db': REDIS_DB,
             }],
         },
     },
 }
 
+# Django cache (Redis) and the two-tier cache in front of it (wellness_hub.cache): entries kept
+# per process, seconds a namespace version is trusted without a broadcast, and seconds a
+# single-flight lock is held before waiters compute the value themselves
+CACHE_URL = config('CACHE_URL', default=REDIS_URL)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_URL,
+        'KEY_PREFIX': 'wellness',
+    },
+}
+CACHE_L1_SIZE = config('CACHE_L1_SIZE', default=10000, cast=int)
+CACHE_VERSION_TTL = config('CACHE_VERSION_TTL', default=30, cast=int)
+CACHE_LOCK_TIMEOUT = config('CACHE_LOCK_TIMEOUT', default=5, cast=int)
+
+# Chat write-behind message pipeline
+CHAT_MESSAGE_BATCH_SIZE = config('CHAT_MESSAGE_BATCH_SIZE', default=200, cast=int)
+CHAT_MESSAGE_FLUSH_INTERVAL = config('CHAT_MESSAGE_FLUSH_INTERVAL', default=0.25, cast=float)
+CHAT_MESSAGE_SPOOL_DIR = config('CHAT_MESSAGE_SPOOL_DIR', default=str(BASE_DIR / 'var' / 'chat_spool'))
+# Distinguishes message ids generated by concurrent workers (0-31). Each worker leases its slot
+# in Redis; unset takes the first free slot, a set id that another worker holds fails to start.
+CHAT_WORKER_ID = config('CHAT_WORKER_ID', default=None, cast=lambda v: None if v in (None, '') else int(v))
+CHAT_WORKER_LEASE_TTL = config('CHAT_WORKER_LEASE_TTL', default=30, cast=int)
+
+# Seconds a room's cached message count (chat history pagination) may lag behind
+CHAT_MESSAGE_COUNT_TTL = config('CHAT_MESSAGE_COUNT_TTL', default=60, cast=int)
+
+# Seconds the public room directory may be served from cache
+CHAT_PUBLIC_ROOMS_CACHE_TTL = config('CHAT_PUBLIC_ROOMS_CACHE_TTL', default=60, cast=int)
+
+# Newest messages tracked per room for unread counts (counts are capped at this)
+CHAT_UNREAD_TRACKED = config('CHAT_UNREAD_TRACKED', default=1000, cast=int)
+# Seconds between writes of read cursors to ChatRoomMember.last_read_at
+CHAT_READ_FLUSH_INTERVAL = config('CHAT_READ_FLUSH_INTERVAL', default=5.0, cast=float)
+
+# Seconds a cached room / member set may live without an explicit invalidation
+CHAT_ROOM_CACHE_TTL = config('CHAT_ROOM_CACHE_TTL', default=300, cast=int)
+
+# Typing indicators: broadcast tick and how long a user stays listed without a refresh (seconds)
+CHAT_TYPING_TICK = config('CHAT_TYPING_TICK', default=0.5, cast=float)
+CHAT_TYPING_TTL = config('CHAT_TYPING_TTL', default=6.0, cast=float)
+
+# Presence registry (Redis): seconds a socket stays online without a refresh, and how often
+# the registry is mirrored into OnlineUser / is_online columns (0 disables the snapshot).
+# A socket that has sent a ping is closed when it goes PRESENCE_TTL seconds without another
+# (the web client pings every 20s).
+PRESENCE_TTL = config('PRESENCE_TTL', default=60, cast=int)
+PRESENCE_SNAPSHOT_INTERVAL = config('PRESENCE_SNAPSHOT_INTERVAL', default=60, cast=int)
+# Online/offline deltas retained for clients resuming with ?since=<version>
+PRESENCE_DELTAS_KEPT = config('PRESENCE_DELTAS_KEPT', default=2000, cast=int)
+
+# JSON encoder for outbound WebSocket frames: 'auto' (orjson when installed), 'orjson' or 'json'
+CHAT_JSON_ENCODER = config('CHAT_JSON_ENCODER', default='auto')
+
+# Process-level cache of authenticated users behind JWT auth (REST and WebSocket)
+AUTH_PRINCIPAL_CACHE_SIZE = config('AUTH_PRINCIPAL_CACHE_SIZE', default=10000, cast=int)
+AUTH_PRINCIPAL_CACHE_TTL = config('AUTH_PRINCIPAL_CACHE_TTL', default=30, cast=int)
+
+# Process-level cache of chat author cards (id, username, avatar)
+AUTHOR_CARD_CACHE_SIZE = config('AUTHOR_CARD_CACHE_SIZE', default=10000, cast=int)
+AUTHOR_CARD_CACHE_TTL = config('AUTHOR_CARD_CACHE_TTL', default=300, cast=int)
+
+# Process-level cache of drink options (defaults and per-user custom drinks)
+DRINK_CACHE_SIZE = config('DRINK_CACHE_SIZE', default=10000, cast=int)
+DRINK_CACHE_TTL = config('DRINK_CACHE_TTL', default=300, cast=int)
+
+# Maximum records accepted by one batch ingestion request
+ACTIVITY_BATCH_MAX_RECORDS = config('ACTIVITY_BATCH_MAX_RECORDS', default=500, cast=int)
+
+# Buckets per game score / time histogram used for percentile placement
+GAME_HISTOGRAM_BUCKETS = config('GAME_HISTOGRAM_BUCKETS', default=100, cast=int)
+
+# Side of the square avatars are cropped and scaled to after upload (pixels)
+AVATAR_SIZE = config('AVATAR_SIZE', default=256, cast=int)
+
 # Celery Configuration
+# Run tasks inline in the calling process, without a broker (local development, tests);
+# results then stay in process memory unless CELERY_RESULT_BACKEND is set
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)
 CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/1')
-CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND', default='redis://localhost:6379/2')
+CELERY_RESULT_BACKEND = config(
+    'CELERY_RESULT_BACKEND',
+    default='cache+memory://' if CELERY_TASK_ALWAYS_EAGER else 'redis://localhost:6379/2'
+)
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_TASK_STORE_EAGER_RESULT = True
+# Tasks are idempotent, so a message is acknowledged only once its task finished
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_ROUTES = {
+    'apps.chat.tasks.*': {'queue': 'realtime'},
+    'apps.activities.tasks.export_*': {'queue': 'exports'},
+    'apps.users.tasks.*': {'queue': 'media'},
+    'apps.activities.tasks.*': {'queue': 'maintenance'},
+    'apps.games.tasks.*': {'queue': 'maintenance'},
+}
+CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    'expire-presence': {
+        'task': 'apps.chat.tasks.expire_presence',
+        'schedule': PRESENCE_TTL,
+    },
+    'rebuild-recent-daily-metrics': {
+        'task': 'apps.activities.tasks.rebuild_daily_metrics',
+        'schedule': crontab(hour=3, minute=30),
+        'kwargs': {'days': 2},
+    },
+    'rebuild-leaderboards': {
+        'task': 'apps.games.tasks.rebuild_leaderboards',
+        'schedule': crontab(hour=4, minute=0),
+    },
+    'rebuild-game-histograms': {
+        'task': 'apps.games.tasks.rebuild_game_histograms',
+        'schedule': crontab(minute=5),
+    },
+}
+
+# Logging: records are queued and written by a background thread (wellness_hub.log_pipeline).
+# The file holds JSON lines and rotates at LOG_FILE_MAX_BYTES or every LOG_FILE_ROTATE_INTERVAL
+# seconds (0 disables); records beyond LOG_QUEUE_SIZE pending are dropped and counted.
+# LOG_SAMPLING keeps a share of the sub-WARNING records of chatty loggers, e.g.
+# "django.channels.server=0.1,apps.chat=0.5".
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+LOG_FILE = config('LOG_FILE', default=str(BASE_DIR / 'logs' / 'django.log'))
+LOG_FILE_MAX_BYTES = config('LOG_FILE_MAX_BYTES', default=50 * 1024 * 1024, cast=int)
+LOG_FILE_ROTATE_INTERVAL = config('LOG_FILE_ROTATE_INTERVAL', default=60 * 60 * 24, cast=int)
+LOG_FILE_BACKUPS = config('LOG_FILE_BACKUPS', default=7, cast=int)
+LOG_QUEUE_SIZE = config('LOG_QUEUE_SIZE', default=10000, cast=int)
+LOG_SAMPLING = config(
+    'LOG_SAMPLING',
+    default='django.channels.server=0.1',
+    cast=lambda v: {name.strip(): float(rate) for name, rate in (item.split('=') for item in v.split(',') if item.strip())}
+)
 
-# Logging
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
-    'formatters': {
-        'verbose': {
-            'format': '{levelname} {asctime} {module} {process:d} {thread:d} {message}',
-            'style': '{',
-        },
-    },
     'handlers': {
-        'file': {
-            'level': 'INFO',
-            'class': 'logging.FileHandler',
-            'filename': BASE_DIR / 'logs/django.log',
-            'formatter': 'verbose',
-        },
-        'console': {
-            'level': 'INFO',
-            'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+        'queue': {
+            '()': 'wellness_hub.log_pipeline.queued_handler',
+            'filename': LOG_FILE,
+            'max_bytes': LOG_FILE_MAX_BYTES,
+            'interval': LOG_FILE_ROTATE_INTERVAL,
+            'backup_count': LOG_FILE_BACKUPS,
+            'queue_size': LOG_QUEUE_SIZE,
+            'sampling': LOG_SAMPLING,
+            'console_level': LOG_LEVEL,
+            'file_level': LOG_LEVEL,
+            'console_format': '{levelname} {asctime} {module} {process:d} {thread:d} {message}',
         },
     },
     'root': {
-        'handlers': ['console', 'file'],
-        'level': 'INFO',
+        'handlers': ['queue'],
+        'level': LOG_LEVEL,
     },
 }
-
-# Create logs directory if it doesn't exist
-os.makedirs(BASE_DIR / 'logs', exist_ok=True)
@@ -0,0 +1,17 @@
+"""Test runner serving the application Redis client from fakeredis."""
+
+import fakeredis
+from django.test.runner import DiscoverRunner
+
+from wellness_hub import redis_client
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._redis_client = redis_client._client
+        redis_client._client = fakeredis.FakeRedis(decode_responses=True)
+
+    def teardown_test_environment(self, **kwargs):
+        redis_client._client = self._redis_client
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,41 @@
+"""
+Settings for the test suite: ``python manage.py test --settings=wellness_hub.test_settings``.
+
+Runs without PostgreSQL, Redis or a Celery broker. The database is SQLite, the
+cache and the channel layer live in memory, the application Redis client is
+replaced by fakeredis (see wellness_hub.test_runner; install
+requirements-dev.txt) and Celery tasks run eagerly with in-memory results.
+"""
+
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    }
+}
+
+CELERY_TASK_ALWAYS_EAGER = True
+CELERY_BROKER_URL = 'memory://'
+CELERY_RESULT_BACKEND = 'cache+memory://'
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='wellness-test-media-')
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+TEST_RUNNER = 'wellness_hub.test_runner.TestRunner'
@@ -3,6 +3,9 @@
 
 // Store token for API requests
 let authToken: string | null = null
+let refreshToken: string | null = null
+let refreshing: Promise<boolean> | null = null
+let tokensRefreshed: ((token: string, refreshToken: string) => void) | null = null
 
 export const api = {
   // Base API configuration
@@ -16,10 +19,46 @@ export const api = {
   // Clear authentication token
   clearAuthToken() {
     authToken = null
+    refreshToken = null
+  },
+
+  // Set the refresh token used to renew expired access tokens
+  setRefreshToken(token: string | null) {
+    refreshToken = token
+  },
+
+  // Called with the new token pair after a successful refresh
+  onTokensRefreshed(handler: (token: string, refreshToken: string) => void) {
+    tokensRefreshed = handler
+  },
+
+  // Exchange the refresh token for a new token pair; concurrent callers share one request
+  refreshAccessToken(): Promise<boolean> {
+    if (!refreshToken) return Promise.resolve(false)
+    if (!refreshing) {
+      refreshing = fetch(`${this.baseURL}/auth/refresh/`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ refresh_token: refreshToken }),
+      })
+        .then(async response => {
+          if (!response.ok) return false
+          const data = await response.json()
+          authToken = data.token
+          refreshToken = data.refresh_token
+          tokensRefreshed?.(data.token, data.refresh_token)
+          return true
+        })
+        .catch(() => false)
+        .finally(() => {
+          refreshing = null
+        })
+    }
+    return refreshing
   },
 
   // Generic request method
-  async request(endpoint: string, options: RequestInit = {}) {
+  async request(endpoint: string, options: RequestInit = {}, retried = false): Promise<any> {
     const url = `${this.baseURL}${endpoint}`
     const headers: Record<string, string> = {
       'Content-Type': 'application/json',
@@ -39,6 +78,11 @@ export const api = {
     try {
       const response = await fetch(url, config)
 
+      // Access tokens are short-lived: renew once and replay the request
+      if (response.status === 401 && !retried && refreshToken && await this.refreshAccessToken()) {
+        return this.request(endpoint, options, true)
+      }
+
       if (!response.ok) {
         let errorMessage = `HTTP error! status: ${response.status}`
         try {
@@ -118,6 +162,13 @@ export const activityApi = {
   createActivity: (data: any) => api.post('/activities', data),
   updateActivity: (id: string, data: any) => api.put(`/activities/${id}`, data),
   deleteActivity: (id: string) => api.delete(`/activities/${id}`),
+  // Replay records created offline; `key` is a client-generated id so resubmits are deduplicated
+  ingestRecords: (records: { key: string; type: 'water' | 'bowel' | 'smoking' | 'slack'; data: any }[]) =>
+    api.post('/activities/batch/', { records }),
+  // Queue an NDJSON export; poll getExport until status is SUCCESS, then download `url`
+  createExport: (data: { type: 'activities' | 'water' | 'bowel' | 'smoking' | 'slack'; start?: string; end?: string }) =>
+    api.post('/activities/exports/', data),
+  getExport: (id: string) => api.get(`/activities/exports/${id}/`),
 }
 
 export const chatApi = {
@@ -125,14 +176,21 @@ export const chatApi = {
   sendMessage: (roomId: string, message: any) => api.post(`/chat/rooms/${roomId}/messages`, message),
   getRooms: () => api.get('/chat/rooms'),
   getDefaultRoom: () => api.get('/chat/rooms/default/'),
-  getDefaultMessages: (params: { page?: number; page_size?: number } = {}) => {
+  getDefaultMessages: (
+    params: { before?: number; after?: number; around?: number; page_size?: number } = {}
+  ) => {
     const query = new URLSearchParams()
-    if (params.page) query.append('page', String(params.page))
+    if (params.before) query.append('before', String(params.before))
+    if (params.after) query.append('after', String(params.after))
+    if (params.around) query.append('around', String(params.around))
     if (params.page_size) query.append('page_size', String(params.page_size))
     const suffix = query.toString() ? `?${query.toString()}` : ''
     return api.get(`/chat/rooms/default/messages/${suffix}`)
   },
   postDefaultMessage: (payload: { content: string; message_type?: string }) =>
     api.post('/chat/rooms/default/messages/', payload),
+  markRead: (roomId: number, messageId?: number) =>
+    api.post(`/chat/rooms/${roomId}/read/`, messageId ? { message_id: messageId } : {}),
+  getUnreadCounts: () => api.get('/chat/unread/'),
   getOnlineUsers: () => api.get('/chat/online/'),
 }
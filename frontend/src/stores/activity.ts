@@ -21,12 +21,12 @@ export const useActivityStore = defineStore('activity', () => {
 
   const fetchSmokingRecords = async () => {
     const data = await api.get('/activities/smoking/')
-    smokingRecords.value = data
+    smokingRecords.value = Array.isArray(data) ? data : data.results || []
   }
 
   const fetchSlackRecords = async () => {
     const data = await api.get('/activities/slack/')
-    slackRecords.value = data
+    slackRecords.value = Array.isArray(data) ? data : data.results || []
   }
 
   const createSmokingRecord = async (payload: { count: number; mood?: string | null; notes?: string | null }) => {
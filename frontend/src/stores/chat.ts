@@ -1,10 +1,17 @@
 import { defineStore } from 'pinia'
 import { ref, computed, watch } from 'vue'
-import type { ChatMessage, ChatPresence } from '@/types/chat'
-import { chatApi } from '@/api'
+import type { ChatMessage, ChatPresence, ChatTypingUser } from '@/types/chat'
+import { api, chatApi } from '@/api'
 import { useUserStore } from '@/stores/user'
 
 const MAX_MESSAGES = 200
+// Must stay well under the server's PRESENCE_TTL, after which a silent socket is closed
+const HEARTBEAT_INTERVAL = 20000
+// Re-send is_typing while the user keeps typing, well inside the server's CHAT_TYPING_TTL
+const TYPING_RESEND_INTERVAL = 2500
+// Stop announcing after this long without a keystroke
+const TYPING_IDLE_TIMEOUT = 4000
+const TYPING_PRUNE_INTERVAL = 1000
 
 const buildWsUrl = (path: string, token?: string | null) => {
   const base = import.meta.env.VITE_WS_URL || window.location.origin.replace(/^http/, 'ws')
@@ -33,6 +40,7 @@ export const useChatStore = defineStore('chat', () => {
   const room = ref<{ id: number; name: string } | null>(null)
   const messages = ref<ChatMessage[]>([])
   const onlineUsers = ref<ChatPresence[]>([])
+  const typingUsers = ref<ChatTypingUser[]>([])
   const connecting = ref(false)
   const presenceConnecting = ref(false)
   const error = ref<string | null>(null)
@@ -41,6 +49,13 @@ export const useChatStore = defineStore('chat', () => {
   let presenceSocket: WebSocket | null = null
   let reconnectTimer: number | null = null
   let presenceReconnectTimer: number | null = null
+  let heartbeatTimer: number | null = null
+  // Last presence version applied; reconnects and resyncs ask only for what came after it
+  let presenceVersion: number | null = null
+  let presenceResyncing = false
+  let typingSentAt = 0
+  let typingIdleTimer: number | null = null
+  let typingPruneTimer: number | null = null
 
   const sortMessages = () => {
     messages.value = [...messages.value]
@@ -79,11 +94,43 @@ export const useChatStore = defineStore('chat', () => {
     prependHistory(normalized)
   }
 
+  const pruneTyping = () => {
+    const now = Date.now()
+    typingUsers.value = typingUsers.value.filter(user => user.expiresAt > now)
+    if (!typingUsers.value.length && typingPruneTimer) {
+      clearInterval(typingPruneTimer)
+      typingPruneTimer = null
+    }
+  }
+
+  // Each frame covers the typists of one server worker: drop the ids that stopped,
+  // refresh the listed users, and let everyone else run out on their own expiry
+  const applyTyping = (payload: any) => {
+    if (room.value && payload.room_id !== room.value.id) return
+    const expiresAt = Date.now() + payload.ttl * 1000
+    const listed = new Map<number, ChatTypingUser>(
+      payload.users
+        .filter((user: any) => user.id !== userStore.user?.id)
+        .map((user: any) => [user.id, { id: user.id, username: user.username, expiresAt }])
+    )
+    typingUsers.value = [
+      ...typingUsers.value.filter(user => !payload.stopped.includes(user.id) && !listed.has(user.id)),
+      ...listed.values()
+    ]
+    if (typingUsers.value.length && !typingPruneTimer) {
+      typingPruneTimer = window.setInterval(pruneTyping, TYPING_PRUNE_INTERVAL)
+    }
+  }
+
   const handleChatMessage = (event: MessageEvent) => {
     const payload = JSON.parse(event.data)
     switch (payload.type) {
       case 'chat_message':
         appendMessage(normalizeMessage(payload.message))
+        typingUsers.value = typingUsers.value.filter(user => user.id !== payload.message.user?.id)
+        break
+      case 'typing':
+        applyTyping(payload)
         break
       case 'system_event':
         appendMessage(normalizeMessage({
@@ -102,19 +149,68 @@ export const useChatStore = defineStore('chat', () => {
     }
   }
 
-  const handlePresenceMessage = (event: MessageEvent) => {
-    const payload = JSON.parse(event.data)
+  const applyTransition = (payload: any) => {
+    if (payload.type === 'user_online') {
+      const existing = onlineUsers.value.filter(user => user.id !== payload.user.id)
+      onlineUsers.value = [...existing, payload.user]
+    } else if (payload.type === 'user_offline') {
+      onlineUsers.value = onlineUsers.value.filter(user => user.id !== payload.user_id)
+    }
+  }
+
+  const requestPresenceResync = () => {
+    if (presenceResyncing || !presenceSocket || presenceSocket.readyState !== WebSocket.OPEN) return
+    presenceResyncing = true
+    presenceSocket.send(JSON.stringify({ type: 'resync', since: presenceVersion }))
+  }
+
+  // Broadcast transitions are applied strictly in version order; a gap means one was
+  // missed (or is still in flight from another worker), so the server replays them
+  const applyVersionedTransition = (payload: any) => {
+    if (presenceVersion === null || payload.version <= presenceVersion) return
+    if (payload.version > presenceVersion + 1) {
+      requestPresenceResync()
+      return
+    }
+    applyTransition(payload)
+    presenceVersion = payload.version
+  }
+
+  const applyPresence = (payload: any) => {
     if (payload.type === 'online_users') {
       onlineUsers.value = payload.users
+      presenceVersion = payload.version
+      presenceResyncing = false
       return
     }
-    if (payload.type === 'user_online') {
-      const existing = onlineUsers.value.filter(user => user.id !== payload.user.id)
-      onlineUsers.value = [...existing, payload.user]
+    if (payload.type === 'online_users_delta') {
+      // Every transition after `since`, in order
+      payload.deltas
+        .filter((delta: any) => presenceVersion === null || delta.version > presenceVersion)
+        .forEach(applyTransition)
+      presenceVersion = payload.version
+      presenceResyncing = false
       return
     }
-    if (payload.type === 'user_offline') {
-      onlineUsers.value = onlineUsers.value.filter(user => user.id !== payload.user_id)
+    if (payload.type === 'online_users_batch') {
+      payload.deltas.forEach(applyVersionedTransition)
+      return
+    }
+    if (payload.type === 'user_online' || payload.type === 'user_offline') {
+      applyVersionedTransition(payload)
+    }
+  }
+
+  const handlePresenceMessage = (event: MessageEvent) => {
+    applyPresence(JSON.parse(event.data))
+  }
+
+  // Lets the server tell a live tab from a connection that silently went away
+  const sendHeartbeats = () => {
+    for (const socket of [chatSocket, presenceSocket]) {
+      if (socket && socket.readyState === WebSocket.OPEN) {
+        socket.send(JSON.stringify({ type: 'ping' }))
+      }
     }
   }
 
@@ -141,7 +237,9 @@ export const useChatStore = defineStore('chat', () => {
     if (!userStore.token) return
     if (presenceSocket && presenceSocket.readyState === WebSocket.OPEN) return
     presenceConnecting.value = true
-    presenceSocket = new WebSocket(buildWsUrl('/ws/online/', userStore.token))
+    presenceResyncing = false
+    const path = presenceVersion === null ? '/ws/online/' : `/ws/online/?since=${presenceVersion}`
+    presenceSocket = new WebSocket(buildWsUrl(path, userStore.token))
     presenceSocket.onopen = () => {
       presenceConnecting.value = false
     }
@@ -154,8 +252,10 @@ export const useChatStore = defineStore('chat', () => {
 
   const scheduleReconnect = () => {
     if (reconnectTimer) return
-    reconnectTimer = window.setTimeout(() => {
+    reconnectTimer = window.setTimeout(async () => {
       reconnectTimer = null
+      // The socket may have been refused because the access token expired
+      await api.refreshAccessToken()
       connectChatSocket()
     }, 2000)
   }
@@ -174,9 +274,13 @@ export const useChatStore = defineStore('chat', () => {
     await fetchMessages()
     connectChatSocket()
     connectPresenceSocket()
+    if (!heartbeatTimer) {
+      heartbeatTimer = window.setInterval(sendHeartbeats, HEARTBEAT_INTERVAL)
+    }
   }
 
   const dispose = () => {
+    stopTyping()
     chatSocket?.close()
     presenceSocket?.close()
     if (reconnectTimer) {
@@ -187,8 +291,18 @@ export const useChatStore = defineStore('chat', () => {
       clearTimeout(presenceReconnectTimer)
       presenceReconnectTimer = null
     }
+    if (heartbeatTimer) {
+      clearInterval(heartbeatTimer)
+      heartbeatTimer = null
+    }
+    if (typingPruneTimer) {
+      clearInterval(typingPruneTimer)
+      typingPruneTimer = null
+    }
     messages.value = []
     onlineUsers.value = []
+    typingUsers.value = []
+    presenceVersion = null
     room.value = null
   }
 
@@ -204,6 +318,33 @@ export const useChatStore = defineStore('chat', () => {
       room_id: activeRoomId.value,
       content: content.trim()
     }))
+    stopTyping()
+  }
+
+  const sendTyping = (isTyping: boolean) => {
+    if (!chatSocket || chatSocket.readyState !== WebSocket.OPEN) return
+    chatSocket.send(JSON.stringify({ type: 'typing', room_id: activeRoomId.value, is_typing: isTyping }))
+  }
+
+  const stopTyping = () => {
+    if (typingIdleTimer) {
+      clearTimeout(typingIdleTimer)
+      typingIdleTimer = null
+    }
+    if (!typingSentAt) return
+    typingSentAt = 0
+    sendTyping(false)
+  }
+
+  // Called on every keystroke; the server coalesces, so only announce every few seconds
+  const notifyTyping = () => {
+    const now = Date.now()
+    if (now - typingSentAt >= TYPING_RESEND_INTERVAL) {
+      sendTyping(true)
+      typingSentAt = now
+    }
+    if (typingIdleTimer) clearTimeout(typingIdleTimer)
+    typingIdleTimer = window.setTimeout(stopTyping, TYPING_IDLE_TIMEOUT)
   }
 
   const fetchOnlineUsers = async () => {
@@ -227,12 +368,15 @@ export const useChatStore = defineStore('chat', () => {
     room: computed(() => room.value),
     messages,
     onlineUsers,
+    typingUsers,
     connecting,
     presenceConnecting,
     error,
     initialize,
     dispose,
     sendMessage,
+    notifyTyping,
+    stopTyping,
     fetchOnlineUsers
   }
 })
@@ -58,7 +58,7 @@ export const useHydrationStore = defineStore('hydration', () => {
     loading.value = true
     try {
       const data = await api.get('/activities/water/')
-      entries.value = data
+      entries.value = Array.isArray(data) ? data : data.results || []
     } finally {
       loading.value = false
     }
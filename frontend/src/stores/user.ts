@@ -16,6 +16,7 @@ import type {
 } from '@/types/user'
 
 const TOKEN_KEY = 'yanzu-nav-token'
+const REFRESH_TOKEN_KEY = 'yanzu-nav-refresh-token'
 const PROFILE_CACHE_KEY = 'yanzu-nav-profile'
 const LOCAL_DATA_KEY = 'yanzu-nav-local-data'
 const LEGACY_USERS_KEY = 'yanzu-nav-users'
@@ -78,6 +79,7 @@ const migrateLegacyData = (target: Record<string, LocalUserData>) => {
 export const useUserStore = defineStore('user', () => {
   const profile = ref<StoredUser | null>(null)
   const token = ref<string | null>(null)
+  const refreshToken = ref<string | null>(null)
   const initialized = ref(false)
   const loading = ref(false)
   const localData = ref<Record<string, LocalUserData>>(loadLocalData())
@@ -95,11 +97,15 @@ export const useUserStore = defineStore('user', () => {
     if (typeof localStorage === 'undefined') return
     if (token.value) {
       localStorage.setItem(TOKEN_KEY, token.value)
+      if (refreshToken.value) {
+        localStorage.setItem(REFRESH_TOKEN_KEY, refreshToken.value)
+      }
       if (profile.value) {
         localStorage.setItem(PROFILE_CACHE_KEY, JSON.stringify(profile.value))
       }
     } else {
       localStorage.removeItem(TOKEN_KEY)
+      localStorage.removeItem(REFRESH_TOKEN_KEY)
       localStorage.removeItem(PROFILE_CACHE_KEY)
     }
   }
@@ -126,8 +132,21 @@ export const useUserStore = defineStore('user', () => {
     return ensureLocalSlot(profile.value.username)
   }
 
+  const setTokens = (access: string, refresh?: string | null) => {
+    token.value = access
+    refreshToken.value = refresh ?? null
+    api.setAuthToken(access)
+    api.setRefreshToken(refreshToken.value)
+  }
+
+  api.onTokensRefreshed((access, refresh) => {
+    setTokens(access, refresh)
+    persistSession()
+  })
+
   const clearSession = () => {
     token.value = null
+    refreshToken.value = null
     profile.value = null
     api.clearAuthToken()
     persistSession()
@@ -145,8 +164,7 @@ export const useUserStore = defineStore('user', () => {
     if (typeof localStorage !== 'undefined') {
       const storedToken = localStorage.getItem(TOKEN_KEY)
       if (storedToken) {
-        token.value = storedToken
-        api.setAuthToken(storedToken)
+        setTokens(storedToken, localStorage.getItem(REFRESH_TOKEN_KEY))
         try {
           await fetchProfile()
         } catch (error) {
@@ -176,8 +194,7 @@ export const useUserStore = defineStore('user', () => {
         password: credentials.password
       }
       const response = await api.post('/auth/login/', payload)
-      token.value = response.token
-      api.setAuthToken(response.token)
+      setTokens(response.token, response.refresh_token)
       ensureLocalSlot(response.user.username)
       profile.value = response.user
       persistSession()
@@ -205,8 +222,7 @@ export const useUserStore = defineStore('user', () => {
       }
 
       const response = await api.post('/auth/register/', payload)
-      token.value = response.token
-      api.setAuthToken(response.token)
+      setTokens(response.token, response.refresh_token)
       ensureLocalSlot(response.user.username)
       profile.value = response.user
       persistSession()
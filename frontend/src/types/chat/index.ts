@@ -17,6 +17,13 @@ export interface ChatPresence {
   status: 'online' | 'away'
 }
 
+export interface ChatTypingUser {
+  id: number
+  username: string
+  // Epoch ms after which the entry is dropped unless the server re-announces it
+  expiresAt: number
+}
+
 export interface ChatState {
   messages: ChatMessage[]
   onlineUsers: ChatPresence[]